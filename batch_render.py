@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+description = """
+Render the plan (graph of machines) for every combination of items,
+rates and assembling machine tiers to image files, without showing
+anything on screen. The renders are split up between a pool of worker
+processes, which each load the recipes once, and the time taken by each
+render is printed (and optionally written to a csv file).
+
+The files are named <item>_<rate>pm_m<assembling machine>.<format>
+(with _combined before the extension when -c is used).
+
+EXAMPLES
+
+# Every science pack at 30 and 60 per minute, with assembling machine twos
+./batch_render.py -r 30 60 -m 2 -o plans automation_science_pack \\
+    logistic_science_pack chemical_science_pack
+
+# Every item in the recipes file, as svg, combining the machines
+./batch_render.py -c --format svg -o plans all
+"""
+
+import argparse
+import itertools
+import os
+import time
+import sweep
+from recipe import RecipeList
+from sweep import map_with_recipes, write_columns_csv
+from planner import make_crafting_speeds, make_plan, read_inputs_file
+
+
+def make_output_path(output_folder, item, rate, assembling_machine, combine,
+                     image_format):
+    combined = "_combined" if combine else ""
+    return os.path.join(
+        output_folder,
+        f"{item}_{rate:g}pm_m{assembling_machine}{combined}.{image_format}")
+
+
+def render_job(job):
+    """
+    Make and render the plan for one job, which is a tuple (item, rate,
+    assembling_machine, combine, inputs, path), using the recipes of this
+    worker. Returns a dictionary with the job, an error message (None if it
+    worked), the number of nodes drawn and the time in seconds spent making
+    the plan, laying out the graph and drawing it.
+    """
+    # Imported here so that the plotting libraries are only loaded by the
+    # worker processes. render uses a bare matplotlib Figure (no pyplot), so
+    # the image is drawn with the non-interactive Agg (or SVG) backend.
+    from layout import cached_graphviz_layout
+    from render import save_crafting_graph
+
+    item, rate, assembling_machine, combine, inputs, path = job
+    result = {
+        "item": item,
+        "rate": rate,
+        "assembling_machine": assembling_machine,
+        "combine": combine,
+        "path": path,
+        "error": None,
+        "num_nodes": 0,
+        "plan_time": 0.0,
+        "layout_time": 0.0,
+        "render_time": 0.0,
+    }
+    try:
+        start = time.perf_counter()
+        plan = make_plan(item, rate / 60.0,
+                         make_crafting_speeds(assembling_machine),
+                         sweep.worker_recipes, inputs, combine)
+        G = plan.to_graph()
+        result["num_nodes"] = G.number_of_nodes()
+        planned = time.perf_counter()
+        result["plan_time"] = planned - start
+
+        pos = cached_graphviz_layout(G, prog="dot")
+        laid_out = time.perf_counter()
+        result["layout_time"] = laid_out - planned
+
+        save_crafting_graph(
+            G, pos,
+            f"Asemblers required to achieve {rate:g} {item} per minute", path)
+        result["render_time"] = time.perf_counter() - laid_out
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def run_batch_render(items, rates, assembling_machines, inputs, recipes,
+                     output_folder, combine=False, image_format="png",
+                     processes=None):
+    """
+    Render the plan for every combination of items, rates (items per minute)
+    and assembling_machines (tiers) to a file in output_folder, making items
+    from the list of input items. Returns the results from render_job for
+    each combination, in order.
+
+    The renders are shared between processes worker processes (the default
+    is one per CPU). If processes is 1, everything is done in this process.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    jobs = [(item, rate, assembling_machine, combine, inputs,
+             make_output_path(output_folder, item, rate, assembling_machine,
+                              combine, image_format))
+            for item, rate, assembling_machine in itertools.product(
+                items, rates, assembling_machines)]
+    return map_with_recipes(render_job, jobs, recipes, processes)
+
+
+def format_timings(results):
+    """
+    Format the timings of the results from run_batch_render as a table,
+    one line per render, followed by the totals
+    """
+    lines = [f"{'file':<50} {'nodes':>6} {'plan':>7} {'layout':>7} {'render':>7}"]
+    for result in results:
+        if result["error"] is not None:
+            lines.append(f"{result['path']:<50} error: {result['error']}")
+            continue
+        lines.append(f"{result['path']:<50} {result['num_nodes']:>6} "
+                     f"{result['plan_time']:>6.2f}s {result['layout_time']:>6.2f}s "
+                     f"{result['render_time']:>6.2f}s")
+
+    num_failed = sum(1 for result in results if result["error"] is not None)
+    total = sum(result["plan_time"] + result["layout_time"] + result["render_time"]
+                for result in results)
+    lines.append(f"Rendered {len(results) - num_failed} plans "
+                 f"({num_failed} failed) in {total:.2f}s of worker time")
+    return "\n".join(lines)
+
+
+class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
+                      argparse.RawDescriptionHelpFormatter):
+    pass
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=CustomFormatter)
+    parser.add_argument(
+        "items",
+        nargs="+",
+        help="the items to be assembled, or all for every item with a recipe")
+    parser.add_argument("-c",
+                        "--combine-machines",
+                        help="Add up all machines making each item",
+                        action="store_true")
+    parser.add_argument("-r",
+                        "--rates",
+                        help="target item assembly rates, in items per minute",
+                        nargs="+",
+                        type=float,
+                        default=[60])
+    parser.add_argument(
+        "-m",
+        "--assembling-machines",
+        help="types of assembling machine used (0 (human); 1, 2, or 3)",
+        nargs="+",
+        choices=[0, 1, 2, 3],
+        type=int,
+        default=[1])
+    parser.add_argument("-i",
+                        "--inputs-file",
+                        help="relative path to the input items file",
+                        default="input_materials.txt")
+    parser.add_argument("-f",
+                        "--recipes-file",
+                        help="relative path to the recipes file",
+                        default="factorio_recipes.csv")
+    parser.add_argument("--format",
+                        help="image file format",
+                        choices=["png", "svg", "pdf"],
+                        default="png")
+    parser.add_argument("-p",
+                        "--processes",
+                        help="number of worker processes (default: one per CPU)",
+                        type=int)
+    parser.add_argument("-o",
+                        "--output-folder",
+                        help="folder to write the images to",
+                        default="plans")
+    parser.add_argument("-t",
+                        "--timings",
+                        help="csv file to write the time taken by each render to")
+    args = parser.parse_args()
+
+    recipes = RecipeList(args.recipes_file)
+    items = list(recipes.recipes) if args.items == ["all"] else args.items
+
+    start = time.perf_counter()
+    results = run_batch_render(items, args.rates, args.assembling_machines,
+                               read_inputs_file(args.inputs_file), recipes,
+                               args.output_folder, args.combine_machines,
+                               args.format, args.processes)
+    print(format_timings(results))
+    print(f"Wall time: {time.perf_counter() - start:.2f}s")
+
+    if args.timings is not None:
+        columns = {name: [result[name] for result in results]
+                   for name in results[0]} if results else {}
+        with open(args.timings, "w", newline="") as f:
+            write_columns_csv(columns, f)
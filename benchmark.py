@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+description = """
+Time the main operations of pyfactorio (loading the RecipeList,
+get_raw_material_counts, get_item_dependencies, CraftingTree,
+CombinedCraftingGraph and to_graph) over every item in the recipes file,
+and over generated (synthetic) recipe lists with many more items.
+
+Each synthetic recipe list is a layered graph: the items are split into
+depth + 1 layers, the bottom layer is the raw materials, and every other
+item is made from fan-out items of the layer below it. The full
+CraftingTree of an item in a synthetic list can have about fan-out^depth
+nodes, so the plain CraftingTree and get_item_dependencies are only
+timed when the tree has at most --max-tree-nodes nodes; the interned
+CraftingTree (which shares identical subtrees) is always timed.
+
+Each time is the best of --repeat runs. Save the results with --save, and
+compare a later run against them with --check, which fails (exit status
+1) if anything got more than --tolerance slower.
+
+EXAMPLES
+
+# Save a baseline
+./benchmark.py --save benchmark_baseline.json
+
+# Check for regressions against it
+./benchmark.py --check benchmark_baseline.json
+
+# Bigger and deeper synthetic recipe lists only
+./benchmark.py --no-catalog --sizes 20000 50000 --depth 20 --fan-out 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from recipe import RecipeList, CraftingTree, CombinedCraftingGraph
+from planner import make_crafting_speeds, read_inputs_file
+
+# Times shorter than this (in seconds) are too noisy to count as regressions
+min_checked_time = 0.005
+
+
+def best_time(function, repeat):
+    """
+    Run function repeat times, and return the shortest time taken (in
+    seconds)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def write_synthetic_recipes_csv(path, num_items, depth, fan_out, seed=0):
+    """
+    Write a layered recipe list (see the description) with num_items items
+    to the csv file at path. Every recipe takes 1s in an assembling machine
+    and makes one item from one of each of its ingredients. Returns a tuple
+    (raw_materials, top_items): the names of the items in the bottom and
+    top layers.
+    """
+    rng = random.Random(seed)
+    layers = [[] for _ in range(depth + 1)]
+    for n in range(num_items):
+        layers[n * (depth + 1) // num_items].append(f"item_{n}")
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["item", "resource", "quantity", "time",
+                         "num_produced", "produced_by"])
+        for level in range(1, depth + 1):
+            below = layers[level - 1]
+            for item in layers[level]:
+                for ingredient in rng.sample(below, min(fan_out, len(below))):
+                    writer.writerow([item, ingredient, 1, 1.0, 1,
+                                     "assembling_machine"])
+    return layers[0], layers[-1]
+
+
+def count_tree_nodes(recipes, item, raw_materials):
+    """
+    Count the nodes in the full CraftingTree of item, without building it
+    """
+    num_nodes = {}
+    for current in recipes.get_topological_order(item, raw_materials):
+        if current in raw_materials and current != item:
+            num_nodes[current] = 1
+        else:
+            num_nodes[current] = 1 + sum(
+                num_nodes[ingredient]
+                for ingredient in recipes.get_recipe(current).ingredients)
+    return num_nodes[item]
+
+
+def time_operations(recipes_file, items, raw_materials, repeat,
+                    max_tree_nodes=None):
+    """
+    Time each operation over all of items, using the recipes in
+    recipes_file. Returns a dictionary mapping operation names to times (in
+    seconds).
+    """
+    crafting_speeds = make_crafting_speeds(1)
+    times = {}
+
+    # Loading the csv (the cache is removed first), and loading the cache
+    cache_path = recipes_file + ".cache"
+
+    def load_csv():
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        RecipeList(recipes_file)
+
+    times["load_csv"] = best_time(load_csv, repeat)
+    times["load_cache"] = best_time(lambda: RecipeList(recipes_file), repeat)
+    recipes = RecipeList(recipes_file)
+
+    def raw_material_counts():
+        recipes.raw_material_cache.clear()
+        for item in items:
+            recipes.get_raw_material_counts(item, raw_materials)
+
+    times["get_raw_material_counts"] = best_time(raw_material_counts, repeat)
+
+    if max_tree_nodes is None:
+        tree_items = items
+    else:
+        tree_items = [item for item in items
+                      if count_tree_nodes(recipes, item, raw_materials) <= max_tree_nodes]
+    times["num_tree_items"] = len(tree_items)
+
+    times["get_item_dependencies"] = best_time(
+        lambda: [recipes.get_item_dependencies(item, raw_materials)
+                 for item in tree_items], repeat)
+    times["crafting_tree"] = best_time(
+        lambda: [CraftingTree(item, 1, crafting_speeds, recipes, raw_materials)
+                 for item in tree_items], repeat)
+    times["interned_crafting_tree"] = best_time(
+        lambda: [CraftingTree(item, 1, crafting_speeds, recipes, raw_materials,
+                              interned=True)
+                 for item in items], repeat)
+    times["combined_graph"] = best_time(
+        lambda: [CombinedCraftingGraph.from_recipes(item, 1, crafting_speeds,
+                                                    recipes, raw_materials)
+                 for item in items], repeat)
+
+    trees = [CraftingTree(item, 1, crafting_speeds, recipes, raw_materials)
+             for item in tree_items]
+    graphs = [CombinedCraftingGraph.from_recipes(item, 1, crafting_speeds,
+                                                 recipes, raw_materials)
+              for item in items]
+    times["crafting_tree_to_graph"] = best_time(
+        lambda: [tree.to_graph() for tree in trees], repeat)
+    times["combined_graph_to_graph"] = best_time(
+        lambda: [graph.to_graph() for graph in graphs], repeat)
+    return times
+
+
+def run_catalog_benchmark(recipes_file, inputs_file, repeat):
+    """
+    Time the operations for every item in recipes_file that can be made
+    from the items in inputs_file
+    """
+    raw_materials = read_inputs_file(inputs_file)
+    recipes = RecipeList(recipes_file)
+    items = sorted(recipes.compile().get_raw_material_counts(raw_materials))
+
+    # Work on a copy of the recipes file, so that its cache is not removed
+    with tempfile.TemporaryDirectory() as folder:
+        copy_path = os.path.join(folder, os.path.basename(recipes_file))
+        with open(recipes_file, "rb") as source, open(copy_path, "wb") as copy:
+            copy.write(source.read())
+        return time_operations(copy_path, items, raw_materials, repeat)
+
+
+def run_synthetic_benchmark(num_items, depth, fan_out, num_targets, repeat,
+                            max_tree_nodes, seed=0):
+    """
+    Time the operations for num_targets items from the top layer of a
+    synthetic recipe list
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        recipes_file = os.path.join(folder, "recipes.csv")
+        raw_materials, top_items = write_synthetic_recipes_csv(
+            recipes_file, num_items, depth, fan_out, seed)
+        items = top_items[:num_targets]
+        return time_operations(recipes_file, items, raw_materials, repeat,
+                               max_tree_nodes)
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compare results with baseline (both dictionaries mapping benchmark
+    names to dictionaries of times), and return a list of messages, one for
+    each time that is more than tolerance (a fraction) slower than the
+    baseline. Very short times, and benchmarks that are not in both, are
+    ignored.
+    """
+    regressions = []
+    for name, times in results.items():
+        for operation, seconds in times.items():
+            if operation.startswith("num_"):
+                continue
+            baseline_seconds = baseline.get(name, {}).get(operation)
+            if baseline_seconds is None or seconds < min_checked_time:
+                continue
+            if seconds > baseline_seconds * (1 + tolerance):
+                regressions.append(
+                    f"{name} {operation}: {seconds:.4f}s "
+                    f"(baseline {baseline_seconds:.4f}s)")
+    return regressions
+
+
+def format_results(results):
+    lines = []
+    for name, times in results.items():
+        lines.append(name)
+        for operation, seconds in times.items():
+            if operation.startswith("num_"):
+                lines.append(f"  {operation:<30} {seconds:>10}")
+            else:
+                lines.append(f"  {operation:<30} {seconds:>9.4f}s")
+    return "\n".join(lines)
+
+
+class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
+                      argparse.RawDescriptionHelpFormatter):
+    pass
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=CustomFormatter)
+    parser.add_argument("-f",
+                        "--recipes-file",
+                        help="relative path to the recipes file",
+                        default="factorio_recipes.csv")
+    parser.add_argument("-i",
+                        "--inputs-file",
+                        help="relative path to the input items file",
+                        default="input_materials.txt")
+    parser.add_argument("--no-catalog",
+                        help="skip the benchmark over the recipes file",
+                        action="store_true")
+    parser.add_argument("--sizes",
+                        help="numbers of items in the synthetic recipe lists",
+                        nargs="*",
+                        type=int,
+                        default=[1000, 10000, 50000])
+    parser.add_argument("--depth",
+                        help="number of layers above the raw materials in the "
+                        "synthetic recipe lists",
+                        type=int,
+                        default=8)
+    parser.add_argument("--fan-out",
+                        help="number of ingredients of each synthetic recipe",
+                        type=int,
+                        default=3)
+    parser.add_argument("--targets",
+                        help="number of top-layer items timed in each synthetic "
+                        "recipe list",
+                        type=int,
+                        default=10)
+    parser.add_argument("--max-tree-nodes",
+                        help="largest synthetic CraftingTree built without interning",
+                        type=int,
+                        default=100000)
+    parser.add_argument("--seed",
+                        help="random seed for the synthetic recipe lists",
+                        type=int,
+                        default=0)
+    parser.add_argument("--repeat",
+                        help="number of times each operation is run (the best "
+                        "time is kept)",
+                        type=int,
+                        default=3)
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument("--check",
+                        help="compare the results with this JSON file (from "
+                        "--save), and fail if anything is slower")
+    parser.add_argument("--tolerance",
+                        help="fraction by which a time can exceed the baseline "
+                        "before it counts as a regression",
+                        type=float,
+                        default=0.25)
+    args = parser.parse_args()
+
+    results = {}
+    if not args.no_catalog:
+        results["catalog"] = run_catalog_benchmark(args.recipes_file,
+                                                   args.inputs_file,
+                                                   args.repeat)
+    for num_items in args.sizes:
+        name = f"synthetic_{num_items}_depth_{args.depth}_fan_out_{args.fan_out}"
+        results[name] = run_synthetic_benchmark(num_items, args.depth,
+                                                args.fan_out, args.targets,
+                                                args.repeat,
+                                                args.max_tree_nodes, args.seed)
+    print(format_results(results))
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.check is not None:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("Slower than the baseline:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,463 @@
+import numpy as np
+from scipy.sparse import csr_matrix, diags, identity
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve, spsolve_triangular
+
+# Compiled (array) form of a RecipeList, for computing things about every
+# item in the recipes list at once.
+
+
+def reachable(edges, start):
+    """
+    Get a boolean array of the nodes that can be reached from the nodes in
+    start (a boolean array) by following the edges (a sparse matrix, where
+    edges[i, j] is nonzero if there is an edge from j to i), including the
+    start nodes themselves
+    """
+    reached = start.copy()
+    frontier = start
+    while frontier.any():
+        frontier = (edges @ frontier.astype(float) > 0) & ~reached
+        reached |= frontier
+    return reached
+
+
+def propagate_bits(neighbours, order):
+    """
+    Get the transitive closure of a graph as bitsets: bit j of result[i] is
+    set if j can be reached from i by following neighbours (a list of lists
+    of node indices). If order is given, every node must come after all of
+    its neighbours in it, and one pass is enough; otherwise (e.g. if the
+    graph has cycles), passes are made until nothing changes.
+    """
+    bits = [0] * len(neighbours)
+    passes = range(len(neighbours)) if order is None else order
+    while True:
+        changed = False
+        for i in passes:
+            reached = 0
+            for j in neighbours[i]:
+                reached |= bits[j] | (1 << j)
+            if reached != bits[i]:
+                bits[i] = reached
+                changed = True
+        if order is not None or not changed:
+            return bits
+
+
+class CompiledRecipes:
+    """
+    A RecipeList compiled to arrays. Every item that appears in the recipes
+    list (either as a recipe or as an ingredient) is given an integer index,
+    and the recipes are stored as a sparse ingredient matrix.
+
+    A CompiledRecipes has the following attributes:
+    - items: list of all the item names, sorted (item i has index i)
+    - index: dictionary mapping item names to their index
+    - has_recipe: boolean array, true if the item has a recipe
+    - time: array of recipe times (0 for items with no recipe)
+    - num_produced: array of the number of items made by one run of the recipe
+      (1 for items with no recipe)
+    - produced_by: list of the machine class making each item (None for items
+      with no recipe)
+    - ingredient_matrix: CSR matrix A, where A[i, j] is the number of item j
+      required to make one item i (i.e. normalised by num_produced)
+    - order: array of item indices in topological order (every item comes
+      after all of its ingredients), or None if the recipes contain a cycle
+      (then only solve_steady_state can be used)
+
+    Dependency queries (get_consumers, depends_on, get_all_ingredients and
+    get_affected_items) use the where-used index and bitsets from
+    build_dependency_index.
+    """
+
+    def __init__(self, recipes):
+        items = set(recipes.recipes)
+        for recipe in recipes.recipes.values():
+            items.update(recipe.ingredients)
+        self.items = sorted(items)
+        self.index = {item: n for n, item in enumerate(self.items)}
+
+        num_items = len(self.items)
+        self.has_recipe = np.zeros(num_items, dtype=bool)
+        self.time = np.zeros(num_items)
+        self.num_produced = np.ones(num_items)
+        self.produced_by = [None] * num_items
+
+        rows = []
+        columns = []
+        quantities = []
+        for item, recipe in recipes.recipes.items():
+            i = self.index[item]
+            self.has_recipe[i] = True
+            self.time[i] = recipe.time
+            self.num_produced[i] = recipe.num_produced
+            self.produced_by[i] = recipe.produced_by
+            for ingredient, num_required in recipe.ingredients.items():
+                rows.append(i)
+                columns.append(self.index[ingredient])
+                quantities.append(num_required / recipe.num_produced)
+
+        self.ingredient_matrix = csr_matrix((quantities, (rows, columns)),
+                                            shape=(num_items, num_items))
+
+        try:
+            self.order = self.topological_order()
+        except ValueError:
+            self.order = None
+
+        # Solutions of raw_material_matrix, keyed on the frozen set
+        # of raw materials
+        self.raw_material_cache = {}
+
+        # Where-used index and transitive dependency bitsets (see
+        # build_dependency_index), built the first time they are needed
+        self.used_by = None
+        self.dependency_bits = None
+        self.consumer_bits = None
+
+    def topological_order(self):
+        """
+        Sort the item indices so that every item comes after all of its
+        ingredients. The items are taken off one level at a time (first all
+        the items with no ingredients, then all the items whose ingredients
+        have all been taken, etc.). Raises a ValueError if the recipes
+        contain a cycle.
+        """
+        remaining = np.diff(self.ingredient_matrix.indptr)
+        consumers = self.ingredient_matrix.T.tocsr()
+
+        order = []
+        level = np.flatnonzero(remaining == 0)
+        while len(level) > 0:
+            order.append(level)
+            used_by = np.concatenate([
+                consumers.indices[consumers.indptr[i]:consumers.indptr[i + 1]]
+                for i in level
+            ])
+            np.subtract.at(remaining, used_by, 1)
+            level = np.unique(used_by[remaining[used_by] == 0])
+
+        order = np.concatenate(order)
+        if len(order) < len(self.items):
+            raise ValueError("The recipes list contains a cycle")
+        return order
+
+    def build_dependency_index(self):
+        """
+        Build the where-used index and the transitive closure of the recipe
+        graph (if they have not been built already):
+        - used_by: dictionary mapping each item to the list of items whose
+          recipes use it directly
+        - dependency_bits: list of ints, where bit j of dependency_bits[i] is
+          set if item j is needed (directly or indirectly) to make item i
+        - consumer_bits: list of ints, where bit i of consumer_bits[j] is set
+          if item j is needed (directly or indirectly) to make item i
+
+        The bitsets take about n^2/4 bytes for n items. Raw materials are not
+        treated specially: the closure follows every recipe.
+        """
+        if self.dependency_bits is not None:
+            return
+
+        num_items = len(self.items)
+        matrix = self.ingredient_matrix
+        consumers = matrix.T.tocsr()
+        ingredient_lists = [matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]].tolist()
+                            for i in range(num_items)]
+        consumer_lists = [consumers.indices[consumers.indptr[j]:consumers.indptr[j + 1]].tolist()
+                          for j in range(num_items)]
+        self.used_by = {
+            self.items[j]: [self.items[i] for i in consumer_lists[j]]
+            for j in range(num_items)
+        }
+
+        self.dependency_bits = propagate_bits(ingredient_lists, self.order)
+        self.consumer_bits = propagate_bits(
+            consumer_lists, None if self.order is None else self.order[::-1])
+
+    def items_from_bits(self, bits):
+        """
+        Get the names of the items whose bits are set in bits (in index order)
+        """
+        names = []
+        while bits:
+            lowest = bits & -bits
+            names.append(self.items[lowest.bit_length() - 1])
+            bits ^= lowest
+        return names
+
+    def get_consumers(self, item):
+        """
+        Get the items whose recipes use item directly
+        """
+        self.build_dependency_index()
+        return self.used_by[item]
+
+    def depends_on(self, item, ingredient):
+        """
+        Check whether ingredient is needed (directly or indirectly) to make item
+        """
+        self.build_dependency_index()
+        return bool(self.dependency_bits[self.index[item]] >> self.index[ingredient] & 1)
+
+    def get_all_ingredients(self, item):
+        """
+        Get every item needed (directly or indirectly) to make item
+        """
+        self.build_dependency_index()
+        return self.items_from_bits(self.dependency_bits[self.index[item]])
+
+    def get_affected_items(self, item):
+        """
+        Get every item that needs item (directly or indirectly), i.e. all the
+        items whose production is affected if item runs short
+        """
+        self.build_dependency_index()
+        return self.items_from_bits(self.consumer_bits[self.index[item]])
+
+    def get_output_per_run(self, productivity):
+        """
+        Get an array of the number of items made by each recipe run, per
+        item in the recipe (1 + the productivity bonus of the item, from the
+        productivity dictionary)
+        """
+        output_per_run = np.ones(len(self.items))
+        for item, bonus in productivity.items():
+            if item in self.index:
+                output_per_run[self.index[item]] += bonus
+        return output_per_run
+
+    def raw_material_matrix(self, raw_materials, productivity=None):
+        """
+        Get the raw materials required to make one of every item, in terms
+        of the raw_materials list. Returns a tuple (raw_materials, R), where
+        raw_materials is the list of raw materials (the ones that appear in
+        the recipes, sorted) and R[i, r] is the number of raw material r
+        needed to make one item i.
+
+        All the items are solved at once, as the linear system (I - A)R = B,
+        where A is the ingredient matrix with the rows of the raw materials
+        removed (raw materials are not assembled) and B picks out the raw
+        materials. In topological order, (I - A) is lower triangular, so
+        this is a single forward substitution. Items that depend on something which is neither a raw
+        material nor has a recipe have a row of NaN.
+
+        productivity maps items to productivity bonuses (like in
+        CraftingTree); the row of A of an item with a bonus p is divided by
+        1 + p.
+        """
+        raw_materials = frozenset(raw_materials)
+        productivity = productivity or {}
+        key = (raw_materials, frozenset(productivity.items()))
+        if key in self.raw_material_cache:
+            return self.raw_material_cache[key]
+        if self.order is None:
+            raise ValueError(
+                "The recipes list contains a cycle (use solve_steady_state)")
+
+        is_raw = np.array([item in raw_materials for item in self.items],
+                          dtype=bool)
+        raw_indices = np.flatnonzero(is_raw)
+
+        # Items that cannot be made from the raw materials are solved
+        # for as well, so that anything which depends on them can be found
+        missing_indices = np.flatnonzero(~is_raw & ~self.has_recipe)
+        leaf_indices = np.concatenate([raw_indices, missing_indices])
+
+        num_items = len(self.items)
+        expanded = diags((~is_raw) / self.get_output_per_run(productivity))
+        system = identity(num_items) - expanded @ self.ingredient_matrix
+        leaves = np.zeros((num_items, len(leaf_indices)))
+        leaves[leaf_indices, np.arange(len(leaf_indices))] = 1
+
+        order = self.order
+        system = system.tocsr()[order][:, order]
+        solution = np.empty_like(leaves)
+        solution[order] = spsolve_triangular(system,
+                                             leaves[order],
+                                             lower=True,
+                                             unit_diagonal=True)
+        counts = solution[:, :len(raw_indices)]
+        incomplete = solution[:, len(raw_indices):].any(axis=1)
+        counts[incomplete, :] = np.nan
+
+        result = ([self.items[i] for i in raw_indices], counts)
+        self.raw_material_cache[key] = result
+        return result
+
+    def get_raw_material_counts(self, raw_materials):
+        """
+        Get the raw material counts (like RecipeList.get_raw_material_counts)
+        for every item that has a recipe, from a single solve. Returns a
+        dictionary mapping item names to dictionaries of raw material counts.
+        Items that cannot be made from the raw materials are left out, and
+        raw materials count as one of themselves (they are not expanded, even
+        if they have a recipe).
+        """
+        raw_material_names, counts = self.raw_material_matrix(raw_materials)
+        all_counts = {}
+        for i in np.flatnonzero(self.has_recipe):
+            row = counts[i]
+            if np.isnan(row).any():
+                continue
+            all_counts[self.items[i]] = {
+                raw_material_names[r]: float(row[r])
+                for r in np.flatnonzero(row)
+            }
+        return all_counts
+
+    def max_output_rates(self, supply, raw_materials, productivity=None):
+        """
+        Get the highest throughput of every item with a recipe that can be
+        made from supply (like RecipeList.max_output_rate), from a single
+        raw_material_matrix solve. Returns a dictionary mapping item names
+        to tuples (rate, limiting_input). Items that cannot be made from the
+        raw materials are left out.
+
+        Like RecipeList.get_raw_material_counts, the recipe of the item
+        itself is always used, even when it is one of the raw materials (so
+        steel_plate is made from iron_plate rather than from the supply of
+        steel_plate). Every item in supply is treated as a raw material, as
+        in RecipeList.max_output_rate. productivity maps items to
+        productivity bonuses (see raw_material_matrix).
+        """
+        productivity = productivity or {}
+        raw_materials = frozenset(raw_materials) | frozenset(supply)
+        raw_material_names, counts = self.raw_material_matrix(raw_materials,
+                                                               productivity)
+        if len(raw_material_names) == 0:
+            return {self.items[i]: (float("inf"), None)
+                    for i in np.flatnonzero(self.has_recipe)}
+
+        # One step of the recipes, from the counts of the ingredients. This
+        # only changes the rows of the raw materials that have recipes.
+        counts = diags(1 / self.get_output_per_run(productivity)) @ (
+            self.ingredient_matrix @ counts)
+        available = np.array([supply.get(name, 0) for name in raw_material_names],
+                             dtype=float)
+
+        # Throughput of each item that the supply of each raw material could
+        # sustain on its own (infinite where the raw material is not used)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = np.where(counts > 0, available / counts, np.inf)
+
+        limiting = rates.argmin(axis=1)
+        min_rates = rates[np.arange(len(self.items)), limiting]
+        max_rates = {}
+        for i in np.flatnonzero(self.has_recipe):
+            if np.isnan(counts[i]).any():
+                continue
+            if np.isinf(min_rates[i]):
+                max_rates[self.items[i]] = (float("inf"), None)
+            else:
+                max_rates[self.items[i]] = (float(min_rates[i]),
+                                            raw_material_names[limiting[i]])
+        return max_rates
+
+    def solve_steady_state(self, targets, crafting_speeds, raw_materials,
+                           machine_classes=None, productivity=None):
+        """
+        Work out the production needed to supply targets (a dictionary
+        mapping items to output throughputs, in items/second), treating the
+        recipes as a linear system. This works when the recipes contain
+        cycles (e.g. an item that is used to make more of itself).
+
+        If x[i] is the total throughput of item i, every item is needed
+        for the targets and as an ingredient of the items made from it:
+
+            x = d + A'^T x,  i.e.  (I - A'^T) x = d
+
+        where d holds the target throughputs and A' is the ingredient
+        matrix with the rows of the raw materials removed. A cycle only has
+        a finite solution if it makes more than it uses up, which is checked
+        for each strongly connected component of the recipe graph (the
+        spectral radius of its part of A' must be less than one).
+
+        Returns a dictionary with:
+        - throughput: dictionary mapping each item needed to its total
+          throughput (including the targets, the raw materials and any
+          missing items)
+        - machines: dictionary mapping each assembled item to the number of
+          machines making it
+        - raw_input_throughput: dictionary mapping raw materials to the
+          required input throughput
+        - missing: items that are needed, but are neither raw materials
+          nor have a recipe
+        - unbounded: items that are needed in unlimited amounts, because
+          they are in (or are made from something in) a cycle that uses up
+          at least as much as it makes
+        Items that are not needed for the targets do not appear at all, and
+        unbounded items only appear in unbounded.
+
+        machine_classes and productivity are used like in CraftingTree: a
+        recipe with a productivity bonus p makes 1 + p times as many items
+        from the same ingredients, so its row of A' is divided by 1 + p.
+        """
+        machine_classes = machine_classes or {}
+        productivity = productivity or {}
+        is_raw = np.array([item in raw_materials for item in self.items],
+                          dtype=bool)
+        num_items = len(self.items)
+        demand = np.zeros(num_items)
+        for item, throughput in targets.items():
+            if item not in self.index:
+                raise ValueError(f"Item {item} does not exist in the recipes list")
+            demand[self.index[item]] += throughput
+
+        output_per_run = self.get_output_per_run(productivity)
+
+        # Edges from each assembled item to its ingredients
+        expanded = diags((~is_raw) / output_per_run) @ self.ingredient_matrix
+        expanded = csr_matrix(expanded)
+        uses = expanded.astype(bool).astype(float)
+
+        # Items needed for the targets (following ingredients down from
+        # the targets)
+        needed = reachable(uses.T, demand > 0)
+
+        # Cycles which do not converge. A strongly connected component is a
+        # cycle if it has more than one item, or one item that uses itself.
+        _, component = connected_components(expanded, directed=True,
+                                            connection="strong")
+        unstable = np.zeros(num_items, dtype=bool)
+        for c in np.unique(component[needed]):
+            members = np.flatnonzero(component == c)
+            block = expanded[members][:, members].toarray()
+            if len(members) == 1 and block[0, 0] == 0:
+                continue
+            if np.abs(np.linalg.eigvals(block)).max() >= 1 - 1e-12:
+                unstable[members] = True
+
+        # Everything used by an unstable cycle is needed in unlimited
+        # amounts too. The throughput of every other item only depends on
+        # the items that use it, so it can still be solved for.
+        unbounded = reachable(uses.T, unstable) & needed
+        missing = needed & ~is_raw & ~self.has_recipe
+
+        solvable = np.flatnonzero(needed & ~unbounded)
+        throughput = np.zeros(num_items)
+        if len(solvable) > 0:
+            system = (identity(len(solvable)) -
+                      expanded[solvable][:, solvable].T).tocsc()
+            throughput[solvable] = np.atleast_1d(spsolve(system, demand[solvable]))
+
+        result = {
+            "throughput": {},
+            "machines": {},
+            "raw_input_throughput": {},
+            "missing": [self.items[i] for i in np.flatnonzero(missing)],
+            "unbounded": [self.items[i] for i in np.flatnonzero(unbounded)],
+        }
+        for i in solvable:
+            item = self.items[i]
+            result["throughput"][item] = float(throughput[i])
+            if is_raw[i]:
+                result["raw_input_throughput"][item] = float(throughput[i])
+            elif self.has_recipe[i]:
+                crafting_speed = crafting_speeds[
+                    machine_classes.get(item, self.produced_by[i])]
+                result["machines"][item] = float(
+                    throughput[i] * self.time[i] /
+                    (crafting_speed * self.num_produced[i] * output_per_run[i]))
+        return result
@@ -4,14 +4,53 @@
 # described in the Factorio terms of service (https://www.factorio.com/terms-of-service).
 # Image files are downloaded once and placed in a folder called cache/ relative to the
 # current working directory of the script.
+#
+# Decoded icons are kept in memory (get_icon_array), so each icon file is
+# only read once per process. The icons in cache/ can also be packed into
+# one file (an atlas, see build_icon_atlas), which is memory-mapped and
+# sliced instead of opening each icon file separately.
+#
+# The icons can be downloaded from somewhere other than the wiki (another
+# URL, or a local folder holding the icon files with the same names as on
+# the wiki) by setting icon_source, or the PYFACTORIO_ICON_SOURCE
+# environment variable. prefetch_icons downloads all the icons for a
+# graph at once, before drawing it.
 
-import PIL
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
 import os
+import shutil
+import threading
+from PIL import Image
+import numpy as np
 import requests
+from profiling import count
 
 # Official factorio wiki images URL
 image_base_url = "https://wiki.factorio.com/images/"
 
+# Where icons are downloaded from: a base URL, or a local folder
+icon_source = os.environ.get("PYFACTORIO_ICON_SOURCE", image_base_url)
+
+# Number of icons downloaded at once by prefetch_icons, and the number of
+# times each download is retried
+max_download_workers = 8
+max_download_retries = 3
+
+# Maximum number of decoded icons kept in memory
+max_cached_icons = 1024
+
+# The atlas is a flat array of all the RGBA pixels of all the icons, one
+# after the other, and an index mapping each item to the offset of its
+# pixels in the array and the icon size (offset, height, width)
+icon_atlas_path = os.path.join("cache", "icon_atlas.npy")
+icon_atlas_index_path = os.path.join("cache", "icon_atlas.json")
+
+# The loaded atlas, as a tuple (pixels, index); None if load_icon_atlas has
+# not been called yet, and False if there is no atlas
+icon_atlas = None
+
 def make_cache_folder_if_missing():
     if not os.path.exists("cache"):
         print("Creating non-existent cache/ folder")
@@ -20,7 +59,7 @@ def make_cache_folder_if_missing():
 def make_icon_path(item):
     return "cache/" + item + ".png"
         
-def make_icon_download_url(item):
+def make_icon_file_name(item):
     """
     Most of the icon file names are derived from the item name
     (which is snake_case) by capitalising the first letter. The
@@ -32,27 +71,110 @@ def make_icon_download_url(item):
     }
 
     if item in exceptions:
-        return image_base_url + exceptions[item] + ".png"
+        return exceptions[item] + ".png"
     else:
-        return image_base_url + item.capitalize() + ".png"
+        return item.capitalize() + ".png"
 
-def download_icon_if_missing(item):
-    make_cache_folder_if_missing()
+def make_icon_download_url(item, source=None):
+    source = icon_source if source is None else source
+    if not source.endswith("/"):
+        source += "/"
+    return source + make_icon_file_name(item)
+
+def is_local_source(source):
+    return "://" not in source
+
+def make_session(max_connections=max_download_workers,
+                 retries=max_download_retries):
+    """
+    Make a requests session which keeps up to max_connections connections
+    open, and retries failed downloads (connection errors, and server errors
+    like 503) with a backoff
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries,
+                  backoff_factor=0.2,
+                  status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=max_connections,
+                          pool_maxsize=max_connections,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_icon(item, source=None, session=None):
+    """
+    Copy the icon for item from source (a URL or local folder, default
+    icon_source) to the cache/ folder. The file is written under a
+    temporary name first, so a failed or concurrent download never leaves
+    a broken icon in the cache.
+    """
+    source = icon_source if source is None else source
     icon_path = make_icon_path(item)
-    if not os.path.exists(icon_path):
-        url = make_icon_download_url(item)
+    temporary_path = f"{icon_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if is_local_source(source):
+        shutil.copyfile(os.path.join(source, make_icon_file_name(item)),
+                        temporary_path)
+    else:
+        url = make_icon_download_url(item, source)
         print(f"Downloading {icon_path} from {url}")
-        r = requests.get(url)
+        r = (session or requests).get(url)
         if r.status_code != 200:
             raise RuntimeError(f"GET request for {url} failed with error {r.status_code}")
-        open(icon_path, "wb").write(r.content)
-        
+        with open(temporary_path, "wb") as f:
+            f.write(r.content)
+    os.replace(temporary_path, icon_path)
+
+def download_icon_if_missing(item, source=None, session=None):
+    make_cache_folder_if_missing()
+    if not os.path.exists(make_icon_path(item)):
+        fetch_icon(item, source, session)
+
+def prefetch_icons(items, source=None, max_workers=max_download_workers):
+    """
+    Download the icons for all of items which are not already in the
+    cache/ folder (or the atlas), several at a time, using one pooled
+    session. Returns a dictionary mapping each item whose icon could not be
+    downloaded to the error message (these fail again when the icon is
+    used, in get_icon).
+    """
+    if icon_atlas is None:
+        load_icon_atlas()
+    make_cache_folder_if_missing()
+    missing = sorted(
+        item for item in set(items)
+        if not (icon_atlas and item in icon_atlas[1])
+        and not os.path.exists(make_icon_path(item)))
+    if not missing:
+        return {}
+
+    errors = {}
+    with make_session(max_workers) as session:
+
+        def fetch(item):
+            try:
+                fetch_icon(item, source, session)
+            except Exception as e:
+                errors[item] = str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(fetch, missing))
+
+    # Counted once the downloads have finished, rather than from the threads
+    count("icons downloaded", len(missing) - len(errors))
+    if errors:
+        count("icon downloads failed", len(errors))
+    return errors
+
 def open_image(item):
     """
     Open the image at cache/{item}.png
     """
-    return PIL.Image.open(make_icon_path(item))
-    
+    return Image.open(make_icon_path(item))
+
 
 def get_icon(item):
     """
@@ -65,3 +187,104 @@ def get_icon(item):
         raise RuntimeError(f"Failed to get icon for {item}")
         
         
+
+def build_icon_atlas(items=None, atlas_path=icon_atlas_path,
+                     index_path=icon_atlas_index_path):
+    """
+    Pack the icons for items (default: every icon in the cache/ folder)
+    into an atlas, and return its index (mapping items to [offset, height,
+    width]). The icons must already have been downloaded. The index file
+    also holds the size of the atlas, so that load_icon_atlas can tell if
+    the two files do not belong together.
+    """
+    if items is None:
+        items = sorted(name[:-len(".png")] for name in os.listdir("cache")
+                       if name.endswith(".png"))
+
+    icons = []
+    index = {}
+    offset = 0
+    for item in items:
+        pixels = np.asarray(open_image(item).convert("RGBA"))
+        height, width = pixels.shape[:2]
+        icons.append(pixels.reshape(-1))
+        index[item] = [offset, height, width]
+        offset += pixels.size
+
+    pixels = np.concatenate(icons) if icons else np.zeros(0, dtype=np.uint8)
+
+    # Written to temporary files first, so that a process reading the atlas
+    # never sees half of it, and the index last. Two processes building the
+    # atlas at once can still leave the atlas of one with the index of the
+    # other, which load_icon_atlas checks for.
+    temporary_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(atlas_path + temporary_suffix, "wb") as f:
+        np.save(f, pixels)
+    with open(index_path + temporary_suffix, "w") as f:
+        json.dump({"size": int(pixels.size), "icons": index}, f)
+    os.replace(atlas_path + temporary_suffix, atlas_path)
+    os.replace(index_path + temporary_suffix, index_path)
+    return index
+
+def read_icon_atlas(atlas_path, index_path):
+    """
+    Memory-map the atlas and read its index. Raises a ValueError if they
+    cannot be read or do not match.
+    """
+    with open(index_path) as f:
+        index_file = json.load(f)
+    pixels = np.load(atlas_path, mmap_mode="r")
+    if not isinstance(index_file, dict) or index_file.get("size") != pixels.size:
+        raise ValueError(f"{index_path} does not match {atlas_path}")
+    index = index_file["icons"]
+    for offset, height, width in index.values():
+        if offset + height * width * 4 > pixels.size:
+            raise ValueError(f"{index_path} does not match {atlas_path}")
+    return pixels, index
+
+def load_icon_atlas(atlas_path=icon_atlas_path, index_path=icon_atlas_index_path):
+    """
+    Memory-map the icon atlas, if there is one, so that get_icon_array
+    uses it. Returns true if the atlas was loaded. An atlas that does not
+    match its index (or cannot be read) is built again from the icons in
+    cache/; if that fails, the icon files are used instead.
+    """
+    global icon_atlas
+    icon_atlas = False
+    if os.path.exists(atlas_path) and os.path.exists(index_path):
+        try:
+            icon_atlas = read_icon_atlas(atlas_path, index_path)
+        except (OSError, ValueError, KeyError, TypeError):
+            count("icon atlas rebuilds")
+            try:
+                build_icon_atlas(atlas_path=atlas_path, index_path=index_path)
+                icon_atlas = read_icon_atlas(atlas_path, index_path)
+            except (OSError, ValueError):
+                pass
+    get_icon_array.cache_clear()
+    return icon_atlas is not False
+
+@functools.lru_cache(maxsize=max_cached_icons)
+def get_icon_array(item):
+    """
+    Get the icon for item as a read-only RGBA array (height x width x 4).
+    The icon is taken from the atlas (without copying) if it is there,
+    otherwise from the icon file, which is downloaded if needed. The
+    result is cached, so the icon is only read once.
+    """
+    if icon_atlas is None:
+        load_icon_atlas()
+
+    if icon_atlas and item in icon_atlas[1]:
+        pixels, index = icon_atlas
+        offset, height, width = index[item]
+        return pixels[offset:offset + height * width * 4].reshape(height, width, 4)
+
+    pixels = np.asarray(get_icon(item).convert("RGBA"))
+    pixels.setflags(write=False)
+    return pixels
+
+
+if __name__ == "__main__":
+    index = build_icon_atlas()
+    print(f"Packed {len(index)} icons into {icon_atlas_path}")
@@ -9,54 +9,247 @@
 """
 
 
+from bisect import bisect_left
+from collections import OrderedDict
+import math
+import re
+
+# Short names for items (keys are normalised, see normalise_item_name).
+# Do not put plurals as the key!
+item_aliases = {
+    'gear': 'iron_gear_wheel',
+    # belts
+    'yellowbelt': 'transport_belt',
+    'redbelt': 'fast_transport_belt',
+    'bluebelt': 'express_transport_belt',
+    'yellowunderground': 'underground_belt',
+    'redunderground': 'fast_underground_belt',
+    'blueunderground': 'express_underground_belt',
+    'yellowsplitter': 'splitter',
+    'redsplitter': 'fast_splitter',
+    'bluesplitter': 'express_splitter',
+    #
+    'yellowinserter': 'inserter',
+    'redinserter': 'long_handed_inserter',
+    'blueinserter': 'fast_inserter',
+    #
+    'greencircuit': 'electronic_circuit',
+    'redcircuit': 'advanced_circuit',
+    'bluecircuit': 'processing_unit',
+    #
+    'assembler': 'assembling_machine_1',
+    'blueassembler': 'assembling_machine_2',
+    'yellowassembler': 'assembling_machine_3',
+    'greenassembler': 'assembling_machine_3',
+    #
+    'plastic': 'plastic_bar',
+    #
+    'redscience': 'automation_science_pack',
+    'greenscience': 'logistic_science_pack',
+    'greyscience': 'military_science_pack',
+    'bluescience': 'chemical_science_pack',
+    'purplescience': 'production_science_pack',
+    'yellowscience': 'utility_science_pack',
+    'whitescience': 'space_science_pack'
+}
+
+
+def normalise_item_name(name):
+    """
+    Make the key used to look up an item name: lowercase, without
+    underscores, hyphens or spaces (so green_circuit, Green Circuit and
+    greencircuit all match)
+    """
+    return re.sub(r"[\s_\-]", "", name.lower())
+
+
 # checks if the passed item was short and looks up the
 # full name, which is required by the rest of the code.
 def lookupItemAliases(item):
-
-    # Do not put plurals as the key!
-    lookupItemAliasesDict = {
-        ('gear'): 'iron_gear_wheel',
-        # belts
-        ('yellowbelt'): 'transport_belt',
-        ('redbelt'): 'fast_transport_belt',
-        ('bluebelt'): 'express_transport_belt',
-        ('yellowunderground'): 'underground_belt',
-        ('redunderground'): 'fast_underground_belt',
-        ('blueunderground'): 'express_underground_belt',
-        ('yellowsplitter'): 'splitter',
-        ('redsplitter'): 'fast_splitter',
-        ('bluesplitter'): 'express_splitter',
-        #
-        ('yellowinserter'): 'inserter',
-        ('redinserter'): 'long-handed_inserter',
-        ('blueinserter'): 'fast_inserter',
-        #
-        ('greencircuit'): 'electronic_circuit',
-        ('redcircuit'): 'advanced_circuit',
-        ('bluecircuit'): 'processing_unit',
-        #
-        ('assembler'): 'assembling_machine_1',
-        ('blueassembler'): 'assembling_machine_2',
-        ('yellowassembler', 'green_assemmbler'): 'assembling_machine_3',
-        #
-        ('plastic'): 'plastic_bar',
-        #
-        ('redscience'): 'automation_science_pack',
-        ('greenscience'): 'logistic_science_pack',
-        ('greyscience'): 'military_science_pack',
-        ('bluescience'): 'chemical_science_pack',
-        ('purplescience'): 'production_science_pack',
-        ('yellowscience'): 'utility_science_pack',
-        ('whitescience'): 'space_science_pack'
-    }
-
-    try:
-        # remove underscores and make lowercase
-        newItem = item.replace("_", "").lower()
-        # if ends in s strip it
-        if newItem[-1] == 's':
-            newItem = newItem[:-1]
-        item = lookupItemAliasesDict[newItem]
-    except KeyError:
-        item = item
+    newItem = normalise_item_name(item)
+    if newItem in item_aliases:
+        return item_aliases[newItem]
+    # if ends in s strip it
+    if newItem.endswith("s") and newItem[:-1] in item_aliases:
+        return item_aliases[newItem[:-1]]
     return item
+
+
+def make_trigrams(key):
+    """
+    Get the set of trigrams (three letter substrings) of key, padded so
+    that the start and end of the name count as well
+    """
+    padded = "  " + key + " "
+    return {padded[n:n + 3] for n in range(len(padded) - 2)}
+
+
+class ItemResolver:
+    """
+    Turns free-text item names (from the command line, queries, config
+    files, ...) into the item names used in the recipes. The indexes are
+    built once, so each lookup is quick:
+    - items: the sorted item names
+    - exact: normalised item names and aliases, mapped to item names
+    - keys: the sorted normalised names and aliases, for prefix searches
+    - trigrams: map from each trigram to the keys containing it, for
+      fuzzy matching of misspelt names (and key_trigrams, the trigrams of
+      each key)
+
+    Names are resolved (see resolve) by trying, in order: the exact item
+    name; the normalised name or alias (also without a plural s); a prefix
+    of exactly one item; and the closest fuzzy match, if it is close enough
+    and clearly better than the others.
+    """
+
+    # Smallest similarity (the fraction of trigrams shared) for a fuzzy match
+    # to be used without asking
+    min_fuzzy_score = 0.5
+
+    # Smallest similarity for a fuzzy match to be suggested
+    min_suggestion_score = 0.2
+
+    # Number of names whose matches are remembered (the resolver can live
+    # as long as a Planner, which is sent names by any client)
+    max_resolved = 1024
+
+    def __init__(self, item_names, aliases=item_aliases):
+        self.items = sorted(set(item_names))
+        self.item_set = frozenset(self.items)
+
+        self.exact = {}
+        for item in self.items:
+            self.exact.setdefault(normalise_item_name(item), item)
+        for alias, item in aliases.items():
+            if item in self.item_set:
+                self.exact.setdefault(alias, item)
+
+        self.keys = sorted(self.exact)
+        self.trigrams = {}
+        self.key_trigrams = {}
+        for key in self.keys:
+            key_trigrams = frozenset(make_trigrams(key))
+            self.key_trigrams[key] = key_trigrams
+            for trigram in key_trigrams:
+                self.trigrams.setdefault(trigram, []).append(key)
+
+        # Names resolved most recently (the same names tend to come up
+        # repeatedly), least recently used first
+        self.resolved = OrderedDict()
+
+    @classmethod
+    def from_recipe_list(cls, recipes, aliases=item_aliases):
+        """
+        Make the resolver for all the items in a RecipeList (the items with
+        recipes, and their ingredients)
+        """
+        item_names = set(recipes.recipes)
+        for recipe in recipes.recipes.values():
+            item_names.update(recipe.ingredients)
+        return cls(item_names, aliases)
+
+    def get_prefix_matches(self, key):
+        """
+        Get the items which have a normalised name or alias starting with key,
+        shortest (closest to key) first
+        """
+        start = bisect_left(self.keys, key)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(key):
+            end += 1
+        matches = []
+        for match in sorted(self.keys[start:end], key=lambda match: (len(match), match)):
+            item = self.exact[match]
+            if item not in matches:
+                matches.append(item)
+        return matches
+
+    def get_fuzzy_matches(self, key, min_score):
+        """
+        Get a list of (similarity, item) for the items whose normalised name
+        or alias has a similarity of at least min_score (more than 0) with
+        key, best first. The similarity is the number of shared trigrams
+        divided by the number of trigrams in either.
+
+        A key with that similarity shares at least min_score times the
+        trigrams of key, so it must contain one of the rarest few of them.
+        Only the keys containing those are compared, which skips the
+        trigrams shared by many names (like "_pl" in every plate).
+        """
+        trigrams = sorted(make_trigrams(key),
+                          key=lambda trigram: len(self.trigrams.get(trigram, ())))
+        min_shared = math.ceil(min_score * len(trigrams))
+        candidates = set()
+        for trigram in trigrams[:len(trigrams) - min_shared + 1]:
+            candidates.update(self.trigrams.get(trigram, ()))
+
+        trigrams = set(trigrams)
+        best = {}
+        for candidate in candidates:
+            candidate_trigrams = self.key_trigrams[candidate]
+            num_shared = len(trigrams & candidate_trigrams)
+            score = num_shared / (len(trigrams) + len(candidate_trigrams) - num_shared)
+            item = self.exact[candidate]
+            if score >= min_score and score > best.get(item, 0):
+                best[item] = score
+        return sorted(((score, item) for item, score in best.items()),
+                      key=lambda match: (-match[0], match[1]))
+
+    def suggest(self, name, max_suggestions=5):
+        """
+        Get up to max_suggestions item names which name might have meant,
+        best first: the items it is a prefix of, then fuzzy matches
+        """
+        key = normalise_item_name(name)
+        suggestions = self.get_prefix_matches(key) if key else []
+        for _, item in self.get_fuzzy_matches(key, self.min_suggestion_score):
+            if item not in suggestions:
+                suggestions.append(item)
+        return suggestions[:max_suggestions]
+
+    def match(self, name):
+        """
+        Find the item that name refers to. Returns a tuple (item, kind),
+        where kind is "exact", "alias", "prefix" or "fuzzy", or (None, None)
+        if there is no good enough match.
+        """
+        if name in self.resolved:
+            self.resolved.move_to_end(name)
+            return self.resolved[name]
+
+        key = normalise_item_name(name)
+        result = (None, None)
+        if name in self.item_set:
+            result = (name, "exact")
+        elif key in self.exact:
+            result = (self.exact[key], "alias")
+        elif key.endswith("s") and key[:-1] in self.exact:
+            result = (self.exact[key[:-1]], "alias")
+        elif key:
+            prefix_matches = self.get_prefix_matches(key)
+            if len(prefix_matches) == 1:
+                result = (prefix_matches[0], "prefix")
+            elif not prefix_matches:
+                fuzzy_matches = self.get_fuzzy_matches(key, self.min_fuzzy_score)
+                if fuzzy_matches and (len(fuzzy_matches) == 1
+                                      or fuzzy_matches[1][0] < fuzzy_matches[0][0]):
+                    result = (fuzzy_matches[0][1], "fuzzy")
+
+        self.resolved[name] = result
+        if len(self.resolved) > self.max_resolved:
+            self.resolved.popitem(last=False)
+        return result
+
+    def resolve(self, name):
+        """
+        Get the item name that name refers to (see match). Raises a
+        ValueError, with suggestions, if there is no good enough match.
+        """
+        item, _ = self.match(name)
+        if item is None:
+            suggestions = self.suggest(name)
+            message = f"Item {name} does not exist in the recipes list."
+            if suggestions:
+                message += f" Did you mean {', '.join(suggestions)}?"
+            raise ValueError(message)
+        return item
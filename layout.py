@@ -0,0 +1,77 @@
+# Cache of graphviz node positions for crafting graphs. The layout of a
+# CraftingTree or CombinedCraftingGraph only depends on which items are
+# at which nodes and how they are connected, not on the throughputs or
+# numbers of machines, so the positions are saved in the cache/layouts/
+# folder (relative to the current working directory), under a hash of
+# the graph structure, and reused whenever the same structure is drawn.
+
+import hashlib
+import json
+import os
+from profiling import phase, count
+
+layout_cache_folder = os.path.join("cache", "layouts")
+
+
+def graphviz_layout(G, prog):
+    """
+    Work out the node positions using graphviz (this is the slow part)
+    """
+    from networkx.drawing.nx_agraph import graphviz_layout as nx_graphviz_layout
+    return nx_graphviz_layout(G, prog=prog)
+
+
+def make_structure_hash(G, prog):
+    """
+    Make a hash of the structure of the graph G: the item at each node,
+    the edges, whether it is directed, and the graphviz program used to
+    lay it out. The node attributes other than the item are ignored.
+    """
+    if G.is_directed():
+        edges = sorted(G.edges)
+    else:
+        edges = sorted(tuple(sorted(edge)) for edge in G.edges)
+    structure = {
+        "prog": prog,
+        "directed": G.is_directed(),
+        "nodes": sorted((n, G.nodes[n]["item"]) for n in G.nodes),
+        "edges": edges,
+    }
+    return hashlib.sha256(json.dumps(structure).encode()).hexdigest()
+
+
+def make_layout_path(structure_hash, cache_folder):
+    return os.path.join(cache_folder, structure_hash + ".json")
+
+
+def cached_graphviz_layout(G, prog="dot", cache_folder=layout_cache_folder):
+    """
+    Get the positions of the nodes of G (a dictionary mapping nodes to
+    (x, y), like networkx graphviz_layout). If a graph with the same
+    structure has been laid out before, the positions are read from the
+    cache; otherwise, graphviz is run and the positions are saved. A cache
+    file that cannot be read (e.g. a corrupt one) is replaced.
+    """
+    layout_path = make_layout_path(make_structure_hash(G, prog), cache_folder)
+    try:
+        with open(layout_path) as f:
+            pos = {n: (x, y) for n, x, y in json.load(f)}
+        count("layout cache hits")
+        return pos
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError):
+        count("layout cache errors")
+
+    count("layout cache misses")
+    with phase("graphviz"):
+        pos = graphviz_layout(G, prog)
+
+    # Written to a temporary file first, so that a half-written layout is
+    # never read
+    os.makedirs(cache_folder, exist_ok=True)
+    temporary_path = f"{layout_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump([[n, x, y] for n, (x, y) in pos.items()], f)
+    os.replace(temporary_path, layout_path)
+    return pos
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+description = """
+Plan production using linear programming, for recipes with more than
+one product (like oil processing) and items with more than one recipe
+(like solid fuel, which can be made from light oil, heavy oil or
+petroleum gas). The recipes are read from the single-product recipes
+file (-f) and the multi-product recipes file (-l), and the mix of
+recipes which makes the item at the target rate with the least raw
+input (or the fewest machines, with --minimize machines) is printed.
+
+Unlike ./pyfactorio, by-products can be left over; they are listed as
+surplus.
+
+EXAMPLES
+
+# Rocket fuel from crude oil, using any oil processing and cracking
+./lp.py -r 60 -i crude_oil water coal steam iron_plate copper_plate \\
+    -- rocket_fuel
+
+# The same, using as few machines as possible
+./lp.py -r 60 --minimize machines -i crude_oil water coal steam \\
+    iron_plate copper_plate -- rocket_fuel
+
+DETAIL
+
+The multi-product recipes file has the columns
+recipe,item,role,quantity,time,produced_by, with one row for each
+ingredient (role ingredient) and product (role product) of each recipe.
+A recipe in it with the same name as one in the single-product recipes
+file (where the recipe is named after the item) replaces it.
+
+The raw materials are added up as they are, so with --minimize raw
+(the default), one unit of water counts the same as one iron plate.
+"""
+
+import argparse
+import csv
+import json
+import numpy as np
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix, hstack
+from compiled import reachable
+
+# Weight of the other objective, used to choose between plans which are
+# equally good for the main one (e.g. with the same raw input, the plan
+# with fewer machines)
+tie_break_weight = 1e-6
+
+
+class MultiRecipe:
+    """
+    A recipe which can have several products, and is one of possibly
+    several recipes for an item. It has the attributes:
+    - name: the name of the recipe (for recipes from a RecipeList, the
+      name of the item it makes)
+    - products: dictionary mapping products to the number made by one run
+    - ingredients: dictionary mapping ingredients to the number used by one
+      run
+    - time: time taken by one run, at crafting speed 1
+    - produced_by: the class of machine that runs it
+    """
+
+    def __init__(self, name, products, ingredients, time, produced_by):
+        self.name = name
+        self.products = products
+        self.ingredients = ingredients
+        self.time = time
+        self.produced_by = produced_by
+
+    def __repr__(self):
+        return (f"Recipe {self.name} making {self.products} in {self.time}s, "
+                f"using {self.ingredients}")
+
+
+def read_multi_recipes_csv(multi_recipes_csv):
+    """
+    Read a multi-product recipes csv file, and return a dictionary mapping
+    recipe names to MultiRecipes
+    """
+    recipes = {}
+    with open(multi_recipes_csv, newline="") as f:
+        for row in csv.DictReader(f):
+            name = row["recipe"]
+            if name not in recipes:
+                recipes[name] = MultiRecipe(name, {}, {}, float(row["time"]),
+                                            row["produced_by"])
+            if row["role"] == "product":
+                amounts = recipes[name].products
+            elif row["role"] == "ingredient":
+                amounts = recipes[name].ingredients
+            else:
+                raise ValueError(
+                    f"Unknown role {row['role']} in recipe {name} (use product or ingredient)")
+            amounts[row["item"]] = amounts.get(row["item"], 0) + float(row["quantity"])
+    return recipes
+
+
+class MultiRecipeList:
+    """
+    A list of MultiRecipes, which can be used to plan production by linear
+    programming (see plan). It can be made from a RecipeList (recipes),
+    a multi-product recipes csv file (multi_recipes_csv), or both.
+    """
+
+    def __init__(self, recipes=None, multi_recipes_csv=None):
+        self.recipes = {}
+        if recipes is not None:
+            for item, recipe in recipes.recipes.items():
+                self.recipes[item] = MultiRecipe(
+                    item, {item: recipe.num_produced}, dict(recipe.ingredients),
+                    recipe.time, recipe.produced_by)
+        if multi_recipes_csv is not None:
+            self.recipes.update(read_multi_recipes_csv(multi_recipes_csv))
+        self.compiled = None
+
+    def compile(self):
+        """
+        Build (once) the list of items, the index of each item, and the
+        sparse net production matrix, where net[i, k] is the number of item
+        i made (positive) or used up (negative) by one run of recipe k
+        """
+        if self.compiled is not None:
+            return self.compiled
+
+        recipe_names = list(self.recipes)
+        items = set()
+        for recipe in self.recipes.values():
+            items.update(recipe.products)
+            items.update(recipe.ingredients)
+        items = sorted(items)
+        index = {item: n for n, item in enumerate(items)}
+
+        rows = []
+        columns = []
+        amounts = []
+        for k, name in enumerate(recipe_names):
+            recipe = self.recipes[name]
+            for item, quantity in recipe.products.items():
+                rows.append(index[item])
+                columns.append(k)
+                amounts.append(quantity)
+            for item, quantity in recipe.ingredients.items():
+                rows.append(index[item])
+                columns.append(k)
+                amounts.append(-quantity)
+
+        # Duplicate entries (an item that is both used and made by the same
+        # recipe) are added together by the csr matrix
+        net = csr_matrix((amounts, (rows, columns)),
+                         shape=(len(items), len(recipe_names)))
+        self.compiled = (recipe_names, items, index, net)
+        return self.compiled
+
+    def plan(self, targets, crafting_speeds, raw_materials, minimize="raw",
+             raw_costs=None):
+        """
+        Choose how often to run each recipe, to make targets (a dictionary
+        mapping items to throughputs in items/second) from raw_materials,
+        minimising either the total raw input (minimize="raw"; each raw
+        material can be weighted using raw_costs, a dictionary of cost per
+        unit, default 1) or the total number of machines
+        (minimize="machines").
+
+        Only the recipes that could contribute to the targets are included
+        in the linear program. Raises a ValueError if the targets cannot be
+        made from the raw materials.
+
+        Returns a dictionary with:
+        - recipe_runs: dictionary mapping each recipe used to its number of
+          runs per second
+        - machines: dictionary mapping each recipe used to the number of
+          machines running it
+        - raw_input_throughput: dictionary mapping raw materials to the
+          required input throughput
+        - surplus: dictionary mapping items which are made faster than they
+          are used (by-products) to the excess throughput
+        """
+        if minimize not in ("raw", "machines"):
+            raise ValueError(f"Cannot minimize {minimize} (use raw or machines)")
+        recipe_names, items, index, net = self.compile()
+        raw_costs = raw_costs or {}
+        raw_materials = frozenset(raw_materials)
+
+        demand = np.zeros(len(items))
+        for item, throughput in targets.items():
+            if item not in index:
+                raise ValueError(f"Item {item} does not exist in the recipes list")
+            demand[index[item]] += throughput
+        is_raw = np.array([item in raw_materials for item in items], dtype=bool)
+
+        # Recipes that could be involved: those making a target, then those
+        # making the ingredients of those, and so on. Each step follows
+        # item -> recipes making it -> their ingredients.
+        makes = (net > 0).astype(float)
+        uses = (net < 0).astype(float)
+        item_to_item = uses @ makes.T
+        needed_items = reachable(item_to_item.tocsr(), demand > 0)
+        used = np.flatnonzero(makes.T @ needed_items.astype(float) > 0)
+
+        # The by-products of those recipes are included too, so that any
+        # left over are counted as surplus
+        needed_items = np.flatnonzero(
+            needed_items | (makes[:, used].sum(axis=1).A1 > 0))
+
+        # Variables: runs per second of each used recipe, then the input
+        # throughput of each needed raw material
+        raw_indices = needed_items[is_raw[needed_items]]
+        sub_net = net[needed_items][:, used]
+        raw_columns = csr_matrix(
+            (np.ones(len(raw_indices)),
+             (np.searchsorted(needed_items, raw_indices), np.arange(len(raw_indices)))),
+            shape=(len(needed_items), len(raw_indices)))
+
+        machines_per_run = np.array([
+            self.recipes[recipe_names[k]].time /
+            crafting_speeds[self.recipes[recipe_names[k]].produced_by]
+            for k in used
+        ])
+        raw_cost = np.array([raw_costs.get(items[i], 1.0) for i in raw_indices])
+        if minimize == "raw":
+            cost = np.concatenate([tie_break_weight * machines_per_run, raw_cost])
+        else:
+            cost = np.concatenate([machines_per_run, tie_break_weight * raw_cost])
+
+        # Net production (plus raw input) of every needed item must cover
+        # its demand: -(net r + u) <= -demand
+        constraints = hstack([sub_net, raw_columns]).tocsr()
+        solution = linprog(cost,
+                           A_ub=-constraints,
+                           b_ub=-demand[needed_items],
+                           bounds=(0, None),
+                           method="highs")
+        if solution.status != 0:
+            raise ValueError(
+                f"Cannot make {', '.join(targets)} from the raw materials: {solution.message}")
+
+        runs = solution.x[:len(used)]
+        raw_input = solution.x[len(used):]
+        surplus = constraints @ solution.x - demand[needed_items]
+
+        # Ignore the round-off of the solver
+        tolerance = 1e-9 * max(1.0, np.abs(solution.x).max())
+        result = {
+            "recipe_runs": {},
+            "machines": {},
+            "raw_input_throughput": {},
+            "surplus": {},
+        }
+        for k, recipe_runs, machines in zip(used, runs, runs * machines_per_run):
+            if recipe_runs > tolerance:
+                result["recipe_runs"][recipe_names[k]] = float(recipe_runs)
+                result["machines"][recipe_names[k]] = float(machines)
+        for i, throughput in zip(raw_indices, raw_input):
+            if throughput > tolerance:
+                result["raw_input_throughput"][items[i]] = float(throughput)
+        for i, excess in zip(needed_items, surplus):
+            if excess > tolerance:
+                result["surplus"][items[i]] = float(excess)
+        return result
+
+
+def format_lp_plan_text(item, throughput, plan):
+    """
+    Format a plan from MultiRecipeList.plan as text
+    """
+    lines = [f"Recipes used to make {60.0*throughput} {item} per minute:"]
+    for name, machines in plan["machines"].items():
+        lines.append(f"  {name}: {machines:.1f} machines, "
+                     f"{plan['recipe_runs'][name]:.3f} runs/s")
+    lines.append("Raw input throughputs:")
+    for raw_material, raw_throughput in plan["raw_input_throughput"].items():
+        lines.append(f"  {raw_material}: {raw_throughput:.2f}/s")
+    if plan["surplus"]:
+        lines.append("Surplus:")
+        for surplus_item, surplus in plan["surplus"].items():
+            lines.append(f"  {surplus_item}: {surplus:.2f}/s")
+    return "\n".join(lines)
+
+
+class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
+                      argparse.RawDescriptionHelpFormatter):
+    pass
+
+
+if __name__ == "__main__":
+    from recipe import RecipeList
+    from planner import make_crafting_speeds, read_inputs_file
+
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=CustomFormatter)
+    parser.add_argument("item", help="the item to be made")
+    parser.add_argument("-r",
+                        "--rate",
+                        help="target item rate, in items per minute",
+                        type=float,
+                        default=60)
+    parser.add_argument(
+        "-m",
+        "--assembling-machine",
+        help="type of assembling machine used (0 (human); 1, 2, or 3)",
+        choices=[0, 1, 2, 3],
+        type=int,
+        default=1)
+    parser.add_argument(
+        "-i",
+        "--inputs",
+        help="the raw materials (default: the items in input_materials.txt)",
+        nargs="+")
+    parser.add_argument("-f",
+                        "--recipes-file",
+                        help="relative path to the recipes file",
+                        default="factorio_recipes.csv")
+    parser.add_argument("-l",
+                        "--multi-recipes-file",
+                        help="relative path to the multi-product recipes file",
+                        default="factorio_fluid_recipes.csv")
+    parser.add_argument("--minimize",
+                        help="what to minimize",
+                        choices=["raw", "machines"],
+                        default="raw")
+    parser.add_argument("--json",
+                        help="print the plan as JSON",
+                        action="store_true")
+    args = parser.parse_args()
+
+    inputs = args.inputs or read_inputs_file("input_materials.txt")
+    multi_recipes = MultiRecipeList(RecipeList(args.recipes_file),
+                                    args.multi_recipes_file)
+    throughput = args.rate / 60.0
+    plan = multi_recipes.plan({args.item: throughput},
+                              make_crafting_speeds(args.assembling_machine),
+                              inputs, args.minimize)
+    if args.json:
+        print(json.dumps({"item": args.item, "output_throughput": throughput, **plan},
+                         indent=2))
+    else:
+        print(format_lp_plan_text(args.item, throughput, plan))
@@ -0,0 +1,674 @@
+#!/usr/bin/env python3
+
+description = """
+Choose the machine, modules and beacons for every recipe needed to make
+an item, so that the target rate is reached with the fewest machines
+(or the least power, with --minimize power).
+
+Each recipe can be made by any machine of its class (e.g. assembling
+machines 1 to 3 for assembling_machine recipes), with its module slots
+empty or filled with one kind of module, and with each number of beacons
+given by --beacons (every beacon is full of --beacon-module). Speed
+modules and beacons reduce the number of machines; productivity modules
+make more items from the same ingredients, which reduces the machines
+needed for everything upstream; efficiency modules reduce the power.
+
+The layouts are searched in two steps: first every combination of one
+layout per machine class, then each recipe on its own (keeping the
+others fixed) until nothing improves. Each step evaluates many layouts
+at once as array operations over the recipes.
+
+EXAMPLES
+
+# Fewest machines for 60 electronic circuits per minute, with up to
+# eight beacons per machine
+./machines.py electronic_circuit -r 60 --beacons 0 8
+
+# Least power for 30 chemical science packs per minute, without
+# assembling machine ones
+./machines.py -r 30 --minimize power --machines assembling_machine_2 \\
+    assembling_machine_3 electric_furnace chemical_plant oil_refinery \\
+    -- chemical_science_pack
+
+DETAIL
+
+The layout chosen for each recipe is printed in the form accepted by
+./pyfactorio --machine, like
+assembling_machine_3+4*productivity_module_3+8*beacon:speed_module_3
+(the machine, then the modules in it, then the beacons around it).
+
+Productivity modules are only used for intermediate products (items
+that are ingredients of another recipe) and science packs. The power
+of a beacon is counted in full for every machine it affects.
+"""
+
+import argparse
+import itertools
+import json
+
+# numpy is only needed by the configuration search, so it is imported in
+# the functions that use it: planner (and so pyfactorio) imports this
+# module for MachineConfig, and should stay quick to load
+
+# The machines that can make recipes: the produced_by class of the
+# recipes they make, their crafting speed, number of module slots and
+# power use (kW)
+machine_types = {
+    "assembling_machine_1": {"produced_by": "assembling_machine", "crafting_speed": 0.5,
+                             "module_slots": 0, "power": 75},
+    "assembling_machine_2": {"produced_by": "assembling_machine", "crafting_speed": 0.75,
+                             "module_slots": 2, "power": 150},
+    "assembling_machine_3": {"produced_by": "assembling_machine", "crafting_speed": 1.25,
+                             "module_slots": 4, "power": 375},
+    "stone_furnace": {"produced_by": "furnace", "crafting_speed": 1,
+                      "module_slots": 0, "power": 90},
+    "steel_furnace": {"produced_by": "furnace", "crafting_speed": 2,
+                      "module_slots": 0, "power": 90},
+    "electric_furnace": {"produced_by": "furnace", "crafting_speed": 2,
+                         "module_slots": 2, "power": 180},
+    "chemical_plant": {"produced_by": "chemical_plant", "crafting_speed": 1,
+                       "module_slots": 3, "power": 210},
+    "oil_refinery": {"produced_by": "oil_refinery", "crafting_speed": 1,
+                     "module_slots": 3, "power": 420},
+}
+
+# The effect of each module, as fractions added to the crafting speed,
+# productivity and power use of the machine
+module_types = {
+    "speed_module": {"speed": 0.2, "productivity": 0, "energy": 0.5},
+    "speed_module_2": {"speed": 0.3, "productivity": 0, "energy": 0.6},
+    "speed_module_3": {"speed": 0.5, "productivity": 0, "energy": 0.7},
+    "efficiency_module": {"speed": 0, "productivity": 0, "energy": -0.3},
+    "efficiency_module_2": {"speed": 0, "productivity": 0, "energy": -0.4},
+    "efficiency_module_3": {"speed": 0, "productivity": 0, "energy": -0.5},
+    "productivity_module": {"speed": -0.05, "productivity": 0.04, "energy": 0.4},
+    "productivity_module_2": {"speed": -0.1, "productivity": 0.06, "energy": 0.6},
+    "productivity_module_3": {"speed": -0.15, "productivity": 0.1, "energy": 0.8},
+}
+
+# A beacon passes on this fraction of the effect of its modules to every
+# machine in range
+beacon_module_slots = 2
+beacon_effectivity = 0.5
+beacon_power = 480
+
+# Modules cannot slow a machine down, or cut its power use, below these
+# fractions of the normal values
+min_speed_factor = 0.2
+min_energy_factor = 0.2
+
+# Number of layouts evaluated in each batch of array operations
+search_batch_size = 4096
+
+# Largest number of combinations of one layout per machine class tried in
+# the first step of search_configurations (if there are more, the search
+# starts from the first layout of each class instead)
+max_class_combinations = 10**6
+
+
+class MachineConfig:
+    """
+    A machine with its modules and beacons. It has the attributes:
+    - machine: the machine name (a key of machine_types)
+    - modules: list of the modules in the machine (keys of module_types)
+    - beacons: the number of beacons affecting the machine
+    - beacon_module: the module filling every beacon (None if there are no
+      beacons)
+
+    and the properties produced_by, crafting_speed, productivity and power
+    (in kW, including the beacons). Its name, like
+    assembling_machine_3+4*productivity_module_3+8*beacon:speed_module_3,
+    can be turned back into a MachineConfig with parse, and is used as the
+    machine class of the recipes it makes (see make_machine_settings).
+    """
+
+    def __init__(self, machine, modules=(), beacons=0, beacon_module=None):
+        if machine not in machine_types:
+            raise ValueError(
+                f"Unknown machine {machine} (use one of {', '.join(machine_types)})")
+        for module in list(modules) + ([beacon_module] if beacons else []):
+            if module not in module_types:
+                raise ValueError(
+                    f"Unknown module {module} (use one of {', '.join(module_types)})")
+        if len(modules) > machine_types[machine]["module_slots"]:
+            raise ValueError(
+                f"{machine} only has {machine_types[machine]['module_slots']} module slots")
+        if beacons and module_types[beacon_module]["productivity"]:
+            raise ValueError("Productivity modules cannot be used in beacons")
+        if beacons and not machine_types[machine]["module_slots"]:
+            raise ValueError(f"Beacons have no effect on {machine}")
+        self.machine = machine
+        self.modules = list(modules)
+        self.beacons = beacons
+        self.beacon_module = beacon_module if beacons else None
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Make a MachineConfig from its name: the machine, then any modules
+        (N*module for N of the same module), then any beacons
+        (N*beacon:module), separated by +
+        """
+        machine, *parts = text.split("+")
+        modules = []
+        beacons = 0
+        beacon_module = None
+        for part in parts:
+            count, _, name = part.rpartition("*")
+            try:
+                count = int(count) if count else 1
+            except ValueError:
+                raise ValueError(f"Cannot read {part} in {text} (use N*module)")
+            if name.startswith("beacon:"):
+                beacons = count
+                beacon_module = name[len("beacon:"):]
+            else:
+                modules.extend([name] * count)
+        return cls(machine, modules, beacons, beacon_module)
+
+    @property
+    def name(self):
+        parts = [self.machine]
+        for module in dict.fromkeys(self.modules):
+            count = self.modules.count(module)
+            parts.append(module if count == 1 else f"{count}*{module}")
+        if self.beacons:
+            parts.append(f"{self.beacons}*beacon:{self.beacon_module}")
+        return "+".join(parts)
+
+    def __repr__(self):
+        return f"MachineConfig {self.name}"
+
+    def __eq__(self, other):
+        return isinstance(other, MachineConfig) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def get_bonus(self, effect):
+        """
+        Add up the effect (speed, productivity or energy) of the modules
+        and beacons
+        """
+        bonus = sum(module_types[module][effect] for module in self.modules)
+        if self.beacons:
+            bonus += (self.beacons * beacon_module_slots * beacon_effectivity *
+                      module_types[self.beacon_module][effect])
+        return bonus
+
+    @property
+    def produced_by(self):
+        return machine_types[self.machine]["produced_by"]
+
+    @property
+    def crafting_speed(self):
+        return machine_types[self.machine]["crafting_speed"] * max(
+            min_speed_factor, 1 + self.get_bonus("speed"))
+
+    @property
+    def productivity(self):
+        return self.get_bonus("productivity")
+
+    @property
+    def power(self):
+        return (machine_types[self.machine]["power"] *
+                max(min_energy_factor, 1 + self.get_bonus("energy")) +
+                self.beacons * beacon_power)
+
+    def without_productivity(self):
+        """
+        Get the same MachineConfig with the productivity modules taken out
+        (for recipes that cannot use them)
+        """
+        return MachineConfig(
+            self.machine,
+            [module for module in self.modules
+             if not module_types[module]["productivity"]],
+            self.beacons, self.beacon_module)
+
+
+def get_productivity_items(recipes):
+    """
+    Get the set of items that productivity modules can be used to make:
+    intermediate products (taken to be the ingredients of other recipes)
+    and science packs
+    """
+    items = set()
+    for item, recipe in recipes.recipes.items():
+        items.update(recipe.ingredients)
+        if item.endswith("_science_pack"):
+            items.add(item)
+    return frozenset(items)
+
+
+def parse_machine_options(machine_args):
+    """
+    Read the --machine options (a list of TARGET=MACHINE strings, where
+    TARGET is a produced_by class or an item, and MACHINE is the name of a
+    MachineConfig) into a dictionary mapping targets to MachineConfigs
+    """
+    configs = {}
+    for machine_arg in machine_args:
+        target, _, text = machine_arg.partition("=")
+        if not target or not text:
+            raise ValueError(
+                f"Cannot read machine {machine_arg} (use TARGET=MACHINE, e.g. "
+                "furnace=electric_furnace+2*speed_module)")
+        configs[target] = MachineConfig.parse(text)
+    return configs
+
+
+def make_machine_settings(configs, recipes, crafting_speeds):
+    """
+    Get the arguments to give CraftingTree (or make_plan) to use the
+    machines in configs, a dictionary mapping produced_by classes (for every
+    recipe of that class) or items (for one recipe) to MachineConfigs. Items
+    take precedence over classes. Returns a tuple (crafting_speeds,
+    machine_classes, productivity), starting from the given crafting_speeds.
+
+    Productivity modules are taken out of a class's machines for the recipes
+    that cannot use them. A ValueError is raised if an item is given
+    productivity modules that it cannot use, or a machine of the wrong class.
+    """
+    classes = {recipe.produced_by for recipe in recipes.recipes.values()}
+    productivity_items = get_productivity_items(recipes)
+    crafting_speeds = dict(crafting_speeds)
+    machine_classes = {}
+    productivity = {}
+
+    for target, config in configs.items():
+        if target in classes:
+            if config.produced_by != target:
+                raise ValueError(f"{config.machine} cannot make {target} recipes")
+            crafting_speeds[target] = config.crafting_speed
+            if not config.productivity:
+                continue
+            without_productivity = config.without_productivity()
+            for item, recipe in recipes.recipes.items():
+                if recipe.produced_by != target or item in configs:
+                    continue
+                if item in productivity_items:
+                    productivity[item] = config.productivity
+                else:
+                    machine_classes[item] = without_productivity.name
+                    crafting_speeds[without_productivity.name] = (
+                        without_productivity.crafting_speed)
+
+        elif target in recipes.recipes:
+            produced_by = recipes.recipes[target].produced_by
+            if config.produced_by != produced_by:
+                raise ValueError(
+                    f"{target} is made by a {produced_by}, not a {config.machine}")
+            if config.productivity and target not in productivity_items:
+                raise ValueError(
+                    f"Productivity modules cannot be used to make {target}")
+            machine_classes[target] = config.name
+            crafting_speeds[config.name] = config.crafting_speed
+            if config.productivity:
+                productivity[target] = config.productivity
+
+        else:
+            raise ValueError(
+                f"{target} is neither a machine class nor an item with a recipe")
+
+    return crafting_speeds, machine_classes, productivity
+
+
+def make_layouts(produced_by, machine_names=None, module_names=None,
+                 beacon_counts=(0,), beacon_module="speed_module_3"):
+    """
+    Get the MachineConfigs that can make recipes of the produced_by class:
+    each machine (of machine_names, default all), with its module slots
+    empty or full of one of module_names (default all), and with each of
+    beacon_counts beacons full of beacon_module (machines without module
+    slots are not affected by beacons)
+    """
+    if module_names is None:
+        module_names = list(module_types)
+    layouts = []
+    for machine, machine_type in machine_types.items():
+        if machine_type["produced_by"] != produced_by:
+            continue
+        if machine_names is not None and machine not in machine_names:
+            continue
+        slots = machine_type["module_slots"]
+        fills = [[]]
+        if slots:
+            fills += [[module] * slots for module in module_names]
+        for modules in fills:
+            for beacons in (beacon_counts if slots else (0,)):
+                layouts.append(MachineConfig(machine, modules, beacons,
+                                             beacon_module if beacons else None))
+    return layouts
+
+
+def get_best_index(primary, secondary):
+    """
+    Get the index of the smallest value of primary, using secondary to
+    choose between (almost) equal values
+    """
+    # Imported here (see the imports at the top)
+    import numpy as np
+
+    best = np.flatnonzero(primary <= primary.min() * (1 + 1e-9) + 1e-12)
+    return best[np.argmin(secondary[best])]
+
+
+class ConfigurationSearch:
+    """
+    Evaluates many choices of layout (MachineConfig) for every recipe
+    needed to make item at throughput (items/second), as array operations.
+    The recipe data comes from the compiled recipes (CompiledRecipes), for
+    the items needed only. It has the attributes:
+    - assembled: the items with machines, in reverse topological order
+      (every item before its ingredients)
+    - layouts: dictionary mapping each produced_by class to its list of
+      MachineConfigs (from make_layouts)
+    - item_class: the produced_by class of each item in assembled
+
+    A choice of layouts is a row of ints, one per item in assembled, giving
+    the index of its layout in the list for its class (productivity
+    modules are taken out for the items that cannot use them). evaluate
+    gives the machines and power of a whole batch of choices at once.
+    """
+
+    def __init__(self, item, throughput, recipes, raw_materials,
+                 machine_names=None, module_names=None, beacon_counts=(0,),
+                 beacon_module="speed_module_3"):
+        # Imported here (see the imports at the top)
+        import numpy as np
+
+        raw_materials = frozenset(raw_materials)
+        if item in raw_materials:
+            raise ValueError(f"{item} is a raw material, so no machines are needed")
+        order = recipes.get_topological_order(item, raw_materials)
+        compiled = recipes.compile()
+        productivity_items = get_productivity_items(recipes)
+
+        self.item = item
+        self.throughput = throughput
+        self.assembled = [current for current in reversed(order)
+                          if current not in raw_materials or current == item]
+        position = {current: n for n, current in enumerate(order)}
+        self.num_items = len(order)
+        self.top = position[item]
+
+        self.layouts = {}
+        self.item_class = []
+        for current in self.assembled:
+            produced_by = recipes.get_recipe(current).produced_by
+            if produced_by not in self.layouts:
+                self.layouts[produced_by] = make_layouts(
+                    produced_by, machine_names, module_names, beacon_counts,
+                    beacon_module)
+                if not self.layouts[produced_by]:
+                    raise ValueError(f"No machines are allowed to make {produced_by} recipes")
+            self.item_class.append(produced_by)
+
+        # For each assembled item: its position, time per run, items made
+        # per run, ingredient positions and amounts used per item made
+        # (without productivity), and the crafting speed, productivity and
+        # power of each of its layouts
+        self.positions = []
+        self.time = []
+        self.num_produced = []
+        self.ingredient_positions = []
+        self.ingredient_amounts = []
+        self.speed = []
+        self.productivity = []
+        self.power = []
+        matrix = compiled.ingredient_matrix
+        for current, produced_by in zip(self.assembled, self.item_class):
+            i = compiled.index[current]
+            row = slice(matrix.indptr[i], matrix.indptr[i + 1])
+            self.positions.append(position[current])
+            self.time.append(compiled.time[i])
+            self.num_produced.append(compiled.num_produced[i])
+            self.ingredient_positions.append(
+                np.array([position[compiled.items[j]] for j in matrix.indices[row]], dtype=int))
+            self.ingredient_amounts.append(matrix.data[row])
+
+            layouts = self.layouts[produced_by]
+            if current not in productivity_items:
+                layouts = [layout.without_productivity() for layout in layouts]
+            self.speed.append(np.array([layout.crafting_speed for layout in layouts]))
+            self.productivity.append(np.array([layout.productivity for layout in layouts]))
+            self.power.append(np.array([layout.power for layout in layouts]))
+
+    def get_layout(self, n, choice):
+        """
+        Get the MachineConfig of layout choice for the nth assembled item
+        """
+        layout = self.layouts[self.item_class[n]][choice]
+        if self.productivity[n][choice] == 0:
+            layout = layout.without_productivity()
+        return layout
+
+    def evaluate(self, choices):
+        """
+        Work out the number of machines and the power of every item in
+        assembled, for each row of choices (an array of shape (number of
+        choices, number of assembled items)). Returns a tuple (machines,
+        power) of arrays of that shape.
+        """
+        # Imported here (see the imports at the top)
+        import numpy as np
+
+        num_choices = len(choices)
+        throughputs = np.zeros((num_choices, self.num_items))
+        throughputs[:, self.top] = self.throughput
+        machines = np.empty(choices.shape)
+        power = np.empty(choices.shape)
+        for n in range(len(self.assembled)):
+            choice = choices[:, n]
+
+            # Ingredient throughputs only depend on the productivity; the
+            # machines also depend on the crafting speed
+            made = throughputs[:, self.positions[n]] / (1 + self.productivity[n][choice])
+            throughputs[:, self.ingredient_positions[n]] += (
+                made[:, None] * self.ingredient_amounts[n][None, :])
+            machines[:, n] = (made * self.time[n] /
+                              (self.num_produced[n] * self.speed[n][choice]))
+            power[:, n] = self.power[n][choice]
+        return machines, machines * power
+
+    def get_costs(self, choices, minimize, round_up):
+        """
+        Get the total number of machines and total power (kW) for each row
+        of choices, as (primary, secondary) cost arrays in the order given
+        by minimize ("machines" or "power"). If round_up is true, the
+        machines of each item are rounded up to a whole number.
+        """
+        # Imported here (see the imports at the top)
+        import numpy as np
+
+        machines, power = self.evaluate(choices)
+        if round_up:
+            power *= np.ceil(machines - 1e-9) / np.maximum(machines, 1e-300)
+            machines = np.ceil(machines - 1e-9)
+        total_machines = machines.sum(axis=1)
+        total_power = power.sum(axis=1)
+        if minimize == "machines":
+            return total_machines, total_power
+        return total_power, total_machines
+
+
+def search_configurations(item, throughput, recipes, raw_materials,
+                          minimize="machines", machine_names=None,
+                          module_names=None, beacon_counts=(0,),
+                          beacon_module="speed_module_3", round_up=False,
+                          max_passes=10):
+    """
+    Find the layout (MachineConfig) for every recipe needed to make item at
+    throughput (items/second) from raw_materials with the fewest machines
+    (minimize="machines") or the least power (minimize="power"), choosing
+    from the layouts of make_layouts (see its arguments). Ties are broken
+    by the other one. If round_up is true, whole numbers of machines are
+    counted.
+
+    The search first tries every combination of one layout per machine
+    class (if there are at most max_class_combinations), and then changes
+    the layout of one item at a time, trying all its layouts at once and
+    keeping the best, until nothing improves (or max_passes passes over the
+    items have been made). The result is not always the best possible, as
+    items are changed one at a time.
+
+    Returns a dictionary with:
+    - configs: dictionary mapping each item with machines to its
+      MachineConfig (can be given to make_machine_settings)
+    - machines: dictionary mapping each item to its number of machines
+    - power: dictionary mapping each item to the power (kW) of its machines
+    - total_machines, total_power: the totals
+    - num_evaluated: the number of choices of layouts evaluated
+    """
+    # Imported here (see the imports at the top)
+    import numpy as np
+
+    if minimize not in ("machines", "power"):
+        raise ValueError(f"Cannot minimize {minimize} (use machines or power)")
+    search = ConfigurationSearch(item, throughput, recipes, raw_materials,
+                                 machine_names, module_names, beacon_counts,
+                                 beacon_module)
+    classes = list(search.layouts)
+    class_columns = np.array([classes.index(produced_by)
+                              for produced_by in search.item_class])
+    num_evaluated = 0
+
+    # Step 1: the same layout for every item of each machine class
+    best_choice = np.zeros(len(search.assembled), dtype=int)
+    num_combinations = np.prod([len(search.layouts[c]) for c in classes])
+    if num_combinations <= max_class_combinations:
+        combinations = itertools.product(*[range(len(search.layouts[c])) for c in classes])
+        best_cost = None
+        while True:
+            batch = np.array(list(itertools.islice(combinations, search_batch_size)),
+                             dtype=int).reshape(-1, len(classes))
+            if len(batch) == 0:
+                break
+            choices = batch[:, class_columns]
+            primary, secondary = search.get_costs(choices, minimize, round_up)
+            num_evaluated += len(choices)
+            best = get_best_index(primary, secondary)
+            if best_cost is None or (primary[best], secondary[best]) < best_cost:
+                best_cost = (primary[best], secondary[best])
+                best_choice = choices[best].copy()
+
+    # Step 2: one item at a time
+    primary, secondary = search.get_costs(best_choice[None, :], minimize, round_up)
+    best_cost = (primary[0], secondary[0])
+    for _ in range(max_passes):
+        improved = False
+        for n in range(len(search.assembled)):
+            choices = np.tile(best_choice, (len(search.speed[n]), 1))
+            choices[:, n] = np.arange(len(search.speed[n]))
+            primary, secondary = search.get_costs(choices, minimize, round_up)
+            num_evaluated += len(choices)
+            best = get_best_index(primary, secondary)
+            if (primary[best] < best_cost[0] * (1 - 1e-9) or
+                    (primary[best] <= best_cost[0] * (1 + 1e-9) and
+                     secondary[best] < best_cost[1] * (1 - 1e-9))):
+                best_cost = (primary[best], secondary[best])
+                best_choice = choices[best].copy()
+                improved = True
+        if not improved:
+            break
+
+    machines, power = search.evaluate(best_choice[None, :])
+    if round_up:
+        power *= np.ceil(machines - 1e-9) / np.maximum(machines, 1e-300)
+        machines = np.ceil(machines - 1e-9)
+    result = {
+        "configs": {},
+        "machines": {},
+        "power": {},
+        "total_machines": float(machines.sum()),
+        "total_power": float(power.sum()),
+        "num_evaluated": num_evaluated,
+    }
+    for n, current in enumerate(search.assembled):
+        result["configs"][current] = search.get_layout(n, best_choice[n])
+        result["machines"][current] = float(machines[0, n])
+        result["power"][current] = float(power[0, n])
+    return result
+
+
+def format_search_text(item, throughput, result):
+    """
+    Format the result of search_configurations as text
+    """
+    lines = [f"Machines to make {60.0*throughput} {item} per minute:"]
+    for current, config in result["configs"].items():
+        lines.append(f"  {current}: {result['machines'][current]:.1f} x {config.name} "
+                     f"({result['power'][current] / 1000:.2f} MW)")
+    lines.append(f"Total: {result['total_machines']:.1f} machines, "
+                 f"{result['total_power'] / 1000:.2f} MW")
+    return "\n".join(lines)
+
+
+class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
+                      argparse.RawDescriptionHelpFormatter):
+    pass
+
+
+if __name__ == "__main__":
+    from recipe import RecipeList
+    from planner import read_inputs_file
+
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=CustomFormatter)
+    parser.add_argument("item", help="the item to be made")
+    parser.add_argument("-r",
+                        "--rate",
+                        help="target item rate, in items per minute",
+                        type=float,
+                        default=60)
+    parser.add_argument("-i",
+                        "--inputs-file",
+                        help="relative path to the input items file",
+                        default="input_materials.txt")
+    parser.add_argument("-f",
+                        "--recipes-file",
+                        help="relative path to the recipes file",
+                        default="factorio_recipes.csv")
+    parser.add_argument("--minimize",
+                        help="what to minimize",
+                        choices=["machines", "power"],
+                        default="machines")
+    parser.add_argument("--machines",
+                        help="the machines that can be used (default: all)",
+                        nargs="+",
+                        choices=list(machine_types))
+    parser.add_argument("--modules",
+                        help="the modules that can be used (default: all; "
+                        "pass --modules on its own for no modules)",
+                        nargs="*",
+                        choices=list(module_types))
+    parser.add_argument("--beacons",
+                        help="numbers of beacons around each machine to try",
+                        nargs="+",
+                        type=int,
+                        default=[0])
+    parser.add_argument("--beacon-module",
+                        help="module in every beacon",
+                        default="speed_module_3")
+    parser.add_argument("--round-up",
+                        help="count whole numbers of machines",
+                        action="store_true")
+    parser.add_argument("--json",
+                        help="print the result as JSON",
+                        action="store_true")
+    args = parser.parse_args()
+
+    recipes = RecipeList(args.recipes_file)
+    throughput = args.rate / 60.0
+    result = search_configurations(
+        args.item, throughput, recipes, read_inputs_file(args.inputs_file),
+        args.minimize, args.machines, args.modules, args.beacons,
+        args.beacon_module, args.round_up)
+    if args.json:
+        result["configs"] = {current: config.name
+                             for current, config in result["configs"].items()}
+        print(json.dumps({"item": args.item, "output_throughput": throughput, **result},
+                         indent=2))
+    else:
+        print(format_search_text(args.item, throughput, result))
@@ -0,0 +1,392 @@
+from collections import OrderedDict
+import json
+import os
+import stat
+from recipe import RecipeList, CraftingTree, CombinedCraftingGraph
+from items import ItemResolver
+from ratios import ExactRecipes, get_machine_ratios, get_ceiled_machines
+from machines import (machine_types, parse_machine_options,
+                      make_machine_settings)
+
+# Functions for making a production plan (a CraftingTree or a
+# CombinedCraftingGraph) and summarising it as text or JSON, without
+# plotting anything. Only the pure-Python modules (recipe, items, ratios
+# and machines) are imported here, so this is quick to load; numpy and
+# scipy (for cyclic recipes) and pandas (to read a changed recipes csv)
+# are only imported by those modules when they are needed, and the
+# plotting libraries never are.
+
+# Crafting speed of each assembling machine tier (0 is crafting by hand)
+assembler_crafting_speed_map = {0: 1, 1: 0.5, 2: 0.75, 3: 1.25}
+
+
+def make_crafting_speeds(assembling_machine, furnace="stone_furnace"):
+    """
+    Make the crafting_speeds dictionary (mapping the produced_by column
+    of the recipes to a crafting speed) for an assembling machine tier and
+    a type of furnace (stone_furnace, steel_furnace or electric_furnace).
+    The other machine classes only have one machine each (see
+    machines.machine_types). Use machines.make_machine_settings for
+    modules, beacons and different machines for different recipes.
+    """
+    if machine_types.get(furnace, {}).get("produced_by") != "furnace":
+        raise ValueError(f"{furnace} is not a furnace")
+    crafting_speeds = {}
+    crafting_speeds["assembling_machine"] = assembler_crafting_speed_map[
+        assembling_machine]
+    crafting_speeds["furnace"] = machine_types[furnace]["crafting_speed"]
+    crafting_speeds["chemical_plant"] = machine_types["chemical_plant"]["crafting_speed"]
+    crafting_speeds["oil_refinery"] = machine_types["oil_refinery"]["crafting_speed"]
+    return crafting_speeds
+
+
+def read_inputs_file(inputs_file):
+    """
+    Read the list of input items (one per line)
+    """
+    with open(inputs_file) as f:
+        return f.read().splitlines()
+
+
+def make_plan(item, throughput, crafting_speeds, recipes, raw_materials,
+              combine=False, machine_classes=None, productivity=None):
+    """
+    Make the CraftingTree for item at throughput (items/second), or the
+    CombinedCraftingGraph if combine is true. Combined graphs can also be
+    made when the recipes contain cycles. machine_classes and productivity
+    are passed on (see CraftingTree).
+    """
+    if combine:
+        try:
+            return CombinedCraftingGraph.from_recipes(item, throughput,
+                                                      crafting_speeds, recipes,
+                                                      raw_materials,
+                                                      machine_classes,
+                                                      productivity)
+        except ValueError:
+            # Only solve the recipes as a linear system (which needs numpy
+            # and scipy) if they contain a cycle
+            if recipes.compile().order is not None:
+                raise
+            return CombinedCraftingGraph.from_steady_state(
+                item, throughput, crafting_speeds, recipes, raw_materials,
+                machine_classes, productivity)
+    else:
+        return CraftingTree(item, throughput, crafting_speeds, recipes,
+                            raw_materials, machine_classes=machine_classes,
+                            productivity=productivity)
+
+
+def get_raw_input_throughput(plan):
+    """
+    Get a dictionary mapping the raw materials of a CraftingTree or
+    CombinedCraftingGraph to the input throughput they are needed at
+    """
+    if isinstance(plan, CraftingTree):
+        return plan.total_raw_input_throughput()
+
+    # Raw materials are the nodes without any ingredients
+    assembled = {item for item, _ in plan.edges}
+    return {item: node["output_throughput"] for item, node in plan.nodes.items()
+            if item not in assembled}
+
+
+def summarise_plan(plan, recipes=None):
+    """
+    Get a summary of a CraftingTree or CombinedCraftingGraph which can be
+    printed or written as JSON. Returns a dictionary with:
+    - machines: a list of dictionaries with item, num_machines,
+      output_throughput and depth (the distance from the top of the tree;
+      always 0 for a combined graph), one per assembling node
+    - raw_input_throughput: dictionary mapping raw materials to the
+      required input throughput
+
+    If recipes (the RecipeList the plan was made from, or an ExactRecipes
+    made from it) is given, each
+    machine also has ceiled_machines (the whole number of machines needed)
+    and utilisation (the fraction of the time they are busy), worked out
+    exactly (see ratios.get_ceiled_machines).
+    """
+    machines = []
+    ceiled = {}
+    if recipes is not None:
+        try:
+            ceiled = get_ceiled_machines(plan, recipes,
+                                         get_machine_ratios(plan, recipes))
+        except ValueError:
+            # Plans of cyclic recipes (from a steady-state solve) have no
+            # exact machine counts, so they are left out
+            pass
+
+    if isinstance(plan, CraftingTree):
+        store = plan.store
+        depths = []
+        for node, parent in store.walk(plan.index):
+            depth = 0 if parent is None else depths[parent] + 1
+            depths.append(depth)
+            if store.num_children[node] > 0:
+                machines.append({
+                    "item": store.items[node],
+                    "num_machines": store.num_machines[node],
+                    "output_throughput": store.output_throughput[node],
+                    "depth": depth,
+                })
+                if node in ceiled:
+                    machines[-1]["ceiled_machines"], machines[-1][
+                        "utilisation"] = ceiled[node]
+    else:
+        assembled = {item for item, _ in plan.edges}
+        for item, node in plan.nodes.items():
+            if item in assembled:
+                machines.append({
+                    "item": item,
+                    "num_machines": node["num_machines"],
+                    "output_throughput": node["output_throughput"],
+                    "depth": 0,
+                })
+                if item in ceiled:
+                    machines[-1]["ceiled_machines"], machines[-1][
+                        "utilisation"] = ceiled[item]
+
+    return {
+        "machines": machines,
+        "raw_input_throughput": get_raw_input_throughput(plan),
+    }
+
+
+def format_plan_text(item, throughput, summary):
+    """
+    Format the summary of a plan (from summarise_plan) as text. In a tree,
+    the ingredients are indented under the item they are used for. The
+    whole number of machines and their utilisation are shown if the summary
+    has them.
+    """
+    lines = [f"Machines required to make {60.0*throughput} {item} per minute:"]
+    for machine in summary["machines"]:
+        indent = "  " * (machine["depth"] + 1)
+        ceiled = ""
+        if "ceiled_machines" in machine:
+            ceiled = (f" ({machine['ceiled_machines']} at "
+                      f"{machine['utilisation']:.0%})")
+        lines.append(f"{indent}{machine['item']}: "
+                     f"{machine['num_machines']:.1f} machines{ceiled}, "
+                     f"{machine['output_throughput']:.2f}/s")
+
+    lines.append("Raw input throughputs:")
+    for raw_material, throughput in summary["raw_input_throughput"].items():
+        lines.append(f"  {raw_material}: {throughput:.2f}/s")
+    return "\n".join(lines)
+
+
+def format_plan_json(item, throughput, summary):
+    """
+    Format the summary of a plan (from summarise_plan) as JSON
+    """
+    return json.dumps({"item": item, "output_throughput": throughput, **summary},
+                      indent=2)
+
+
+def parse_supply(supply_args):
+    """
+    Parse a list of "raw_material=throughput" strings (throughputs in
+    items/second) into a dictionary
+    """
+    supply = {}
+    for supply_arg in supply_args:
+        raw_material, separator, throughput = supply_arg.partition("=")
+        if not separator:
+            raise ValueError(
+                f"Supply {supply_arg} should look like raw_material=throughput")
+        supply[raw_material] = float(throughput)
+    return supply
+
+
+def format_capacity_text(max_rates):
+    """
+    Format maximum output rates (a dictionary mapping items to tuples
+    (rate, limiting_input), rate in items/second) as text, highest first
+    """
+    lines = []
+    for item, (rate, limiting_input) in sorted(max_rates.items(),
+                                               key=lambda entry: -entry[1][0]):
+        if limiting_input is None:
+            lines.append(f"{item}: unlimited (needs no raw materials)")
+        else:
+            lines.append(f"{item}: {60.0*rate:.2f} per minute ({rate:.3f}/s), "
+                         f"limited by {limiting_input}")
+    return "\n".join(lines)
+
+
+class Planner:
+    """
+    A long-lived planner, which keeps the RecipeList, the input items files
+    and the summaries of recent plans loaded between queries. This is used
+    by pyfactorio --serve to answer a stream of queries without paying for
+    process startup and loading the recipes each time.
+
+    A query is a dictionary with the keys:
+    - item: the item to make (aliases like greencircuit, and misspelt names
+      which are close enough to one item, are allowed; see ItemResolver)
+    - rate: target rate in items per minute (default 60)
+    - assembling_machine: assembling machine tier, 0 to 3 (default 1)
+    - furnace: stone_furnace, steel_furnace or electric_furnace (default:
+      the one given to the Planner)
+    - machines: dictionary mapping produced_by classes or items to machines
+      with modules and beacons, like {"electronic_circuit":
+      "assembling_machine_3+4*productivity_module_3"} (see
+      machines.make_machine_settings), used along with the ones given to
+      the Planner (the query takes precedence)
+    - combine: true to add up all the machines making each item (default false)
+    - inputs_file: the input items file (default: the one given to the Planner)
+    """
+
+    def __init__(self, recipes_file="factorio_recipes.csv",
+                 inputs_file="input_materials.txt", max_cached_plans=256,
+                 furnace="stone_furnace", machines=None):
+        self.recipes = RecipeList(recipes_file)
+        self.item_resolver = ItemResolver.from_recipe_list(self.recipes)
+        self.exact_recipes = ExactRecipes(self.recipes)
+        self.inputs_file = inputs_file
+
+        # Default machines for every query, checked now so that mistakes
+        # are found before any queries are answered
+        self.furnace = furnace
+        self.machines = dict(machines or {})
+        make_machine_settings(
+            parse_machine_options(f"{target}={config}"
+                                  for target, config in self.machines.items()),
+            self.recipes, make_crafting_speeds(1, furnace))
+
+        # Map from inputs file path to (modification time, list of inputs)
+        self.inputs = {}
+
+        # Summaries of the most recent plans, least recently used first
+        self.max_cached_plans = max_cached_plans
+        self.plan_cache = OrderedDict()
+
+    def get_inputs(self, inputs_file):
+        """
+        Get the list of input items in inputs_file, only reading it again
+        if it has changed since it was last read
+        """
+        modified_time = os.stat(inputs_file).st_mtime_ns
+        cached = self.inputs.get(inputs_file)
+        if cached is None or cached[0] != modified_time:
+            cached = (modified_time, read_inputs_file(inputs_file))
+            self.inputs[inputs_file] = cached
+        return cached[1]
+
+    def query(self, query):
+        """
+        Make the plan described by query (see the class docstring), and return
+        its summary (from summarise_plan) along with the item and output
+        throughput. Results are cached, so do not modify the returned
+        dictionary.
+        """
+        item = self.item_resolver.resolve(query["item"])
+        rate = float(query.get("rate", 60))
+        assembling_machine = int(query.get("assembling_machine", 1))
+        furnace = query.get("furnace", self.furnace)
+        machines = {**self.machines, **query.get("machines", {})}
+        combine = bool(query.get("combine", False))
+        inputs_file = query.get("inputs_file", self.inputs_file)
+        inputs = self.get_inputs(inputs_file)
+
+        key = (item, rate, assembling_machine, furnace,
+               tuple(sorted(machines.items())), combine, inputs_file,
+               self.inputs[inputs_file][0])
+        if key in self.plan_cache:
+            self.plan_cache.move_to_end(key)
+            return self.plan_cache[key]
+
+        if assembling_machine not in assembler_crafting_speed_map:
+            raise ValueError(
+                f"Assembling machine {assembling_machine} does not exist (use 0, 1, 2 or 3)")
+        throughput = rate / 60.0
+        crafting_speeds, machine_classes, productivity = make_machine_settings(
+            parse_machine_options(f"{target}={config}"
+                                  for target, config in machines.items()),
+            self.recipes, make_crafting_speeds(assembling_machine, furnace))
+        plan = make_plan(item, throughput, crafting_speeds, self.recipes,
+                         inputs, combine, machine_classes, productivity)
+        result = {
+            "item": item,
+            "output_throughput": throughput,
+            **summarise_plan(plan, self.exact_recipes)
+        }
+
+        self.plan_cache[key] = result
+        if len(self.plan_cache) > self.max_cached_plans:
+            self.plan_cache.popitem(last=False)
+        return result
+
+    def handle_line(self, line):
+        """
+        Answer one line of input. A JSON object is treated as a query, and
+        the answer is a JSON object on one line (with an "error" key if the
+        query failed). Anything else is read as "item [rate]" (like typing
+        at a prompt), and the answer is the plan as text.
+        """
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                return json.dumps(self.query(json.loads(line)))
+            except Exception as e:
+                return json.dumps({"error": str(e)})
+
+        words = line.split()
+        try:
+            query = {"item": words[0]}
+            if len(words) > 1:
+                query["rate"] = float(words[1])
+            result = self.query(query)
+            return format_plan_text(result["item"],
+                                    result["output_throughput"], result)
+        except Exception as e:
+            return f"Error: {e}"
+
+
+def serve_stream(planner, input_stream, output_stream):
+    """
+    Answer each line of input_stream (e.g. stdin) using planner.handle_line,
+    writing the answers to output_stream, until the input ends
+    """
+    for line in input_stream:
+        if line.strip():
+            output_stream.write(planner.handle_line(line) + "\n")
+            output_stream.flush()
+
+
+def make_unix_socket_server(planner, socket_path):
+    """
+    Make a server listening on the unix socket at socket_path, which answers
+    each line sent by a client using planner.handle_line. Call serve_forever()
+    on the result to start it. Connections are handled one at a time, so
+    the planner is never used from two threads at once.
+    """
+    import socketserver
+
+    class PlannerRequestHandler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode()
+                if line.strip():
+                    answer = planner.handle_line(line) + "\n"
+                    self.wfile.write(answer.encode())
+                    self.wfile.flush()
+
+    class PlannerServer(socketserver.UnixStreamServer):
+
+        def server_close(self):
+            super().server_close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    # Only remove a socket left behind by an earlier server, never any
+    # other kind of file
+    if os.path.lexists(socket_path):
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise ValueError(f"{socket_path} exists and is not a socket")
+        os.remove(socket_path)
+    return PlannerServer(socket_path, PlannerRequestHandler)
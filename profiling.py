@@ -0,0 +1,150 @@
+# Optional profiling of a run: the wall time spent in each phase (loading
+# the recipes, building the plan, laying out and drawing the graph, ...)
+# and counters (tree nodes created, recipes looked up, ...). Nothing is
+# recorded unless a profile has been started with start_profile, so the
+# phase and count calls spread through the other modules cost very little
+# in normal runs.
+#
+# Example:
+#
+#   profile = start_profile()
+#   recipes = RecipeList("factorio_recipes.csv")
+#   ...
+#   stop_profile()
+#   print(profile.format_table())
+
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+
+class Profile:
+    """
+    The phase timings and counters recorded during a run. Phases can be
+    nested; a nested phase is recorded under its full name, like
+    "plot/layout". The same phase can be entered more than once, in which
+    case the times are added up.
+    """
+
+    def __init__(self):
+        # Map from phase name to [number of calls, total seconds], in the
+        # order the phases were first entered
+        self.phases = {}
+        self.counters = {}
+
+        # Names of the phases currently running (innermost last)
+        self.phase_stack = []
+
+    @contextmanager
+    def phase(self, name):
+        self.phase_stack.append(name)
+        full_name = "/".join(self.phase_stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phase_stack.pop()
+            calls_and_time = self.phases.setdefault(full_name, [0, 0.0])
+            calls_and_time[0] += 1
+            calls_and_time[1] += elapsed
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            "phases": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.phases.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def format_table(self):
+        lines = [f"{'phase':<40} {'calls':>6} {'seconds':>9}"]
+        for name, (calls, seconds) in self.phases.items():
+            indent = "  " * name.count("/")
+            lines.append(f"{indent + name.split('/')[-1]:<40} {calls:>6} {seconds:>9.4f}")
+        lines.append(f"{'counter':<40} {'value':>16}")
+        for name, value in self.counters.items():
+            lines.append(f"{name:<40} {value:>16}")
+        return "\n".join(lines)
+
+    def format_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+# The profile being recorded (None when profiling is off)
+active_profile = None
+
+# Icon cache statistics when the profile was started (see stop_profile)
+icon_cache_start = None
+
+
+def get_icon_cache_info():
+    """
+    Get the cache statistics of icons.get_icon_array, if the icons module
+    has been loaded (it is not imported here, so that profiling a run which
+    does not draw anything does not load it)
+    """
+    icons = sys.modules.get("icons")
+    if icons is None:
+        return None
+    return icons.get_icon_array.cache_info()
+
+
+def start_profile():
+    """
+    Start recording phase timings and counters, and return the Profile
+    they are recorded in
+    """
+    global active_profile, icon_cache_start
+    active_profile = Profile()
+    icon_cache_start = get_icon_cache_info()
+    return active_profile
+
+
+def stop_profile():
+    """
+    Stop recording, add the icon cache hits and misses to the counters, and
+    return the Profile (None if no profile was started)
+    """
+    global active_profile
+    profile = active_profile
+    active_profile = None
+    if profile is None:
+        return None
+
+    icon_cache_info = get_icon_cache_info()
+    if icon_cache_info is not None:
+        hits = icon_cache_info.hits
+        misses = icon_cache_info.misses
+        if icon_cache_start is not None:
+            hits -= icon_cache_start.hits
+            misses -= icon_cache_start.misses
+        profile.count("icon cache hits", hits)
+        profile.count("icon cache misses", misses)
+    return profile
+
+
+@contextmanager
+def phase(name):
+    """
+    Time the code in a with block as the phase name, if a profile has been
+    started
+    """
+    if active_profile is None:
+        yield
+    else:
+        with active_profile.phase(name):
+            yield
+
+
+def count(name, n=1):
+    """
+    Add n to the counter name, if a profile has been started
+    """
+    if active_profile is not None:
+        active_profile.count(name, n)
@@ -0,0 +1,249 @@
+# Exact machine counts for plans (CraftingTrees and CombinedCraftingGraphs).
+# The numbers of machines in a plan are floats, so they drift (a count of
+# 3 can come out as 2.9999999999999996), which makes them hard to round up
+# or compare. Here every count is worked out again exactly from the
+# recipes, as a multiple of the top-level throughput, using ratios of
+# Python ints (numerator, denominator) kept in lowest terms. This is the
+# same arithmetic as fractions.Fraction, without the cost of making a
+# Fraction object for every operation.
+#
+# The smallest top-level throughput at which every count is a whole number
+# (the minimal perfect ratio) then follows from the LCM of the
+# denominators and the GCD of the numerators of the counts.
+#
+# Example:
+#
+#   tree = CraftingTree("electronic_circuit", 1, crafting_speeds, recipes,
+#                       raw_materials)
+#   # (10, 1) with assembling machine 1s, i.e. 600 per minute
+#   minimal_perfect_throughput(tree, recipes)
+#   get_ceiled_machines(tree, recipes)  # {node: (machines, utilisation)}
+
+from fractions import Fraction
+from math import gcd, lcm
+from recipe import CraftingTree
+
+# Largest denominator used when turning floats into ratios (see make_ratio)
+max_denominator = 10**6
+
+
+def make_ratio(x):
+    """
+    Get the ratio (numerator, denominator) closest to x with a denominator
+    of at most max_denominator. Numbers like 3.2 or 1/60 are not exact as
+    floats, so this recovers the ratio they were written as (16/5, 1/60).
+    """
+    if isinstance(x, int):
+        return (x, 1)
+    return Fraction(x).limit_denominator(max_denominator).as_integer_ratio()
+
+
+def multiply_ratios(a, b):
+    numerator = a[0] * b[0]
+    denominator = a[1] * b[1]
+    divisor = gcd(numerator, denominator)
+    return (numerator // divisor, denominator // divisor)
+
+
+def divide_ratios(a, b):
+    """
+    Divide the ratio a by the (positive) ratio b
+    """
+    return multiply_ratios(a, (b[1], b[0]))
+
+
+def add_ratios(a, b):
+    numerator = a[0] * b[1] + b[0] * a[1]
+    denominator = a[1] * b[1]
+    divisor = gcd(numerator, denominator)
+    return (numerator // divisor, denominator // divisor)
+
+
+class ExactRecipes:
+    """
+    The recipes of a RecipeList as exact ratios, made (and cached) the first
+    time each recipe is needed. For each item and productivity bonus,
+    get_recipe_ratios gives:
+    - the time per item made (recipe time / (num_produced * (1 +
+      productivity))), so that the number of machines for a throughput is
+      throughput * time per item / crafting speed
+    - a list of (ingredient, number used per item made), in the same order
+      as the recipe ingredients (and so the children of a CraftingTree node)
+    """
+
+    def __init__(self, recipes):
+        self.recipes = recipes
+        self.recipe_ratios = {}
+        self.speed_ratios = {}
+
+    def get_recipe_ratios(self, item, productivity=0):
+        key = (item, productivity)
+        if key not in self.recipe_ratios:
+            recipe = self.recipes.get_recipe(item)
+            num_produced = multiply_ratios(make_ratio(recipe.num_produced),
+                                           make_ratio(1 + productivity))
+            self.recipe_ratios[key] = (
+                divide_ratios(make_ratio(recipe.time), num_produced),
+                [(ingredient, divide_ratios(make_ratio(num_required), num_produced))
+                 for ingredient, num_required in recipe.ingredients.items()])
+        return self.recipe_ratios[key]
+
+    def get_machines_per_throughput(self, item, crafting_speed, productivity=0):
+        """
+        Get the number of machines needed for each item/second of item
+        """
+        if crafting_speed not in self.speed_ratios:
+            self.speed_ratios[crafting_speed] = make_ratio(crafting_speed)
+        time_per_item, _ = self.get_recipe_ratios(item, productivity)
+        return divide_ratios(time_per_item, self.speed_ratios[crafting_speed])
+
+
+def get_tree_machine_ratios(tree, exact_recipes):
+    """
+    Get a dictionary mapping each node (index in tree.store) of a
+    CraftingTree that has machines to its exact number of machines per
+    item/second of the top-level item. Every distinct node is visited once,
+    so shared (interned) subtrees are only worked out once.
+    """
+    store = tree.store
+    throughputs = {tree.index: (1, 1)}
+    machine_ratios = {}
+    stack = [tree.index]
+    while stack:
+        node = stack.pop()
+        if store.num_children[node] == 0:
+            continue
+        item = store.items[node]
+        crafting_speed = store.crafting_speeds[
+            store.machine_classes[store.machine_class[node]]]
+        productivity = store.productivity.get(item, 0)
+        machine_ratios[node] = multiply_ratios(
+            throughputs[node],
+            exact_recipes.get_machines_per_throughput(item, crafting_speed,
+                                                      productivity))
+
+        _, ingredient_ratios = exact_recipes.get_recipe_ratios(item, productivity)
+        for child, (_, num_used) in zip(store.get_children(node), ingredient_ratios):
+            if child not in throughputs:
+                throughputs[child] = multiply_ratios(throughputs[node], num_used)
+                stack.append(child)
+    return machine_ratios
+
+
+def get_graph_machine_ratios(graph, exact_recipes):
+    """
+    Get a dictionary mapping each item of a CombinedCraftingGraph that has
+    machines to its exact number of machines per item/second of the
+    top-level item. The items are visited in reverse topological order, like
+    in CombinedCraftingGraph.from_recipes, so a ValueError is raised if the
+    recipes contain a cycle.
+    """
+    raw_materials = frozenset(item for item, produced_by in graph.produced_by.items()
+                              if produced_by is None)
+    if graph.item in raw_materials:
+        return {}
+
+    throughputs = {graph.item: (1, 1)}
+    machine_ratios = {}
+    for item in reversed(exact_recipes.recipes.get_topological_order(
+            graph.item, raw_materials)):
+        if item in raw_materials:
+            continue
+        productivity = graph.productivity.get(item, 0)
+        machine_ratios[item] = multiply_ratios(
+            throughputs[item],
+            exact_recipes.get_machines_per_throughput(
+                item, graph.crafting_speeds[graph.produced_by[item]],
+                productivity))
+
+        _, ingredient_ratios = exact_recipes.get_recipe_ratios(item, productivity)
+        for ingredient, num_used in ingredient_ratios:
+            ingredient_throughput = multiply_ratios(throughputs[item], num_used)
+            if ingredient in throughputs:
+                ingredient_throughput = add_ratios(throughputs[ingredient],
+                                                   ingredient_throughput)
+            throughputs[ingredient] = ingredient_throughput
+    return machine_ratios
+
+
+def get_machine_ratios(plan, recipes):
+    """
+    Get the exact number of machines per item/second of the top-level item,
+    for each node of a CraftingTree (see get_tree_machine_ratios) or item of
+    a CombinedCraftingGraph (see get_graph_machine_ratios). recipes is the
+    RecipeList the plan was made from, or an ExactRecipes made from it (to
+    share its cache between plans).
+    """
+    if not isinstance(recipes, ExactRecipes):
+        recipes = ExactRecipes(recipes)
+    if isinstance(plan, CraftingTree):
+        return get_tree_machine_ratios(plan, recipes)
+    return get_graph_machine_ratios(plan, recipes)
+
+
+def get_perfect_throughput(machine_ratios):
+    """
+    Get the smallest top-level throughput (as a ratio) at which all the
+    machine_ratios (numbers of machines per item/second, from
+    get_machine_ratios) give a whole number of machines. For ratios p/q in
+    lowest terms, this is the LCM of the qs divided by the GCD of the ps.
+    Returns None if there are no machines.
+    """
+    numerators = [numerator for numerator, _ in machine_ratios.values() if numerator != 0]
+    if not numerators:
+        return None
+    denominators = [denominator for numerator, denominator in machine_ratios.values()
+                    if numerator != 0]
+    numerator = lcm(*denominators)
+    denominator = gcd(*numerators)
+    divisor = gcd(numerator, denominator)
+    return (numerator // divisor, denominator // divisor)
+
+
+def minimal_perfect_throughput(plan, recipes):
+    """
+    Get the smallest throughput (in items/second, as a ratio) of the
+    top-level item of plan at which every machine count in it is a whole
+    number. Every multiple of it is perfect as well. Raises a ValueError if
+    the plan has no machines.
+    """
+    throughput = get_perfect_throughput(get_machine_ratios(plan, recipes))
+    if throughput is None:
+        raise ValueError("The plan does not have any machines")
+    return throughput
+
+
+def round_up_throughput(throughput, perfect_throughput):
+    """
+    Get the smallest multiple of perfect_throughput (a ratio) that is at
+    least throughput (items/second, a float), as a ratio
+    """
+    numerator, denominator = divide_ratios(make_ratio(throughput), perfect_throughput)
+    multiple = max(1, -(-numerator // denominator))
+    return multiply_ratios((multiple, 1), perfect_throughput)
+
+
+def get_ceiled_machines(plan, recipes, machine_ratios=None):
+    """
+    Get the number of whole machines needed at each node of a CraftingTree
+    (by node index) or item of a CombinedCraftingGraph, at the current
+    throughput of the plan. Returns a dictionary mapping each node or item
+    with machines to (ceiled number of machines, utilisation), where the
+    utilisation is the fraction of the time those machines are busy.
+    machine_ratios (from get_machine_ratios) can be passed in if they have
+    already been worked out.
+    """
+    if machine_ratios is None:
+        machine_ratios = get_machine_ratios(plan, recipes)
+    if isinstance(plan, CraftingTree):
+        throughput = make_ratio(plan.output_throughput)
+    else:
+        throughput = make_ratio(plan.nodes[plan.item]["output_throughput"])
+
+    ceiled = {}
+    for key, machine_ratio in machine_ratios.items():
+        numerator, denominator = multiply_ratios(throughput, machine_ratio)
+        num_machines = -(-numerator // denominator)
+        ceiled[key] = (num_machines,
+                       numerator / (denominator * num_machines) if num_machines else 0.0)
+    return ceiled
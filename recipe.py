@@ -1,10 +1,15 @@
+from array import array
 from collections import Counter
-import pandas as pd
-import networkx as nx
-from icons import get_icon
+import hashlib
+import os
+import pickle
+from profiling import phase, count
 
 # Basically the everything file.
 
+# Bump this if the layout of the recipes cache file changes
+recipes_cache_version = 1
+
 def scale_dictionary(d, scale):
     """
     Multiply all the values in dictionary d
@@ -31,15 +36,30 @@ class Recipe:
     etc.
     """
 
-    def __init__(self, item_dataframe):
-        self.item = item_dataframe.iloc[0]["item"]
-        self.num_produced = item_dataframe.iloc[0]["num_produced"]
-        self.time = item_dataframe.iloc[0]["time"]
-        self.produced_by = item_dataframe.iloc[0]["produced_by"]
+    def __init__(self, item, num_produced, time, produced_by, ingredients):
+        self.item = item
+        self.num_produced = num_produced
+        self.time = time
+        self.produced_by = produced_by
 
         # dictionary mapping item name to number required
-        self.ingredients = dict(
-            zip(item_dataframe["resource"], item_dataframe["quantity"]))
+        self.ingredients = ingredients
+
+    @classmethod
+    def from_dataframe(cls, item_dataframe):
+        """
+        Make the recipe from the rows of the recipes csv file for one item
+        (one row per ingredient). The numbers are converted to plain Python
+        ints and floats.
+        """
+        first_row = item_dataframe.iloc[0]
+        return cls(
+            str(first_row["item"]),
+            item_dataframe["num_produced"].iloc[0].item(),
+            item_dataframe["time"].iloc[0].item(),
+            str(first_row["produced_by"]),
+            dict(zip(item_dataframe["resource"].tolist(),
+                     item_dataframe["quantity"].tolist())))
 
     def __repr__(self):
         """
@@ -49,7 +69,8 @@ class Recipe:
             f"Recipe for {self.num_produced} {self.item} in {self.time}s, "
             + f"using {self.ingredients}")
 
-    def machines_required(self, desired_throughput, crafting_speed=1):
+    def machines_required(self, desired_throughput, crafting_speed=1,
+                          productivity=0):
         """
         Calculate the number of machines required to get throughput items/second
         from this recipe. crafting_speed is 1 (for human), 
@@ -58,9 +79,12 @@ class Recipe:
         1 chemical plant
         1 oil refinery
 
-        Note: modules change the crafting speed
+        Note: modules change the crafting speed (see machines.py). Productivity
+        modules also add a productivity bonus (e.g. 0.4 for +40%), which is
+        the fraction of extra items made by each run of the recipe.
         """
-        return desired_throughput * self.recipe_time(crafting_speed) / self.num_produced
+        return (desired_throughput * self.recipe_time(crafting_speed) /
+                (self.num_produced * (1 + productivity)))
 
     def recipe_time(self, crafting_speed):
         """
@@ -76,6 +100,68 @@ class Recipe:
         return self.time / crafting_speed
 
 
+def read_recipes_csv(factorio_recipes_csv):
+    """
+    Read the recipes csv file using pandas, and return a dictionary mapping
+    item names to Recipes
+    """
+    # Imported here, because pandas is slow to import and is only needed
+    # when the recipes cache is out of date
+    import pandas as pd
+
+    factorio_recipes = pd.read_csv(factorio_recipes_csv)
+    recipes = {}
+    for item, group in factorio_recipes.groupby("item"):
+        recipes[item] = Recipe.from_dataframe(group)
+    return recipes
+
+
+def make_recipes_cache_path(factorio_recipes_csv):
+    return os.fspath(factorio_recipes_csv) + ".cache"
+
+
+def load_recipes(factorio_recipes_csv):
+    """
+    Get a dictionary mapping item names to Recipes from the recipes csv
+    file. The recipes are saved in a binary cache file next to the csv file
+    (see make_recipes_cache_path), along with a hash of the csv contents.
+    If the hash still matches, the recipes are loaded from the cache
+    without parsing the csv (or importing pandas); otherwise, the csv is
+    read and the cache is rebuilt.
+    """
+    with open(factorio_recipes_csv, "rb") as f:
+        csv_hash = hashlib.sha256(f.read()).hexdigest()
+    cache_path = make_recipes_cache_path(factorio_recipes_csv)
+
+    try:
+        with open(cache_path, "rb") as f:
+            version, cached_hash, recipe_fields = pickle.load(f)
+        if version == recipes_cache_version and cached_hash == csv_hash:
+            return {fields[0]: Recipe(*fields) for fields in recipe_fields}
+    except Exception:
+        # Missing or unreadable cache, so just rebuild it
+        pass
+
+    recipes = read_recipes_csv(factorio_recipes_csv)
+    recipe_fields = [(recipe.item, recipe.num_produced, recipe.time,
+                      recipe.produced_by, recipe.ingredients)
+                     for recipe in recipes.values()]
+
+    # Write to a temporary file first, so that a half-written cache is never
+    # read. Failing to write the cache (e.g. read-only directory) is not an
+    # error, it just means it will be rebuilt next time.
+    try:
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            pickle.dump((recipes_cache_version, csv_hash, recipe_fields), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        pass
+
+    return recipes
+
+
 class RecipeList:
     """
     A list of all the recipes, along with methods for performing common
@@ -83,50 +169,170 @@ class RecipeList:
     """
 
     def __init__(self, factorio_recipes_csv):
-        factorio_recipes = pd.read_csv(factorio_recipes_csv)
-        self.recipes = {}
-        for item, group in factorio_recipes.groupby("item"):
-            self.recipes[item] = Recipe(group)
+        with phase("load recipes"):
+            self.recipes = load_recipes(factorio_recipes_csv)
+
+        # Per-unit raw material counts for every item visited so far,
+        # keyed on the frozen set of raw materials they were computed
+        # against (and the productivity bonuses, if there are any; see
+        # get_raw_material_counts)
+        self.raw_material_cache = {}
+        self.compiled_recipes = None
 
-    def get_raw_material_counts(self, item, raw_materials):
+    def compile(self):
         """
-        Get a dictionary of all the raw materials that are required to make
-        the given item, in terms of the raw_materials list.
+        Get the CompiledRecipes (sparse matrix form) for this recipe
+        list. It is only built the first time it is needed.
         """
-        item_recipe = self.get_recipe(item)
-        all_raw_materials = {}
-        for ingredient, num_required in item_recipe.ingredients.items():
+        if self.compiled_recipes is None:
+            # Imported here, so that numpy and scipy are only loaded
+            # when the compiled form is used
+            from compiled import CompiledRecipes
+            self.compiled_recipes = CompiledRecipes(self)
+        return self.compiled_recipes
+
+    def get_topological_order(self, item, raw_materials):
+        """
+        Get a list of all the items needed to make item (including
+        item itself and the raw materials it bottoms out in), where
+        every item appears after all of its ingredients. Each item is
+        only visited once, however many recipes use it. Raises a
+        ValueError if an item is needed (directly or indirectly) to make
+        itself; use CompiledRecipes.solve_steady_state for recipes like that.
+        """
+        raw_materials = frozenset(raw_materials)
+        order = []
+        visited = set()
+        finished = set()
+
+        # Explicit stack of (item, expanded) pairs, so that deep recipe
+        # chains do not run into the recursion limit. An item is
+        # appended to the order on the way back up (once all its
+        # ingredients have been appended). Items that have been visited
+        # but not finished are the ones on the current path from the top,
+        # so reaching one of them again means there is a cycle.
+        stack = [(item, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if expanded:
+                order.append(current)
+                finished.add(current)
+                continue
+            if current in visited:
+                continue
+            visited.add(current)
+            stack.append((current, True))
 
-            # If self is a raw material, then return the num_required
-            if ingredient in raw_materials:
-                scaled_ingredient_raw_materials = {ingredient: num_required}
-            else:
-                ingredient_raw_materials = self.get_raw_material_counts(
-                    ingredient, raw_materials)
-                scaled_ingredient_raw_materials = scale_dictionary(
-                    ingredient_raw_materials, num_required)
+            # Raw materials are leaves, even if there is a recipe for them
+            # (the top-level item is always expanded, like in
+            # get_raw_material_counts)
+            if current in raw_materials and current != item:
+                continue
+            for ingredient in reversed(list(self.get_recipe(current).ingredients)):
+                if ingredient not in visited:
+                    stack.append((ingredient, False))
+                elif ingredient not in finished:
+                    raise ValueError(
+                        f"The recipes contain a cycle: {ingredient} is needed "
+                        f"to make itself (through {current})")
 
-            all_raw_materials = add_dictionaries(
-                all_raw_materials, scaled_ingredient_raw_materials)
+        return order
 
-        return scale_dictionary(all_raw_materials,
-                                1.0 / item_recipe.num_produced)
+    def get_raw_material_counts(self, item, raw_materials, productivity=None):
+        """
+        Get a dictionary of all the raw materials that are required to make
+        the given item, in terms of the raw_materials list. productivity
+        maps items to productivity bonuses (like in CraftingTree): a recipe
+        with a bonus p makes 1 + p times as many items from its ingredients.
+
+        The per-unit counts of every intermediate item are memoized (keyed
+        on the set of raw materials and the productivity bonuses), so that
+        each recipe is only expanded once, and repeated queries are just a
+        dictionary lookup.
+        """
+        raw_materials = frozenset(raw_materials)
+        productivity = productivity or {}
+        key = raw_materials
+        if productivity:
+            key = (raw_materials, frozenset(productivity.items()))
+        cache = self.raw_material_cache.setdefault(key, {})
+
+        if item not in cache:
+            for current in self.get_topological_order(item, raw_materials):
+                if current in cache:
+                    continue
+                if current in raw_materials and current != item:
+                    continue
+
+                # All the ingredients are already in the cache, because
+                # they come earlier in the topological order
+                current_recipe = self.get_recipe(current)
+                counts = {}
+                for ingredient, num_required in current_recipe.ingredients.items():
+                    if ingredient in raw_materials:
+                        counts[ingredient] = counts.get(ingredient, 0) + num_required
+                    else:
+                        for raw_material, count in cache[ingredient].items():
+                            counts[raw_material] = (counts.get(raw_material, 0)
+                                                    + count * num_required)
+                cache[current] = scale_dictionary(
+                    counts, 1.0 / (current_recipe.num_produced
+                                   * (1 + productivity.get(current, 0))))
+
+        # Return a copy, so that the caller can modify it without
+        # corrupting the cache
+        return dict(cache[item])
+
+    def max_output_rate(self, item, supply, raw_materials, productivity=None):
+        """
+        Get the highest throughput of item (items/second) that can be made
+        from supply, a dictionary mapping raw materials to the throughput
+        available (items/second; raw materials that are not in supply are
+        not available at all). Returns a tuple (rate, limiting_input), where
+        limiting_input is the raw material that runs out first (rate is
+        infinite and limiting_input is None if no raw materials are needed).
+        Every item in supply is treated as a raw material, along with
+        raw_materials (so plates can be supplied when the raw materials
+        are ores). productivity is used like in get_raw_material_counts.
+        """
+        raw_materials = frozenset(raw_materials) | frozenset(supply)
+        rate = float("inf")
+        limiting_input = None
+        for raw_material, count in self.get_raw_material_counts(
+                item, raw_materials, productivity).items():
+            if count <= 0:
+                continue
+            raw_material_rate = supply.get(raw_material, 0) / count
+            if raw_material_rate < rate:
+                rate = raw_material_rate
+                limiting_input = raw_material
+        return rate, limiting_input
 
     def get_item_dependencies(self, item, raw_materials):
         """
         Get the tree of recipe dependencies for the given item, down to the raw_materials
         specified. Returns a nested dictionary mapping ingredients to lists of their ingredients
-        (raw materials map to empty lists)        """
-        item_recipe = self.get_recipe(item)
+        (raw materials map to empty lists). Raises a ValueError if the recipes
+        contain a cycle.
+        """
+        raw_materials = frozenset(raw_materials)
+
+        # Check for cycles first, so that the expansion below always ends
+        self.get_topological_order(item, raw_materials)
+
+        # Explicit stack of (item, dictionary to fill with its ingredients),
+        # so that deep recipe chains do not run into the recursion limit
         item_dependencies = {}
-        for ingredient in item_recipe.ingredients:
+        stack = [(item, item_dependencies)]
+        while stack:
+            current, dependencies = stack.pop()
+            for ingredient in self.get_recipe(current).ingredients:
 
-            # If self is a raw material, then it has an empty list of dependencies
-            if ingredient in raw_materials:
-                item_dependencies[ingredient] = {}
-            else:
-                item_dependencies[ingredient] = self.get_item_dependencies(
-                    ingredient, raw_materials)
+                # If the ingredient is a raw material, then it has an empty
+                # list of dependencies
+                dependencies[ingredient] = {}
+                if ingredient not in raw_materials:
+                    stack.append((ingredient, dependencies[ingredient]))
 
         return item_dependencies
 
@@ -135,6 +341,7 @@ class RecipeList:
         Get the Recipe corresponding to item. Raises a ValueError if the item
         does not exist
         """
+        count("recipe lookups")
         try:
             return self.recipes[item]
         except:
@@ -170,6 +377,148 @@ class RecipeList:
         return assembler_counts
 
 
+class CraftingTreeStore:
+    """
+    Compact storage for all the nodes of a CraftingTree, as a structure of
+    arrays (instead of one Python object per node). The nodes are numbered
+    in depth-first (pre-)order, and node n has:
+    - items[n]: the item name that this node makes
+    - output_throughput[n]: the number of items per second that this node makes
+    - num_machines[n]: the number of machines required at this node
+    - first_child[n], num_children[n]: the position and number of the
+      node's ingredients in the children array
+    - children: the indices of the ingredient nodes of all the nodes
+    - machine_class[n]: the index in machine_classes of the produced_by
+      machine class of the node's recipe (-1 for raw materials)
+    - crafting_speeds: the crafting speeds the machine counts were worked
+      out with
+    - productivity: the productivity bonus of each item's recipe (items
+      that are not in it have none)
+
+    If interned is true, identical subtrees are only stored once (several
+    nodes may have the same node as an ingredient), so the store holds a DAG
+    rather than a tree. Walking it still visits every path, so it looks like
+    a tree from the outside. The raw input throughputs of shared subtrees are
+    memoized in raw_input_cache.
+    """
+
+    __slots__ = ("items", "output_throughput", "num_machines", "first_child",
+                 "num_children", "children", "machine_class",
+                 "machine_classes", "crafting_speeds", "productivity",
+                 "interned", "raw_input_cache")
+
+    def __init__(self, crafting_speeds, interned=False, productivity=None):
+        self.crafting_speeds = dict(crafting_speeds)
+        self.productivity = dict(productivity or {})
+        self.interned = interned
+        self.raw_input_cache = {}
+        self.items = []
+        self.output_throughput = array("d")
+        self.num_machines = array("d")
+        self.first_child = array("i")
+        self.num_children = array("i")
+        self.children = array("i")
+        self.machine_class = array("i")
+        self.machine_classes = []
+
+    def get_machine_class_index(self, produced_by):
+        """
+        Get the index of the produced_by machine class in machine_classes,
+        adding it if it is not there yet
+        """
+        if produced_by not in self.machine_classes:
+            self.machine_classes.append(produced_by)
+        return self.machine_classes.index(produced_by)
+
+    def rescale(self, scale):
+        """
+        Multiply the output throughputs and numbers of machines of every
+        node by scale (as one array operation over each array)
+        """
+        # Imported here, so that numpy is only loaded when it is needed.
+        # frombuffer makes a view of the arrays, so they are updated in place
+        import numpy as np
+        np.frombuffer(self.output_throughput)[:] *= scale
+        np.frombuffer(self.num_machines)[:] *= scale
+        self.raw_input_cache.clear()
+
+    def update_speeds(self, crafting_speeds):
+        """
+        Change the crafting speed of some of the machine classes. crafting_speeds
+        maps produced_by machine classes to their new crafting speed. Only the
+        number of machines changes (it is inversely proportional to the crafting
+        speed); the throughputs do not depend on the crafting speed.
+        """
+        import numpy as np
+        machine_class = np.frombuffer(self.machine_class, dtype=np.intc)
+        num_machines = np.frombuffer(self.num_machines)
+        for produced_by, crafting_speed in crafting_speeds.items():
+            if produced_by in self.machine_classes:
+                nodes = machine_class == self.machine_classes.index(produced_by)
+                num_machines[nodes] *= self.crafting_speeds[
+                    produced_by] / crafting_speed
+            self.crafting_speeds[produced_by] = crafting_speed
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_children(self, index):
+        """
+        Get the node indices of the ingredients of node index
+        """
+        first_child = self.first_child[index]
+        return self.children[first_child:first_child + self.num_children[index]]
+
+    def get_raw_input_throughput(self, index):
+        """
+        Get the total output throughput of each raw material (leaf) in the
+        subtree under node index, memoized for every node visited. This is
+        used for interned stores, where the same subtree is shared by many
+        nodes. Do not modify the returned dictionary.
+        """
+        cache = self.raw_input_cache
+
+        # Explicit stack for a post-order walk: a node is totalled once
+        # all of its children are in the cache
+        stack = [(index, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in cache:
+                continue
+            children = self.get_children(node)
+            if len(children) == 0:
+                cache[node] = {self.items[node]: self.output_throughput[node]}
+            elif expanded:
+                total_throughput = {}
+                for child in children:
+                    for item, throughput in cache[child].items():
+                        total_throughput[item] = (total_throughput.get(item, 0)
+                                                  + throughput)
+                cache[node] = total_throughput
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children
+                             if child not in cache)
+        return cache[index]
+
+    def walk(self, index):
+        """
+        Walk the subtree under node index in depth-first (pre-)order, using
+        an explicit stack. Yields (node, parent) pairs, where node is a node
+        index and parent is the position in the walk (0 for the first node
+        yielded) of the node's parent, or None for the first node.
+        """
+        position = 0
+        stack = [(index, None)]
+        while stack:
+            node, parent = stack.pop()
+            yield node, parent
+            # Children are pushed in reverse so they come off the stack in order
+            for child in reversed(self.get_children(node)):
+                stack.append((child, position))
+            position += 1
+
+
 class CraftingTree:
     """
     This is the tree of machines required to generate a particular throughput of
@@ -182,109 +531,254 @@ class CraftingTree:
     - num_machines: the number of machines required at this node to sustain this throughput
     - ingredients: a list of CraftingTrees making dependencies of this item
 
+    The nodes are stored in a CraftingTreeStore (store) shared by the whole
+    tree, and a CraftingTree object is just a view of one node (index) in it,
+    so the attributes above are read from the store when they are used. The
+    tree is built without recursion, so its depth is not limited.
+
+    If interned is true, nodes with the same item, output throughput and
+    crafting speed are only built once and shared between all the places
+    they appear (see CraftingTreeStore), so large trees only need memory
+    for the distinct subtrees.
+
+    A ValueError is raised if the recipes contain a cycle (the tree would
+    be infinite); CombinedCraftingGraph.from_steady_state can handle those.
+
+    By default, every recipe is made by its produced_by machine class, at
+    the crafting speed of that class in crafting_speeds. machine_classes
+    can map items to other keys of crafting_speeds (e.g. a machine with
+    modules, see machines.make_machine_settings), and productivity can map
+    items to the productivity bonus of their recipe.
     """
 
+    __slots__ = ("store", "index")
+
     def __init__(self, item, throughput, crafting_speeds, recipes,
-                 raw_materials):
-        self.item = item
+                 raw_materials, interned=False, machine_classes=None,
+                 productivity=None):
+        self.store = CraftingTreeStore(crafting_speeds, interned, productivity)
+        self.index = 0
+        machine_classes = machine_classes or {}
+        productivity = self.store.productivity
+
+        # The tree of a cyclic recipe would never end, so check for cycles
+        # (this raises a ValueError) before building it
+        raw_materials = frozenset(raw_materials)
+        if item not in raw_materials:
+            recipes.get_topological_order(item, raw_materials)
+
+        # Map from (item, output throughput, crafting speed) to the
+        # index of the node already built for it (only used if interned)
+        interned_nodes = {}
+
+        items = self.store.items
+        output_throughputs = self.store.output_throughput
+        num_machines = self.store.num_machines
+        first_child = self.store.first_child
+        num_children = self.store.num_children
+        children = self.store.children
+        machine_class = self.store.machine_class
+
+        # Stack of (item, output throughput, position in the children
+        # array where the node index must be written), in the order that
+        # the nodes will be created
+        stack = [(item, throughput, None)]
+        while stack:
+            current, output_throughput, slot = stack.pop()
+
+            if current in raw_materials:
+                item_recipe = None
+                crafting_speed = None
+            else:
+                item_recipe = recipes.get_recipe(current)
+                produced_by = machine_classes.get(current, item_recipe.produced_by)
+                crafting_speed = crafting_speeds[produced_by]
+
+            if interned:
+                key = (current, output_throughput, crafting_speed)
+                if key in interned_nodes:
+                    children[slot] = interned_nodes[key]
+                    continue
+                interned_nodes[key] = len(items)
+
+            node = len(items)
+            if slot is not None:
+                children[slot] = node
+            items.append(current)
+            output_throughputs.append(output_throughput)
+            first_child.append(len(children))
+
+            # If the item is a raw material, then set the number of machines to zero,
+            # but still save the output throughput. This corresponds to the raw material
+            # source throughput requirement
+            if item_recipe is None:
+                num_machines.append(0)
+                num_children.append(0)
+                machine_class.append(-1)
+                continue
+
+            machine_class.append(self.store.get_machine_class_index(produced_by))
 
-        # If the item is a raw material, then set the number of machines to zero,
-        # but still save the output throughput. This corresponds to the raw material
-        # source throughput requirement
-        self.output_throughput = throughput
-        self.ingredients = []
-        if item in raw_materials:
-            self.num_machines = 0
-        else:
-            item_recipe = recipes.get_recipe(item)
-            crafting_speed = crafting_speeds[item_recipe.produced_by]
             item_recipe_time = item_recipe.recipe_time(crafting_speed)
-            self.num_machines = item_recipe.machines_required(
-                throughput, crafting_speed)
+            current_num_machines = item_recipe.machines_required(
+                output_throughput, crafting_speed, productivity.get(current, 0))
+            num_machines.append(current_num_machines)
 
             # Now go through each ingredient working out its throughput requirement to sustain
-            # item production
-            for ingredient, num_required in item_recipe.ingredients.items():
-                ingredient_output_throughput = self.num_machines * num_required / item_recipe_time
-                ingredient_assembler_tree = CraftingTree(
-                    ingredient, ingredient_output_throughput,
-                    crafting_speeds, recipes, raw_materials)
-                self.ingredients.append(ingredient_assembler_tree)
+            # item production. Space is reserved for the ingredient node indices,
+            # which are filled in when the ingredient nodes are created.
+            ingredients = list(item_recipe.ingredients.items())
+            first_slot = len(children)
+            num_children.append(len(ingredients))
+            children.extend([-1] * len(ingredients))
+            for n in reversed(range(len(ingredients))):
+                ingredient, num_required = ingredients[n]
+                ingredient_output_throughput = current_num_machines * num_required / item_recipe_time
+                stack.append((ingredient, ingredient_output_throughput,
+                              first_slot + n))
+
+        count("tree nodes created", len(items))
+
+    @classmethod
+    def view(cls, store, index):
+        """
+        Make a CraftingTree for node index of an existing store, without
+        copying anything
+        """
+        assembler_tree = cls.__new__(cls)
+        assembler_tree.store = store
+        assembler_tree.index = index
+        return assembler_tree
+
+    @property
+    def item(self):
+        return self.store.items[self.index]
+
+    @property
+    def output_throughput(self):
+        return self.store.output_throughput[self.index]
+
+    @property
+    def num_machines(self):
+        return self.store.num_machines[self.index]
+
+    @property
+    def produced_by(self):
+        """
+        The machine class making this item (None for raw materials)
+        """
+        machine_class = self.store.machine_class[self.index]
+        if machine_class < 0:
+            return None
+        return self.store.machine_classes[machine_class]
+
+    @property
+    def ingredients(self):
+        return [
+            CraftingTree.view(self.store, child)
+            for child in self.store.get_children(self.index)
+        ]
 
     def is_raw_material(self):
-        return len(self.ingredients) == 0
+        return self.store.num_children[self.index] == 0
+
+    def rescale(self, new_throughput):
+        """
+        Change the output throughput of this node to new_throughput, without
+        rebuilding the tree. Every throughput and number of machines is
+        proportional to the top-level throughput, so the whole tree (that
+        this node is part of) is just scaled in place.
+        """
+        if self.output_throughput == 0:
+            raise ValueError("Cannot rescale a tree with zero throughput")
+        self.store.rescale(new_throughput / self.output_throughput)
+
+    def update_speeds(self, crafting_speeds):
+        """
+        Change the crafting speeds of some of the machine classes (e.g.
+        {"assembling_machine": 1.25}), without rebuilding the tree. Only
+        the numbers of machines of the nodes using those machines change.
+        """
+        self.store.update_speeds(crafting_speeds)
 
     def total_raw_input_throughput(self):
         """
         Add up all the raw output throughputs over the leaf nodes (with no assembling machines), which
         are interpreted as the required input throughputs of the raw materials
         """
-        total_throughput = {}
-
         if self.is_raw_material():
             return {self.item: self.output_throughput}
-        else:
-            for ingredient_assembler_tree in self.ingredients:
-                total_throughput = add_dictionaries(
-                    total_throughput,
-                    ingredient_assembler_tree.total_raw_input_throughput())
 
-        return total_throughput
-
-    def to_dict(self):
+        store = self.store
+        if store.interned:
+            total_throughput = store.get_raw_input_throughput(self.index)
+        else:
+            total_throughput = {}
+            for node, _ in store.walk(self.index):
+                if store.num_children[node] == 0:
+                    item = store.items[node]
+                    total_throughput[item] = (total_throughput.get(item, 0) +
+                                              store.output_throughput[node])
+
+        # Like add_dictionaries, only keep positive totals
         return {
-            "item": self.item,
-            "machines": self.num_machines,
-            "output_throughput": self.output_throughput,
-            "ingredients": [i.to_dict() for i in self.ingredients]
+            item: throughput
+            for item, throughput in total_throughput.items() if throughput > 0
         }
 
-    def add_node(self, G):
-        """
-        Append this object as a node in a networkx graph. Returns
-        the index of the node which was just added.
-        """
-        next_node_index = G.number_of_nodes()
-        G.add_node(
-            next_node_index,
-            item=self.item,
-            icon=get_icon(self.item),
-            num_machines=self.num_machines,
-            output_throughput=self.output_throughput,
-        )
-        return next_node_index
+    def to_dict(self):
+        store = self.store
+        node_dicts = []
+        for node, parent in store.walk(self.index):
+            node_dict = {
+                "item": store.items[node],
+                "machines": store.num_machines[node],
+                "output_throughput": store.output_throughput[node],
+                "ingredients": []
+            }
+            node_dicts.append(node_dict)
+            if parent is not None:
+                node_dicts[parent]["ingredients"].append(node_dict)
+        return node_dicts[0]
 
     def to_graph(self, G=None):
         """
         Convert the object to a networkx graph.
 
-        The function is recursive. On the way down the tree (which
-        is a depth-first order), each ingredient (i.e. assembler node)
-        is assigned a number. On the way up, edges are assigned between
-        the node numbers. You cannot do this on the way down, because
-        you do not know what the node numbers, because the node numbers
-        of all the children of the current node are not known yet.
+        The nodes are numbered in depth-first (pre-)order, continuing from
+        the number of nodes already in G. The tree is walked once using an
+        explicit stack, and all the nodes and edges are added to G in bulk
+        at the end.
+
+        The nodes do not store the icon of the item; get it using
+        icons.get_icon(G.nodes[n]["item"]) when the graph is drawn.
         """
 
+        # Imported here, so that networkx is only loaded when it is needed
+        import networkx as nx
+
         if G is None:
             G = nx.Graph()
 
-        current_node_index = self.add_node(G)
-
-        # Now iterate over the children adding them
-        for ingredient_assembler_tree in self.ingredients:
-
-            F, ingredient_node_index = ingredient_assembler_tree.to_graph(G)
-            G = nx.compose(G, F)
-
-            # Now we're going back up the graph, start adding the edges.
-            G.add_edge(current_node_index, ingredient_node_index)
-
-        # Only return the ingredient index if not at the top level
-        if current_node_index == 0:
-            return G
-        else:
-            return G, current_node_index
+        store = self.store
+        first_node_index = G.number_of_nodes()
+        nodes = []
+        edges = []
+        for node, parent in store.walk(self.index):
+            current_node_index = first_node_index + len(nodes)
+            nodes.append((current_node_index, {
+                "item": store.items[node],
+                "num_machines": store.num_machines[node],
+                "output_throughput": store.output_throughput[node],
+            }))
+            if parent is not None:
+                edges.append((first_node_index + parent, current_node_index))
+
+        G.add_nodes_from(nodes)
+        G.add_edges_from(edges)
+        count("graph nodes", len(nodes))
+        count("graph edges", len(edges))
+        return G
 
 
 class CombinedCraftingGraph:
@@ -295,7 +789,10 @@ class CombinedCraftingGraph:
     may be used to make two different items.
     """
 
-    def __init__(self, assembler_tree):
+    def __init__(self, assembler_tree=None):
+
+        # The top-level item
+        self.item = None
 
         # A map from strings to a dictionary of node information
         self.nodes = {}
@@ -303,7 +800,130 @@ class CombinedCraftingGraph:
         # A set of edges -- pairs of the form (item_producer, item_consumer)
         self.edges = set()
 
-        self.add_assembler_tree(assembler_tree)
+        # The machine class making each item (None for raw materials), and
+        # the crafting speeds and productivity bonuses used to work out the
+        # numbers of machines
+        self.produced_by = {}
+        self.crafting_speeds = {}
+        self.productivity = {}
+
+        if assembler_tree is not None:
+            self.add_assembler_tree(assembler_tree)
+
+    @classmethod
+    def from_recipes(cls, item, throughput, crafting_speeds, recipes,
+                     raw_materials, machine_classes=None, productivity=None):
+        """
+        Make the combined graph directly from the recipes (taking the same
+        arguments as CraftingTree, apart from interned), without building the
+        CraftingTree first.
+
+        The items are visited once each, in reverse topological order (every
+        item before its ingredients). By the time an item is reached, all the
+        items that use it have added their demand to its throughput, so its
+        number of machines can be worked out and passed on to its ingredients.
+        The result is the same as CombinedCraftingGraph(CraftingTree(...)),
+        but the cost depends on the number of distinct items rather than the
+        number of paths through the tree.
+        """
+        raw_materials = frozenset(raw_materials)
+        machine_classes = machine_classes or {}
+        graph = cls()
+        graph.item = item
+        graph.crafting_speeds = dict(crafting_speeds)
+        graph.productivity = dict(productivity or {})
+        if item in raw_materials:
+            graph.nodes[item] = {
+                "num_machines": 0,
+                "output_throughput": throughput
+            }
+            graph.produced_by[item] = None
+            return graph
+
+        throughputs = {item: throughput}
+        for current in reversed(recipes.get_topological_order(
+                item, raw_materials)):
+            output_throughput = throughputs[current]
+
+            if current in raw_materials:
+                graph.nodes[current] = {
+                    "num_machines": 0,
+                    "output_throughput": output_throughput
+                }
+                graph.produced_by[current] = None
+                continue
+
+            item_recipe = recipes.get_recipe(current)
+            produced_by = machine_classes.get(current, item_recipe.produced_by)
+            crafting_speed = crafting_speeds[produced_by]
+            item_recipe_time = item_recipe.recipe_time(crafting_speed)
+            num_machines = item_recipe.machines_required(
+                output_throughput, crafting_speed,
+                graph.productivity.get(current, 0))
+            graph.nodes[current] = {
+                "num_machines": num_machines,
+                "output_throughput": output_throughput
+            }
+            graph.produced_by[current] = produced_by
+
+            for ingredient, num_required in item_recipe.ingredients.items():
+                ingredient_output_throughput = num_machines * num_required / item_recipe_time
+                throughputs[ingredient] = (throughputs.get(ingredient, 0) +
+                                           ingredient_output_throughput)
+                graph.edges.add((current, ingredient))
+
+        return graph
+
+    @classmethod
+    def from_steady_state(cls, item, throughput, crafting_speeds, recipes,
+                          raw_materials, machine_classes=None, productivity=None):
+        """
+        Make the combined graph (taking the same arguments as from_recipes)
+        by solving the recipes as a linear system (see
+        CompiledRecipes.solve_steady_state). Unlike from_recipes, this works
+        when the recipes contain cycles, as long as each cycle makes more
+        than it uses up. Raises a ValueError if an item is needed in
+        unlimited amounts, or does not exist in the recipes list.
+        """
+        raw_materials = frozenset(raw_materials)
+        machine_classes = machine_classes or {}
+        steady_state = recipes.compile().solve_steady_state(
+            {item: throughput}, crafting_speeds, raw_materials,
+            machine_classes, productivity)
+        if steady_state["unbounded"]:
+            raise ValueError(
+                f"Cannot make {item}, because the recipes for "
+                f"{', '.join(steady_state['unbounded'])} use up at least as "
+                "much as they make")
+        if steady_state["missing"]:
+            raise ValueError(
+                f"Item {steady_state['missing'][0]} does not exist in the recipes list. Check the resources .ods file."
+            )
+
+        graph = cls()
+        graph.item = item
+        graph.crafting_speeds = dict(crafting_speeds)
+        graph.productivity = dict(productivity or {})
+        for current, output_throughput in steady_state["throughput"].items():
+            if current in raw_materials:
+                graph.nodes[current] = {
+                    "num_machines": 0,
+                    "output_throughput": output_throughput
+                }
+                graph.produced_by[current] = None
+                continue
+
+            item_recipe = recipes.get_recipe(current)
+            graph.nodes[current] = {
+                "num_machines": steady_state["machines"][current],
+                "output_throughput": output_throughput
+            }
+            graph.produced_by[current] = machine_classes.get(
+                current, item_recipe.produced_by)
+            for ingredient in item_recipe.ingredients:
+                graph.edges.add((current, ingredient))
+
+        return graph
 
     def push_assembler_node(self, assembler_tree):
         """
@@ -318,6 +938,7 @@ class CombinedCraftingGraph:
                 "num_machines": assembler_tree.num_machines,
                 "output_throughput": assembler_tree.output_throughput
             }
+            self.produced_by[item] = assembler_tree.produced_by
         else:
             self.nodes[item]["num_machines"] += assembler_tree.num_machines
             self.nodes[item][
@@ -328,17 +949,46 @@ class CombinedCraftingGraph:
         Adds the nodes from an assembler tree to self.nodes, and
         adds edges to self.edges
         """
+        store = assembler_tree.store
+        if self.item is None:
+            self.item = assembler_tree.item
+        self.crafting_speeds.update(store.crafting_speeds)
+        self.productivity.update(store.productivity)
+        for node, _ in store.walk(assembler_tree.index):
 
-        # Save the assembler_tree as a node
-        self.push_assembler_node(assembler_tree)
-
-        for ingredient_assembler_tree in assembler_tree.ingredients:
+            # Save the assembler_tree as a node
+            self.push_assembler_node(CraftingTree.view(store, node))
 
             # Add edges from all ingredients to the parent node
-            self.edges.add(
-                (assembler_tree.item, ingredient_assembler_tree.item))
+            for child in store.get_children(node):
+                self.edges.add((store.items[node], store.items[child]))
 
-            self.add_assembler_tree(ingredient_assembler_tree)
+    def rescale(self, new_throughput):
+        """
+        Change the output throughput of the top-level item to new_throughput,
+        by scaling all the throughputs and numbers of machines in place (they
+        are all proportional to the top-level throughput)
+        """
+        top_throughput = self.nodes[self.item]["output_throughput"]
+        if top_throughput == 0:
+            raise ValueError("Cannot rescale a graph with zero throughput")
+        scale = new_throughput / top_throughput
+        for node in self.nodes.values():
+            node["num_machines"] *= scale
+            node["output_throughput"] *= scale
+
+    def update_speeds(self, crafting_speeds):
+        """
+        Change the crafting speeds of some of the machine classes (e.g.
+        {"assembling_machine": 1.25}) in place. Only the numbers of machines
+        of the items made by those machines change.
+        """
+        for item, node in self.nodes.items():
+            produced_by = self.produced_by[item]
+            if produced_by in crafting_speeds:
+                node["num_machines"] *= (self.crafting_speeds[produced_by] /
+                                         crafting_speeds[produced_by])
+        self.crafting_speeds.update(crafting_speeds)
 
     def __repr__(self):
         """
@@ -348,28 +998,32 @@ class CombinedCraftingGraph:
 
     def to_graph(self):
         """
-        Convert the graph to networkx for plotting
+        Convert the graph to networkx for plotting. Like CraftingTree.to_graph,
+        the icons are not stored in the nodes (use icons.get_icon on the item).
         """
+        import networkx as nx
+
         G = nx.DiGraph()
 
         # Networkx labels by numbers, but our key is item name.
         # Keep track of it here.
         item_to_node_index = {}
 
+        nodes = []
         for item, node in self.nodes.items():
-            num_machines = node["num_machines"]
-            output_throughput = node["output_throughput"]
             next_index = len(item_to_node_index)
             item_to_node_index[item] = next_index
-            G.add_node(next_index,
-                       item=item,
-                       icon=get_icon(item),
-                       num_machines=num_machines,
-                       output_throughput=output_throughput)
-
-        for (item_1, item_2) in self.edges:
-            index_1 = item_to_node_index[item_1]
-            index_2 = item_to_node_index[item_2]
-            G.add_edge(index_1, index_2)
+            nodes.append((next_index, {
+                "item": item,
+                "num_machines": node["num_machines"],
+                "output_throughput": node["output_throughput"],
+            }))
+
+        G.add_nodes_from(nodes)
+        G.add_edges_from((item_to_node_index[item_1],
+                          item_to_node_index[item_2])
+                         for (item_1, item_2) in self.edges)
+        count("graph nodes", len(nodes))
+        count("graph edges", len(self.edges))
 
         return G
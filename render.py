@@ -0,0 +1,156 @@
+# Drawing of crafting graphs (from CraftingTree.to_graph or
+# CombinedCraftingGraph.to_graph). Everything is drawn on a single
+# matplotlib axes: the edges as one collection, all the icons pasted
+# into one image, and the labels as text on the same axes. This is much
+# faster than making a separate axes for each node, which gets very slow
+# for graphs with hundreds of nodes.
+
+import numpy as np
+import networkx as nx
+from PIL import Image
+from icons import get_icon_array, prefetch_icons
+from profiling import phase
+
+# Size of the icons, as a fraction of the figure size
+default_icon_size = 0.035
+
+
+def get_icon_pixels(item, icon_px):
+    """
+    Get the icon for item as an RGBA array, scaled (keeping the aspect
+    ratio) to fit in an icon_px by icon_px square
+    """
+    icon = Image.fromarray(np.asarray(get_icon_array(item)))
+    scale = icon_px / max(icon.size)
+    width = max(1, round(icon.width * scale))
+    height = max(1, round(icon.height * scale))
+    return np.asarray(icon.resize((width, height)))
+
+
+def paste_icon(canvas, icon, center_x, center_y):
+    """
+    Alpha-blend icon into canvas (both RGBA arrays, with row 0 at the top),
+    centred on the pixel (center_x, center_y). Parts of the icon outside the
+    canvas are cut off.
+    """
+    height, width = icon.shape[:2]
+    top = int(round(center_y - height / 2))
+    left = int(round(center_x - width / 2))
+
+    # Overlap between the icon and the canvas
+    canvas_top = max(top, 0)
+    canvas_left = max(left, 0)
+    canvas_bottom = min(top + height, canvas.shape[0])
+    canvas_right = min(left + width, canvas.shape[1])
+    if canvas_top >= canvas_bottom or canvas_left >= canvas_right:
+        return
+
+    region = canvas[canvas_top:canvas_bottom, canvas_left:canvas_right]
+    part = icon[canvas_top - top:canvas_bottom - top,
+                canvas_left - left:canvas_right - left]
+    alpha = part[..., 3:4] / 255.0
+    region[...] = part * alpha + region * (1 - alpha)
+
+
+def draw_crafting_graph(G, pos, title, fig, ax, icon_size=default_icon_size):
+    """
+    Draw the graph of machines G on the axes ax of figure fig, with the
+    item icon, number of machines (in bold, above the icon) and output rate
+    (below right of the icon) at each node position in pos.
+    """
+    ax.set_title(title)
+
+    # Download any missing icons all at once, before drawing anything
+    with phase("fetch icons"):
+        prefetch_icons({G.nodes[n]["item"] for n in G.nodes})
+
+    with phase("draw edges"):
+        nx.draw_networkx(
+            G,
+            pos=pos,
+            ax=ax,
+            arrows=True,
+            arrowstyle="-",
+            node_color="w",
+            style="dashed",
+            with_labels=False,
+        )
+
+    # Fix the limits, so that the icon image (which is placed in data
+    # coordinates) lines up with the nodes
+    xlim = ax.get_xlim()
+    ylim = ax.get_ylim()
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+
+    # Paste all the icons into one image covering the whole axes, at their
+    # positions in display (pixel) coordinates
+    icon_px = max(1, int(round(icon_size * min(fig.bbox.width, fig.bbox.height))))
+    with phase("draw icons"):
+        bbox = ax.get_window_extent()
+        canvas = np.zeros((int(round(bbox.height)), int(round(bbox.width)), 4))
+        icons = {}
+        for n in G.nodes:
+            item = G.nodes[n]["item"]
+            if item not in icons:
+                icons[item] = get_icon_pixels(item, icon_px)
+            x, y = ax.transData.transform(pos[n])
+            paste_icon(canvas, icons[item], x - bbox.x0, bbox.y1 - y)
+
+        ax.imshow(canvas.astype(np.uint8),
+                  extent=(xlim[0], xlim[1], ylim[0], ylim[1]),
+                  aspect="auto",
+                  interpolation="nearest",
+                  zorder=3)
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+
+    # Label offsets from the node centres, in points (so they are the
+    # same if the figure is saved at a different resolution)
+    half_icon = icon_px / 2 * 72.0 / fig.dpi
+    with phase("draw labels"):
+        for n in G.nodes:
+            num_machines = G.nodes[n]["num_machines"]
+            output_throughput = G.nodes[n]["output_throughput"]
+            if num_machines != 0:
+                ax.annotate(f"{num_machines:.1f}",
+                            xy=pos[n],
+                            xytext=(0, half_icon),
+                            textcoords="offset points",
+                            fontsize=10,
+                            weight="bold",
+                            zorder=4)
+            ax.annotate(f"{output_throughput:.2f}/s",
+                        xy=pos[n],
+                        xytext=(half_icon, -half_icon),
+                        textcoords="offset points",
+                        fontsize=10,
+                        zorder=4)
+
+    ax.axis("off")
+
+
+def show_crafting_graph(G, pos, title):
+    """
+    Draw the graph of machines in a new (interactive) pyplot window
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    draw_crafting_graph(G, pos, title, fig, ax)
+    plt.show()
+
+
+def save_crafting_graph(G, pos, title, path, figsize=(12.8, 9.6), dpi=100):
+    """
+    Draw the graph of machines and save it to path (the format, e.g. png or
+    svg, comes from the file extension). This does not use pyplot, so it
+    works without a display.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    ax = fig.subplots()
+    draw_crafting_graph(G, pos, title, fig, ax)
+    with phase("save"):
+        fig.savefig(path)
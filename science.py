@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 
-from recipe import RecipeList, AssemblerTree, add_dictionaries, scale_dictionary
+from recipe import RecipeList
+from sweep import run_sweep
+from batch_render import run_batch_render, format_timings
 from rich import print
-from plots import plot_assembler_tree
 
 raw_materials = [
     "steel_plate",
@@ -32,17 +33,23 @@ all_science = [
 
 desired_science_throughput = 1.0/5 # per second
 
-recipes = RecipeList("factorio_resources.ods")
-science_assembler_trees = [AssemblerTree(name + "_science_pack", desired_science_throughput, 0.75, recipes, raw_materials) for name in all_science]
-raw_input_throughputs = [tree.total_raw_input_throughput() for tree in science_assembler_trees]
-total = {}
-for d in raw_input_throughputs:
-    total = add_dictionaries(total, d)
+if __name__ == "__main__":
+    recipes = RecipeList("factorio_recipes.csv")
+    science_packs = [name + "_science_pack" for name in all_science]
 
-total_per_minute = scale_dictionary(total, 60)
-    
-print(total)
+    # One row per science pack, using assembling machine twos
+    columns = run_sweep(science_packs, [60 * desired_science_throughput], [2],
+                        {"science": raw_materials}, recipes)
 
-for name in all_science:
-    plot_assembler_tree(name + "_science_pack", desired_science_throughput, 0.75, "factorio_resources.ods", raw_materials)
+    total = {
+        name[len("raw_"):]: sum(values)
+        for name, values in columns.items() if name.startswith("raw_")
+    }
+    total_per_minute = {item: 60 * throughput for item, throughput in total.items()}
 
+    print(total_per_minute)
+
+    # Plan images for each science pack, rendered in parallel
+    results = run_batch_render(science_packs, [60 * desired_science_throughput],
+                               [2], raw_materials, recipes, "science_plans")
+    print(format_timings(results))
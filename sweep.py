@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+description = """
+Evaluate production plans for every combination of items, rates,
+assembling machine tiers and input items files, and write a table
+(csv) with one row per combination. Each row contains the total number
+of machines of each machine class, and the input throughput of each raw
+material (in items/second).
+
+The combinations are split up between a pool of worker processes, which
+each load the recipes once.
+
+EXAMPLES
+
+# All the science packs at 30 and 60 per minute, with each assembling machine
+./sweep.py -r 30 60 -m 1 2 3 -o science.csv automation_science_pack \\
+    logistic_science_pack chemical_science_pack
+
+# Every item in the recipes file, using two different input files
+./sweep.py -i input_materials.txt circuits.txt -o all.csv all
+"""
+
+import argparse
+import csv
+import itertools
+from recipe import RecipeList, CombinedCraftingGraph
+from planner import make_crafting_speeds, read_inputs_file
+
+# The RecipeList used by each worker process (set by init_worker, so
+# that the recipes are only sent to each worker once)
+worker_recipes = None
+
+
+def init_worker(recipes):
+    global worker_recipes
+    worker_recipes = recipes
+
+
+def map_with_recipes(function, configs, recipes, processes=None):
+    """
+    Call function on each of configs, and return the list of results. The
+    configs are shared between processes worker processes (the default is
+    one per CPU), each of which has recipes in worker_recipes. If processes
+    is 1, everything is done in this process.
+    """
+    if processes == 1:
+        init_worker(recipes)
+        return [function(config) for config in configs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    import os
+    num_workers = processes or os.cpu_count()
+    chunksize = max(1, len(configs) // (4 * num_workers))
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             initializer=init_worker,
+                             initargs=(recipes,)) as executor:
+        return list(executor.map(function, configs, chunksize=chunksize))
+
+
+def evaluate_config(config):
+    """
+    Work out the machines and raw input throughputs for one configuration,
+    which is a tuple (item, rate, assembling_machine, inputs_file, inputs),
+    using the recipes of this worker. Returns a dictionary with the
+    configuration, an error message (None if it worked), the number of
+    machines of each machine class and the raw input throughputs.
+    """
+    item, rate, assembling_machine, inputs_file, inputs = config
+    result = {
+        "item": item,
+        "rate": rate,
+        "assembling_machine": assembling_machine,
+        "inputs_file": inputs_file,
+        "error": None,
+        "machines": {},
+        "raw_input_throughput": {},
+    }
+    try:
+        graph = CombinedCraftingGraph.from_recipes(
+            item, rate / 60.0, make_crafting_speeds(assembling_machine),
+            worker_recipes, inputs)
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+
+    for node_item, node in graph.nodes.items():
+        produced_by = graph.produced_by[node_item]
+        if produced_by is None:
+            result["raw_input_throughput"][node_item] = node["output_throughput"]
+        else:
+            result["machines"][produced_by] = (
+                result["machines"].get(produced_by, 0) + node["num_machines"])
+    return result
+
+
+def run_sweep(items, rates, assembling_machines, inputs, recipes,
+              processes=None):
+    """
+    Evaluate every combination of items, rates (items per minute),
+    assembling_machines (tiers) and sets of input items, and return the results
+    as a table of columns: a dictionary mapping column names to lists, with
+    one entry per combination. The columns are item, rate,
+    assembling_machine, inputs_file, error, total_machines, then
+    machines_<class> for each machine class and raw_<item> for each raw
+    material (0 where it is not used).
+
+    inputs is a dictionary mapping a name for each set of input items (e.g.
+    the inputs file it came from, which goes in the inputs_file column) to
+    the list of input items.
+
+    The combinations are shared between processes worker processes (the
+    default is one per CPU). If processes is 1, everything is done in
+    this process.
+    """
+    configs = [(item, rate, assembling_machine, inputs_file, inputs[inputs_file])
+               for item, rate, assembling_machine, inputs_file in itertools.product(
+                   items, rates, assembling_machines, inputs)]
+
+    results = map_with_recipes(evaluate_config, configs, recipes, processes)
+
+    machine_classes = sorted(
+        {produced_by for result in results for produced_by in result["machines"]})
+    raw_materials = sorted({raw_material for result in results
+                            for raw_material in result["raw_input_throughput"]})
+
+    columns = {
+        name: [result[name] for result in results]
+        for name in ["item", "rate", "assembling_machine", "inputs_file", "error"]
+    }
+    columns["total_machines"] = [sum(result["machines"].values())
+                                 for result in results]
+    for produced_by in machine_classes:
+        columns["machines_" + produced_by] = [
+            result["machines"].get(produced_by, 0) for result in results]
+    for raw_material in raw_materials:
+        columns["raw_" + raw_material] = [
+            result["raw_input_throughput"].get(raw_material, 0)
+            for result in results]
+    return columns
+
+
+def write_columns_csv(columns, csv_file):
+    """
+    Write a table of columns (from run_sweep) to an open csv file
+    """
+    writer = csv.writer(csv_file)
+    writer.writerow(columns.keys())
+    writer.writerows(zip(*columns.values()))
+
+
+class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
+                      argparse.RawDescriptionHelpFormatter):
+    pass
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=CustomFormatter)
+    parser.add_argument(
+        "items",
+        nargs="+",
+        help="the items to be assembled, or all for every item with a recipe")
+    parser.add_argument("-r",
+                        "--rates",
+                        help="target item assembly rates, in items per minute",
+                        nargs="+",
+                        type=float,
+                        default=[60])
+    parser.add_argument(
+        "-m",
+        "--assembling-machines",
+        help="types of assembling machine used (0 (human); 1, 2, or 3)",
+        nargs="+",
+        choices=[0, 1, 2, 3],
+        type=int,
+        default=[1])
+    parser.add_argument("-i",
+                        "--inputs-files",
+                        help="relative paths to the input items files",
+                        nargs="+",
+                        default=["input_materials.txt"])
+    parser.add_argument("-f",
+                        "--recipes-file",
+                        help="relative path to the recipes file",
+                        default="factorio_recipes.csv")
+    parser.add_argument("-p",
+                        "--processes",
+                        help="number of worker processes (default: one per CPU)",
+                        type=int)
+    parser.add_argument("-o",
+                        "--output",
+                        help="csv file to write the results to",
+                        default="sweep.csv")
+    args = parser.parse_args()
+
+    recipes = RecipeList(args.recipes_file)
+    items = list(recipes.recipes) if args.items == ["all"] else args.items
+    inputs = {inputs_file: read_inputs_file(inputs_file)
+              for inputs_file in args.inputs_files}
+    columns = run_sweep(items, args.rates, args.assembling_machines, inputs,
+                        recipes, args.processes)
+    with open(args.output, "w", newline="") as f:
+        write_columns_csv(columns, f)
+    print(f"Wrote {len(columns['item'])} rows to {args.output}")
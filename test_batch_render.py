@@ -0,0 +1,28 @@
+import numpy as np
+from PIL import Image
+from recipe import RecipeList
+from batch_render import run_batch_render, format_timings
+from test_recipe import raw_materials
+import layout
+import render
+
+
+def test_run_batch_render(monkeypatch, tmp_path):
+    monkeypatch.setattr(render, "prefetch_icons", lambda items: {})
+    monkeypatch.setattr(render, "get_icon_array",
+                        lambda item: np.asarray(Image.new("RGBA", (64, 64), (0, 0, 255, 255))))
+    monkeypatch.setattr(layout, "graphviz_layout",
+                        lambda G, prog: {n: (10.0 * n, 5.0 * n) for n in G.nodes})
+    recipes = RecipeList("factorio_recipes.csv")
+    # The layout cache goes in the current directory
+    monkeypatch.chdir(tmp_path)
+
+    results = run_batch_render(["electronic_circuit", "iron_ore"], [30, 60], [1],
+                               raw_materials, recipes, tmp_path / "plans",
+                               processes=1)
+    assert [result["item"] for result in results] == ["electronic_circuit"] * 2 + ["iron_ore"] * 2
+    assert [result["error"] is None for result in results] == [True, True, False, False]
+    assert (tmp_path / "plans" / "electronic_circuit_30pm_m1.png").stat().st_size > 0
+    assert (tmp_path / "plans" / "electronic_circuit_60pm_m1.png").stat().st_size > 0
+    assert results[0]["num_nodes"] > 0
+    assert "Rendered 2 plans (2 failed)" in format_timings(results)
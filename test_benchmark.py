@@ -0,0 +1,32 @@
+from recipe import RecipeList, CraftingTree
+import benchmark
+
+
+def test_synthetic_recipes(tmp_path):
+    recipes_file = tmp_path / "recipes.csv"
+    raw_materials, top_items = benchmark.write_synthetic_recipes_csv(
+        recipes_file, 100, 4, 3)
+    assert len(raw_materials) == 20
+    assert len(top_items) == 20
+    recipes = RecipeList(recipes_file)
+    assert len(recipes.recipes) == 80
+    assert all(len(recipe.ingredients) == 3 for recipe in recipes.recipes.values())
+
+    # 1 + 3 + 9 + 27 + 81 nodes
+    tree = CraftingTree(top_items[0], 1, {"assembling_machine": 1}, recipes,
+                        raw_materials)
+    assert len(tree.store) == 121
+    assert benchmark.count_tree_nodes(recipes, top_items[0], raw_materials) == 121
+
+def test_run_synthetic_benchmark():
+    times = benchmark.run_synthetic_benchmark(60, 3, 2, 2, 1, max_tree_nodes=10)
+    assert times["num_tree_items"] == 0
+    assert times["combined_graph"] > 0
+
+def test_find_regressions():
+    baseline = {"catalog": {"load_csv": 1.0, "crafting_tree": 0.001, "num_tree_items": 5}}
+    results = {"catalog": {"load_csv": 1.2, "crafting_tree": 0.004, "num_tree_items": 9},
+               "synthetic": {"load_csv": 5.0}}
+    assert benchmark.find_regressions(results, baseline, 0.25) == []
+    results["catalog"]["load_csv"] = 1.3
+    assert len(benchmark.find_regressions(results, baseline, 0.25)) == 1
@@ -0,0 +1,170 @@
+from recipe import RecipeList, CombinedCraftingGraph
+from test_recipe import raw_materials
+import numpy as np
+import pytest
+
+
+def test_compiled_raw_material_counts_match_recipe_list():
+    recipes = RecipeList("factorio_recipes.csv")
+    all_counts = recipes.compile().get_raw_material_counts(raw_materials)
+    for item in recipes.recipes:
+        if item in raw_materials:
+            continue
+        if item not in all_counts:
+            # Depends on something that is not a raw material (e.g. iron_ore)
+            with pytest.raises(ValueError):
+                recipes.get_raw_material_counts(item, raw_materials)
+            continue
+        expected = recipes.get_raw_material_counts(item, raw_materials)
+        assert all_counts[item] == pytest.approx(expected)
+
+def test_compiled_ingredient_matrix_is_normalised():
+    compiled = RecipeList("factorio_recipes.csv").compile()
+    i = compiled.index["copper_cable"]
+    j = compiled.index["copper_plate"]
+    # One copper_plate makes two copper_cable
+    assert compiled.ingredient_matrix[i, j] == 0.5
+
+def test_compiled_missing_recipe_is_nan():
+    compiled = RecipeList("factorio_recipes.csv").compile()
+    names, counts = compiled.raw_material_matrix(["iron_plate"])
+    assert names == ["iron_plate"]
+    assert counts[compiled.index["iron_gear_wheel"], 0] == 2
+    assert np.isnan(counts[compiled.index["electronic_circuit"], 0])
+
+def test_compiled_recipes_order_is_topological():
+    compiled = RecipeList("factorio_recipes.csv").compile()
+    position = {item: n for n, item in enumerate(compiled.order)}
+    rows, columns = compiled.ingredient_matrix.nonzero()
+    assert all(position[j] < position[i] for i, j in zip(rows, columns))
+
+### Tests for the steady-state solver
+
+cyclic_rows = [
+    # Enrichment: 40 enriched_fuel and 5 ore make 41 enriched_fuel
+    "enriched_fuel,enriched_fuel,40,60,41,centrifuge",
+    "enriched_fuel,ore,5,60,41,centrifuge",
+    "fuel_cell,enriched_fuel,1,10,1,assembling_machine",
+    "fuel_cell,iron_plate,2,10,1,assembling_machine",
+    # A loop that never makes anything
+    "loop_a,loop_b,1,1,1,assembling_machine",
+    "loop_b,loop_a,1,1,1,assembling_machine",
+    "loop_b,iron_plate,1,1,1,assembling_machine",
+    "looped_product,loop_a,1,1,1,assembling_machine",
+    "looped_product,iron_plate,1,1,1,assembling_machine",
+    "mystery,unobtainium,1,1,1,assembling_machine",
+]
+cyclic_speeds = {"assembling_machine": 1, "centrifuge": 1}
+
+def make_cyclic_recipes(tmp_path):
+    from test_recipe import write_recipes_csv
+    recipes_csv = tmp_path / "recipes.csv"
+    write_recipes_csv(recipes_csv, cyclic_rows)
+    return RecipeList(recipes_csv)
+
+def test_steady_state_with_catalyst_cycle(tmp_path):
+    compiled = make_cyclic_recipes(tmp_path).compile()
+    assert compiled.order is None
+    state = compiled.solve_steady_state({"fuel_cell": 1}, cyclic_speeds,
+                                        ["ore", "iron_plate"])
+    # 41 enriched_fuel are made for every 1 used, and each run uses 5 ore
+    assert state["throughput"]["enriched_fuel"] == pytest.approx(41)
+    assert state["raw_input_throughput"] == pytest.approx({"ore": 5, "iron_plate": 2})
+    assert state["machines"]["enriched_fuel"] == pytest.approx(60)
+    assert state["machines"]["fuel_cell"] == pytest.approx(10)
+    assert state["missing"] == []
+    assert state["unbounded"] == []
+    assert "loop_a" not in state["throughput"]
+
+def test_steady_state_reports_unbounded_and_missing(tmp_path):
+    compiled = make_cyclic_recipes(tmp_path).compile()
+    state = compiled.solve_steady_state({"looped_product": 1, "mystery": 2},
+                                        cyclic_speeds, ["iron_plate"])
+    assert state["unbounded"] == ["iron_plate", "loop_a", "loop_b"]
+    assert state["missing"] == ["unobtainium"]
+    assert state["throughput"]["looped_product"] == pytest.approx(1)
+    assert state["throughput"]["unobtainium"] == pytest.approx(2)
+    with pytest.raises(ValueError):
+        compiled.raw_material_matrix(["iron_plate"])
+
+def test_steady_state_matches_combined_graph():
+    recipes = RecipeList("factorio_recipes.csv")
+    speeds = {"assembling_machine": 0.75, "furnace": 1, "chemical_plant": 1}
+    graph = CombinedCraftingGraph.from_recipes("utility_science_pack", 0.5,
+                                               speeds, recipes, raw_materials)
+    state = recipes.compile().solve_steady_state({"utility_science_pack": 0.5},
+                                                 speeds, raw_materials)
+    assert set(state["throughput"]) == set(graph.nodes)
+    for item, node in graph.nodes.items():
+        assert state["throughput"][item] == pytest.approx(node["output_throughput"])
+        assert state["machines"].get(item, 0) == pytest.approx(node["num_machines"])
+
+def test_max_output_rates_match_recipe_list():
+    recipes = RecipeList("factorio_recipes.csv")
+    supply = {"iron_plate": 45, "copper_plate": 30, "steel_plate": 5,
+              "plastic_bar": 10, "coal": 3, "stone_brick": 8}
+    max_rates = recipes.compile().max_output_rates(supply, raw_materials)
+    assert max_rates["electronic_circuit"] == pytest.approx((20, "copper_plate"))
+    assert max_rates["steel_plate"] == pytest.approx((9, "iron_plate"))
+    for item, (rate, limiting_input) in max_rates.items():
+        expected_rate, _ = recipes.max_output_rate(
+            item, supply, raw_materials)
+        assert rate == pytest.approx(expected_rate)
+        # Several inputs can run out at the same rate, so just check that the
+        # limiting input gives that rate
+        counts = recipes.get_raw_material_counts(item, raw_materials)
+        assert supply.get(limiting_input, 0) / counts[limiting_input] == pytest.approx(rate)
+
+def test_max_output_rates_of_supplied_plates():
+    recipes = RecipeList("factorio_recipes.csv")
+    ores = ["iron_ore", "copper_ore", "coal", "stone"]
+    supply = {"iron_plate": 45, "copper_plate": 30}
+    max_rates = recipes.compile().max_output_rates(supply, ores)
+    assert max_rates["electronic_circuit"] == pytest.approx((20, "copper_plate"))
+    assert recipes.max_output_rate("electronic_circuit", supply,
+                                   ores) == pytest.approx((20, "copper_plate"))
+    # Plates are still made from ore when asked for
+    assert max_rates["iron_plate"] == (0, "iron_ore")
+
+def test_max_output_rates_with_productivity():
+    recipes = RecipeList("factorio_recipes.csv")
+    supply = {"iron_plate": 45, "copper_plate": 30, "steel_plate": 5}
+    productivity = {"electronic_circuit": 0.4, "copper_cable": 0.2,
+                    "steel_plate": 0.1}
+    max_rates = recipes.compile().max_output_rates(supply, raw_materials,
+                                                   productivity)
+    # 1.5 copper_plate per electronic_circuit, made 1.4 * 1.2 times over
+    assert max_rates["electronic_circuit"] == pytest.approx((20 * 1.4 * 1.2, "copper_plate"))
+    assert max_rates["steel_plate"] == pytest.approx((9 * 1.1, "iron_plate"))
+    for item, (rate, _) in max_rates.items():
+        expected_rate, _ = recipes.max_output_rate(item, supply, raw_materials,
+                                                   productivity)
+        assert rate == pytest.approx(expected_rate)
+
+### Tests for the dependency index
+
+def test_dependency_queries():
+    compiled = RecipeList("factorio_recipes.csv").compile()
+    assert compiled.get_consumers("copper_cable") == [
+        "advanced_circuit", "electronic_circuit", "lamp"]
+    assert "processing_unit" not in compiled.get_consumers("copper_cable")
+    assert compiled.depends_on("advanced_circuit", "copper_cable")
+    assert compiled.depends_on("advanced_circuit", "copper_ore")
+    assert not compiled.depends_on("copper_cable", "advanced_circuit")
+    assert not compiled.depends_on("copper_cable", "copper_cable")
+    assert compiled.get_all_ingredients("electronic_circuit") == [
+        "copper_cable", "copper_ore", "copper_plate", "iron_ore", "iron_plate"]
+
+    affected = compiled.get_affected_items("sulfuric_acid")
+    assert {"battery", "processing_unit", "utility_science_pack"} <= set(affected)
+    assert "electronic_circuit" not in affected
+    for item in affected:
+        assert compiled.depends_on(item, "sulfuric_acid")
+
+def test_dependency_queries_with_cycles(tmp_path):
+    compiled = make_cyclic_recipes(tmp_path).compile()
+    assert compiled.depends_on("enriched_fuel", "enriched_fuel")
+    assert compiled.depends_on("loop_a", "loop_a")
+    assert compiled.get_all_ingredients("looped_product") == [
+        "iron_plate", "loop_a", "loop_b"]
+    assert compiled.get_affected_items("ore") == ["enriched_fuel", "fuel_cell"]
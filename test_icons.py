@@ -0,0 +1,105 @@
+from PIL import Image
+import numpy as np
+import icons
+from profiling import start_profile, stop_profile
+
+
+def write_icons(folder):
+    (folder / "cache").mkdir()
+    Image.new("RGBA", (64, 64), (255, 0, 0, 255)).save(folder / "cache" / "iron_plate.png")
+    Image.new("RGB", (32, 48), (0, 255, 0)).save(folder / "cache" / "copper_plate.png")
+
+def test_get_icon_array_is_cached(monkeypatch, tmp_path):
+    write_icons(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(icons, "icon_atlas", False)
+    icons.get_icon_array.cache_clear()
+
+    pixels = icons.get_icon_array("copper_plate")
+    assert pixels.shape == (48, 32, 4)
+    assert not pixels.flags.writeable
+    assert icons.get_icon_array("copper_plate") is pixels
+    assert icons.get_icon_array.cache_info().hits == 1
+    icons.get_icon_array.cache_clear()
+
+def test_icon_atlas(monkeypatch, tmp_path):
+    write_icons(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(icons, "icon_atlas", None)
+
+    index = icons.build_icon_atlas()
+    assert index == {"copper_plate": [0, 48, 32], "iron_plate": [48 * 32 * 4, 64, 64]}
+    assert icons.load_icon_atlas()
+
+    pixels = icons.get_icon_array("iron_plate")
+    assert isinstance(pixels.base, np.memmap) or isinstance(pixels, np.memmap)
+    assert pixels.shape == (64, 64, 4)
+    assert (pixels == [255, 0, 0, 255]).all()
+    assert (icons.get_icon_array("copper_plate") == [0, 255, 0, 255]).all()
+    icons.get_icon_array.cache_clear()
+
+def test_mismatched_icon_atlas_is_rebuilt(monkeypatch, tmp_path):
+    write_icons(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    icons.build_icon_atlas(["copper_plate"])
+    index_file = tmp_path / "cache" / "icon_atlas.json"
+    index_of_copper_plate = index_file.read_text()
+
+    # The atlas of one build with the index of another
+    icons.build_icon_atlas()
+    index_file.write_text(index_of_copper_plate)
+    assert icons.load_icon_atlas()
+    assert sorted(icons.icon_atlas[1]) == ["copper_plate", "iron_plate"]
+    assert (icons.get_icon_array("iron_plate") == [255, 0, 0, 255]).all()
+
+    # A corrupt index
+    index_file.write_text('{"size": ')
+    assert icons.load_icon_atlas()
+    icons.get_icon_array.cache_clear()
+    monkeypatch.setattr(icons, "icon_atlas", None)
+
+def test_prefetch_icons_from_server(monkeypatch, tmp_path):
+    import functools
+    import http.server
+    import threading
+
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    Image.new("RGBA", (8, 8), (1, 2, 3, 255)).save(mirror / "Iron_plate.png")
+    Image.new("RGBA", (8, 8), (4, 5, 6, 255)).save(mirror / "Straight_rail.png")
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler,
+                                directory=str(mirror))
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(icons, "icon_atlas", False)
+        source = f"http://127.0.0.1:{server.server_address[1]}"
+        profile = start_profile()
+        try:
+            errors = icons.prefetch_icons(["iron_plate", "rail", "gear"], source)
+        finally:
+            stop_profile()
+        assert profile.counters["icons downloaded"] == 2
+        assert profile.counters["icon downloads failed"] == 1
+        assert list(errors) == ["gear"]
+        assert "404" in errors["gear"]
+        assert Image.open(tmp_path / "cache" / "rail.png").getpixel((0, 0)) == (4, 5, 6, 255)
+        assert (tmp_path / "cache" / "iron_plate.png").exists()
+        assert not (tmp_path / "cache" / "gear.png").exists()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_prefetch_icons_from_folder(monkeypatch, tmp_path):
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    Image.new("RGBA", (8, 8), (1, 2, 3, 255)).save(mirror / "Iron_plate.png")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(icons, "icon_atlas", False)
+    assert icons.prefetch_icons(["iron_plate"], str(mirror)) == {}
+    assert (tmp_path / "cache" / "iron_plate.png").exists()
+    # Already in the cache, so nothing is fetched
+    assert icons.prefetch_icons(["iron_plate"], str(tmp_path / "missing")) == {}
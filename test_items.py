@@ -0,0 +1,67 @@
+from recipe import RecipeList
+from items import ItemResolver, lookupItemAliases, normalise_item_name
+from planner import Planner
+import pytest
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return ItemResolver.from_recipe_list(RecipeList("factorio_recipes.csv"))
+
+def test_lookup_item_aliases():
+    assert lookupItemAliases("greencircuits") == "electronic_circuit"
+    assert lookupItemAliases("redinserter") == "long_handed_inserter"
+    assert lookupItemAliases("yellowassembler") == "assembling_machine_3"
+    assert lookupItemAliases("greenassembler") == "assembling_machine_3"
+    assert lookupItemAliases("iron_plate") == "iron_plate"
+
+def test_normalise_item_name():
+    assert normalise_item_name("Green Circuit") == "greencircuit"
+    assert normalise_item_name("long-handed_inserter") == "longhandedinserter"
+
+def test_resolve(resolver):
+    assert resolver.match("iron_gear_wheel") == ("iron_gear_wheel", "exact")
+    assert resolver.match("iron_plate") == ("iron_plate", "exact")
+    assert resolver.match("Green Circuits") == ("electronic_circuit", "alias")
+    assert resolver.match("redinserter") == ("long_handed_inserter", "alias")
+    assert resolver.match("Long-Handed Inserter") == ("long_handed_inserter", "alias")
+    assert resolver.match("iron_gear") == ("iron_gear_wheel", "prefix")
+    assert resolver.match("electronic_circut") == ("electronic_circuit", "fuzzy")
+    assert resolver.resolve("spped_module") == "speed_module"
+
+def test_resolve_unknown(resolver):
+    # A prefix of several items is not resolved
+    assert resolver.match("iron") == (None, None)
+    assert resolver.suggest("iron")[:3] == ["iron_ore", "iron_plate", "iron_stick"]
+    with pytest.raises(ValueError, match="Did you mean iron_ore, iron_plate"):
+        resolver.resolve("iron")
+    with pytest.raises(ValueError, match="does not exist"):
+        resolver.resolve("xyzzy")
+
+def test_aliases_of_missing_items():
+    resolver = ItemResolver(["iron_plate"], {"ironplate": "iron_plate", "gear": "iron_gear_wheel"})
+    assert resolver.resolve("ironplates") == "iron_plate"
+    assert "gear" not in resolver.exact
+
+def test_many_items():
+    names = [f"item_{n}_{['plate', 'gear', 'circuit'][n % 3]}" for n in range(3000)]
+    resolver = ItemResolver(names)
+    assert resolver.resolve("ITEM 1233 PLATE") == "item_1233_plate"
+    assert resolver.resolve("item_2345_circiut") == "item_2345_circuit"
+    suggestions = resolver.suggest("item_29")
+    assert len(suggestions) == 5
+    assert all(item.startswith("item_29") for item in suggestions)
+
+def test_resolved_names_are_bounded():
+    resolver = ItemResolver(["iron_plate", "copper_plate"])
+    resolver.max_resolved = 10
+    for n in range(100):
+        resolver.match(f"misspelt_{n}")
+    assert len(resolver.resolved) == 10
+    assert resolver.match("iron_plate") == ("iron_plate", "exact")
+
+def test_planner_resolves_items():
+    planner = Planner()
+    assert planner.query({"item": "redscience", "rate": 30})["item"] == "automation_science_pack"
+    with pytest.raises(ValueError, match="Did you mean"):
+        planner.query({"item": "green_sircit_board"})
@@ -0,0 +1,57 @@
+from recipe import RecipeList, CraftingTree, CombinedCraftingGraph
+from test_recipe import raw_materials
+import layout
+
+
+def make_tree_graph(throughput, crafting_speed):
+    recipes = RecipeList("factorio_recipes.csv")
+    return CraftingTree("electronic_circuit", throughput,
+                        {"assembling_machine": crafting_speed}, recipes,
+                        raw_materials).to_graph()
+
+def test_structure_hash_ignores_rates():
+    G = make_tree_graph(1, 0.5)
+    H = make_tree_graph(2, 1.25)
+    assert layout.make_structure_hash(G, "dot") == layout.make_structure_hash(H, "dot")
+    assert layout.make_structure_hash(G, "dot") != layout.make_structure_hash(G, "neato")
+
+def test_structure_hash_depends_on_structure():
+    recipes = RecipeList("factorio_recipes.csv")
+    G = CombinedCraftingGraph.from_recipes("electronic_circuit", 1,
+                                           {"assembling_machine": 1}, recipes,
+                                           raw_materials).to_graph()
+    H = CombinedCraftingGraph.from_recipes("electronic_circuit", 1,
+                                           {"assembling_machine": 1}, recipes,
+                                           raw_materials + ["copper_cable"]).to_graph()
+    assert layout.make_structure_hash(G, "dot") != layout.make_structure_hash(H, "dot")
+
+def test_cached_graphviz_layout(tmp_path, monkeypatch):
+    calls = []
+    def fake_graphviz_layout(G, prog):
+        calls.append(prog)
+        return {n: (10.0 * n, 5.0) for n in G.nodes}
+    monkeypatch.setattr(layout, "graphviz_layout", fake_graphviz_layout)
+
+    G = make_tree_graph(1, 0.5)
+    pos = layout.cached_graphviz_layout(G, cache_folder=tmp_path)
+    assert pos == {n: (10.0 * n, 5.0) for n in G.nodes}
+
+    # Same structure at a different rate: read from the cache
+    H = make_tree_graph(3, 0.75)
+    assert layout.cached_graphviz_layout(H, cache_folder=tmp_path) == pos
+    assert calls == ["dot"]
+
+def test_corrupt_cached_layout_is_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(layout, "graphviz_layout",
+                        lambda G, prog: {n: (1.0, 2.0 * n) for n in G.nodes})
+    G = make_tree_graph(1, 0.5)
+    layout_path = layout.make_layout_path(layout.make_structure_hash(G, "dot"),
+                                          tmp_path)
+    with open(layout_path, "w") as f:
+        f.write('[[0, 1.0')
+    pos = layout.cached_graphviz_layout(G, cache_folder=tmp_path)
+    assert pos == {n: (1.0, 2.0 * n) for n in G.nodes}
+
+    # The file was rewritten, so the layout is read from it next time
+    monkeypatch.setattr(layout, "graphviz_layout", None)
+    assert layout.cached_graphviz_layout(G, cache_folder=tmp_path) == pos
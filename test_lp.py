@@ -0,0 +1,65 @@
+from recipe import RecipeList, CombinedCraftingGraph
+from planner import make_crafting_speeds
+from lp import MultiRecipeList, read_multi_recipes_csv
+from test_recipe import raw_materials
+import pytest
+
+oil_inputs = ["crude_oil", "water", "coal", "steam", "iron_plate", "copper_plate"]
+
+
+def make_multi_recipes():
+    return MultiRecipeList(RecipeList("factorio_recipes.csv"),
+                           "factorio_fluid_recipes.csv")
+
+def test_read_multi_recipes_csv():
+    recipes = read_multi_recipes_csv("factorio_fluid_recipes.csv")
+    advanced = recipes["advanced_oil_processing"]
+    assert advanced.ingredients == {"crude_oil": 100, "water": 50}
+    assert advanced.products == {"heavy_oil": 25, "light_oil": 45, "petroleum_gas": 55}
+    assert advanced.produced_by == "oil_refinery"
+
+def test_lp_matches_combined_graph_for_single_recipes():
+    recipes = RecipeList("factorio_recipes.csv")
+    speeds = make_crafting_speeds(2)
+    graph = CombinedCraftingGraph.from_recipes("utility_science_pack", 0.5, speeds,
+                                               recipes, raw_materials)
+    plan = MultiRecipeList(recipes).plan({"utility_science_pack": 0.5}, speeds,
+                                         raw_materials)
+    expected = {item: node["output_throughput"] for item, node in graph.nodes.items()
+                if graph.produced_by[item] is None}
+    assert plan["raw_input_throughput"] == pytest.approx(expected)
+    assert plan["machines"]["utility_science_pack"] == pytest.approx(
+        graph.nodes["utility_science_pack"]["num_machines"])
+    assert plan["surplus"] == {}
+
+def test_lp_chooses_cheapest_recipe():
+    plan = make_multi_recipes().plan({"petroleum_gas": 45}, make_crafting_speeds(1),
+                                     ["crude_oil", "water"])
+    assert plan["recipe_runs"] == pytest.approx({"basic_oil_processing": 1})
+    assert plan["raw_input_throughput"] == pytest.approx({"crude_oil": 100})
+
+def test_lp_by_products_are_surplus():
+    multi_recipes = make_multi_recipes()
+    del multi_recipes.recipes["basic_oil_processing"]
+    del multi_recipes.recipes["light_oil_cracking"]
+    plan = multi_recipes.plan({"petroleum_gas": 55}, make_crafting_speeds(1),
+                              ["crude_oil", "water"])
+    assert plan["recipe_runs"]["advanced_oil_processing"] == pytest.approx(1)
+    assert plan["surplus"] == pytest.approx({"heavy_oil": 25, "light_oil": 45})
+    assert "petroleum_gas" not in plan["surplus"]
+
+def test_lp_minimize_machines():
+    multi_recipes = make_multi_recipes()
+    speeds = make_crafting_speeds(1)
+    raw_plan = multi_recipes.plan({"rocket_fuel": 1}, speeds, oil_inputs)
+    machines_plan = multi_recipes.plan({"rocket_fuel": 1}, speeds, oil_inputs,
+                                       minimize="machines")
+    assert (sum(machines_plan["machines"].values()) <
+            sum(raw_plan["machines"].values()))
+    assert (sum(raw_plan["raw_input_throughput"].values()) <
+            sum(machines_plan["raw_input_throughput"].values()))
+
+def test_lp_infeasible():
+    with pytest.raises(ValueError, match="Cannot make"):
+        make_multi_recipes().plan({"plastic_bar": 1}, make_crafting_speeds(1),
+                                  ["water"])
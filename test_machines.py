@@ -0,0 +1,173 @@
+from recipe import RecipeList, CraftingTree, CombinedCraftingGraph
+from planner import make_crafting_speeds, Planner
+from machines import (MachineConfig, parse_machine_options,
+                      make_machine_settings, make_layouts,
+                      search_configurations)
+from ratios import minimal_perfect_throughput, get_ceiled_machines
+from test_recipe import raw_materials
+import pytest
+
+inputs = ["iron_ore", "copper_ore", "coal", "stone", "petroleum_gas",
+          "heavy_oil", "water"]
+
+
+def test_machine_config_effects():
+    config = MachineConfig.parse("assembling_machine_3+4*speed_module_3")
+    assert config.crafting_speed == pytest.approx(3.75)
+    assert config.productivity == 0
+    assert config.power == pytest.approx(375 * 3.8)
+
+    config = MachineConfig.parse(
+        "assembling_machine_3+4*productivity_module_3+8*beacon:speed_module_3")
+    assert config.name == "assembling_machine_3+4*productivity_module_3+8*beacon:speed_module_3"
+    assert config.crafting_speed == pytest.approx(1.25 * (1 - 0.6 + 4))
+    assert config.productivity == pytest.approx(0.4)
+    assert config.without_productivity().name == "assembling_machine_3+8*beacon:speed_module_3"
+
+    # Efficiency modules cannot cut the power below 20%
+    config = MachineConfig("chemical_plant", ["efficiency_module_3"] * 3)
+    assert config.power == pytest.approx(210 * 0.2)
+
+def test_machine_config_errors():
+    with pytest.raises(ValueError, match="module slots"):
+        MachineConfig.parse("assembling_machine_2+3*speed_module")
+    with pytest.raises(ValueError, match="beacons"):
+        MachineConfig.parse("assembling_machine_3+8*beacon:productivity_module")
+    with pytest.raises(ValueError, match="no effect"):
+        MachineConfig.parse("stone_furnace+8*beacon:speed_module")
+    with pytest.raises(ValueError, match="Unknown module"):
+        MachineConfig.parse("assembling_machine_3+fast_module")
+    with pytest.raises(ValueError, match="TARGET=MACHINE"):
+        parse_machine_options(["assembling_machine_3"])
+
+def test_make_machine_settings():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds, machine_classes, productivity = make_machine_settings(
+        parse_machine_options([
+            "assembling_machine=assembling_machine_3+4*productivity_module",
+            "furnace=electric_furnace+2*speed_module",
+            "copper_cable=assembling_machine_2+2*speed_module_3"]),
+        recipes, make_crafting_speeds(1))
+    assert crafting_speeds["furnace"] == pytest.approx(2 * 1.4)
+    assert crafting_speeds["assembling_machine"] == pytest.approx(1.25 * 0.8)
+
+    # Intermediates get the productivity, other recipes the same machine
+    # without the productivity modules
+    assert productivity["iron_gear_wheel"] == pytest.approx(0.16)
+    assert productivity["automation_science_pack"] == pytest.approx(0.16)
+    assert "lamp" not in productivity
+    assert machine_classes["lamp"] == "assembling_machine_3"
+    assert machine_classes["copper_cable"] == "assembling_machine_2+2*speed_module_3"
+    assert "copper_cable" not in productivity
+
+    with pytest.raises(ValueError, match="cannot be used"):
+        make_machine_settings(
+            parse_machine_options(["lamp=assembling_machine_3+productivity_module"]),
+            recipes, make_crafting_speeds(1))
+    with pytest.raises(ValueError, match="not a electric_furnace"):
+        make_machine_settings(
+            parse_machine_options(["copper_cable=electric_furnace"]),
+            recipes, make_crafting_speeds(1))
+
+def test_plans_with_productivity():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds, machine_classes, productivity = make_machine_settings(
+        parse_machine_options(["copper_cable=assembling_machine_3+4*productivity_module_3"]),
+        recipes, make_crafting_speeds(1))
+    tree = CraftingTree("electronic_circuit", 1, crafting_speeds, recipes,
+                        raw_materials, machine_classes=machine_classes,
+                        productivity=productivity)
+    copper_cable = tree.ingredients[1]
+    assert copper_cable.item == "copper_cable"
+    # 3 copper_cable/s, 2.8 per run, 0.5s per run at crafting speed 0.5
+    assert copper_cable.num_machines == pytest.approx(3 / 2.8)
+    assert tree.total_raw_input_throughput()["copper_plate"] == pytest.approx(3 / 2.8)
+
+    graph = CombinedCraftingGraph.from_recipes(
+        "electronic_circuit", 1, crafting_speeds, recipes, raw_materials,
+        machine_classes, productivity)
+    steady_state = CombinedCraftingGraph.from_steady_state(
+        "electronic_circuit", 1, crafting_speeds, recipes, raw_materials,
+        machine_classes, productivity)
+    for item, node in graph.nodes.items():
+        assert steady_state.nodes[item]["num_machines"] == pytest.approx(node["num_machines"])
+        assert steady_state.nodes[item]["output_throughput"] == pytest.approx(
+            node["output_throughput"])
+
+    # The exact counts use the productivity too
+    numerator, denominator = minimal_perfect_throughput(graph, recipes)
+    graph.rescale(numerator / denominator)
+    assert all(utilisation == 1.0 for _, utilisation
+               in get_ceiled_machines(graph, recipes).values())
+
+def test_make_layouts():
+    layouts = make_layouts("furnace", module_names=["speed_module"],
+                           beacon_counts=[0, 8])
+    assert [layout.name for layout in layouts] == [
+        "stone_furnace", "steel_furnace", "electric_furnace",
+        "electric_furnace+8*beacon:speed_module_3",
+        "electric_furnace+2*speed_module",
+        "electric_furnace+2*speed_module+8*beacon:speed_module_3"]
+    # No modules at all, rather than every module
+    assert [layout.name for layout in make_layouts("furnace", module_names=[])] == [
+        "stone_furnace", "steel_furnace", "electric_furnace"]
+
+def test_search_configurations_matches_plan():
+    recipes = RecipeList("factorio_recipes.csv")
+    for minimize in ("machines", "power"):
+        result = search_configurations("chemical_science_pack", 0.5, recipes,
+                                       inputs, minimize, beacon_counts=[0, 4])
+
+        # The totals are the same as for the plan made with those machines
+        crafting_speeds, machine_classes, productivity = make_machine_settings(
+            result["configs"], recipes, make_crafting_speeds(1))
+        graph = CombinedCraftingGraph.from_recipes(
+            "chemical_science_pack", 0.5, crafting_speeds, recipes, inputs,
+            machine_classes, productivity)
+        assert sum(node["num_machines"] for node in graph.nodes.values()) == pytest.approx(
+            result["total_machines"])
+        assert sum(result["machines"][item] * config.power
+                   for item, config in result["configs"].items()) == pytest.approx(
+            result["total_power"])
+
+    # Nothing can beat the fastest machines when there is only one layout
+    # with speed modules
+    fewest = search_configurations("electronic_circuit", 1, recipes, inputs,
+                                   machine_names=["assembling_machine_3", "electric_furnace"],
+                                   module_names=["speed_module_3"])
+    assert {config.name for config in fewest["configs"].values()} == {
+        "assembling_machine_3+4*speed_module_3", "electric_furnace+2*speed_module_3"}
+
+def test_search_configurations_rounds_up():
+    recipes = RecipeList("factorio_recipes.csv")
+    result = search_configurations("electronic_circuit", 1, recipes, inputs,
+                                   round_up=True)
+    assert all(machines == int(machines) for machines in result["machines"].values())
+    with pytest.raises(ValueError, match="minimize"):
+        search_configurations("electronic_circuit", 1, recipes, inputs, "pollution")
+
+def test_planner_query_with_machines():
+    planner = Planner()
+    result = planner.query({
+        "item": "electronic_circuit",
+        "furnace": "steel_furnace",
+        "machines": {"assembling_machine": "assembling_machine_3+4*speed_module_3"},
+        "combine": True,
+    })
+    machines = {machine["item"]: machine["num_machines"] for machine in result["machines"]}
+    assert machines["electronic_circuit"] == pytest.approx(0.5 / 3.75)
+    assert machines["iron_plate"] == pytest.approx(3.2 / 2)
+    with pytest.raises(ValueError, match="not a furnace"):
+        make_crafting_speeds(1, "chemical_plant")
+
+def test_planner_default_machines():
+    planner = Planner(furnace="electric_furnace",
+                      machines={"assembling_machine": "assembling_machine_3"})
+    result = planner.query({"item": "electronic_circuit", "combine": True,
+                            "machines": {"copper_cable": "assembling_machine_2"}})
+    machines = {machine["item"]: machine["num_machines"] for machine in result["machines"]}
+    assert machines["electronic_circuit"] == pytest.approx(0.5 / 1.25)
+    assert machines["copper_cable"] == pytest.approx(1.5 * 0.5 / 0.75)
+    assert machines["iron_plate"] == pytest.approx(3.2 / 2)
+    with pytest.raises(ValueError, match="cannot make"):
+        Planner(machines={"furnace": "assembling_machine_3"})
@@ -0,0 +1,136 @@
+from recipe import RecipeList
+from planner import (make_crafting_speeds, make_plan, summarise_plan,
+                     format_plan_text, Planner, serve_stream,
+                     make_unix_socket_server)
+from test_recipe import raw_materials
+import io
+import json
+import os
+import socket
+import threading
+import pytest
+
+
+def test_summarise_crafting_tree():
+    recipes = RecipeList("factorio_recipes.csv")
+    plan = make_plan("military_science_pack", 150.0/60,
+                     {"assembling_machine": 1.25}, recipes, raw_materials)
+    summary = summarise_plan(plan)
+    assert [(m["item"], m["depth"]) for m in summary["machines"]] == [
+        ("military_science_pack", 0), ("grenade", 1), ("wall", 1),
+        ("piercing_rounds_magazine", 1), ("firearm_magazine", 2)]
+    assert summary["machines"][1]["num_machines"] == 8.0
+    assert summary["raw_input_throughput"] == {
+        "coal": 12.5, "iron_plate": 11.25, "copper_plate": 6.25,
+        "steel_plate": 1.25, "stone_brick": 12.5}
+    json.dumps(summary)
+
+def test_summarise_combined_graph():
+    recipes = RecipeList("factorio_recipes.csv")
+    plan = make_plan("military_science_pack", 150.0/60,
+                     {"assembling_machine": 1.25}, recipes, raw_materials,
+                     combine=True)
+    summary = summarise_plan(plan)
+    assert {m["item"] for m in summary["machines"]} == {
+        "military_science_pack", "grenade", "wall",
+        "piercing_rounds_magazine", "firearm_magazine"}
+    assert summary["raw_input_throughput"] == pytest.approx({
+        "coal": 12.5, "iron_plate": 11.25, "copper_plate": 6.25,
+        "steel_plate": 1.25, "stone_brick": 12.5})
+
+def test_format_plan_text():
+    recipes = RecipeList("factorio_recipes.csv")
+    plan = make_plan("automation_science_pack", 0.5, make_crafting_speeds(1),
+                     recipes, raw_materials)
+    text = format_plan_text("automation_science_pack", 0.5,
+                            summarise_plan(plan))
+    assert text.splitlines() == [
+        "Machines required to make 30.0 automation_science_pack per minute:",
+        "  automation_science_pack: 5.0 machines, 0.50/s",
+        "    iron_gear_wheel: 0.5 machines, 0.50/s",
+        "Raw input throughputs:",
+        "  copper_plate: 0.50/s",
+        "  iron_plate: 1.00/s",
+    ]
+
+def test_format_plan_text_with_ceiled_machines():
+    recipes = RecipeList("factorio_recipes.csv")
+    plan = make_plan("automation_science_pack", 0.5, make_crafting_speeds(1),
+                     recipes, raw_materials)
+    text = format_plan_text("automation_science_pack", 0.5,
+                            summarise_plan(plan, recipes))
+    assert text.splitlines()[1:3] == [
+        "  automation_science_pack: 5.0 machines (5 at 100%), 0.50/s",
+        "    iron_gear_wheel: 0.5 machines (1 at 50%), 0.50/s",
+    ]
+
+### Tests for the long-lived planner
+
+def test_planner_query_is_cached():
+    planner = Planner()
+    result = planner.query({"item": "greencircuit", "rate": 30,
+                            "assembling_machine": 2})
+    assert result["item"] == "electronic_circuit"
+    assert result["output_throughput"] == 0.5
+    assert result["machines"][0]["num_machines"] == pytest.approx(0.5/0.75*0.5)
+    assert planner.query({"item": "electronic_circuit", "rate": 30.0,
+                          "assembling_machine": 2}) is result
+
+def test_planner_handle_line():
+    planner = Planner()
+    answer = json.loads(planner.handle_line(
+        '{"item": "iron_gear_wheel", "rate": 120, "combine": true}'))
+    assert answer["raw_input_throughput"] == {"iron_ore": 4.0}
+    error = json.loads(planner.handle_line('{"item": "not_an_item"}'))
+    assert "not_an_item" in error["error"]
+    assert planner.handle_line("gear 120").startswith(
+        "Machines required to make 120.0 iron_gear_wheel per minute:")
+
+def test_serve_stream():
+    planner = Planner()
+    output_stream = io.StringIO()
+    serve_stream(planner, io.StringIO('{"item": "wall"}\n\n{"item": "pipe"}\n'),
+                 output_stream)
+    answers = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+    assert [answer["item"] for answer in answers] == ["wall", "pipe"]
+
+def test_unix_socket_server(tmp_path):
+    planner = Planner()
+    socket_path = str(tmp_path / "planner.sock")
+    with make_unix_socket_server(planner, socket_path) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(socket_path)
+                client.sendall(b'{"item": "wall", "rate": 60}\n')
+                answer = json.loads(client.makefile().readline())
+        finally:
+            server.shutdown()
+            thread.join()
+    assert answer["raw_input_throughput"] == {"stone": 10.0}
+    # The socket is removed when the server is closed
+    assert not os.path.exists(socket_path)
+
+def test_unix_socket_server_keeps_other_files(tmp_path):
+    planner = Planner()
+    file_path = tmp_path / "precious.txt"
+    file_path.write_text("keep me")
+    with pytest.raises(ValueError, match="not a socket"):
+        make_unix_socket_server(planner, str(file_path))
+    assert file_path.read_text() == "keep me"
+
+def test_combined_plan_with_cyclic_recipes(tmp_path):
+    from test_compiled import make_cyclic_recipes, cyclic_speeds
+    recipes = make_cyclic_recipes(tmp_path)
+    plan = make_plan("fuel_cell", 1, cyclic_speeds, recipes, ["ore", "iron_plate"],
+                     combine=True)
+    summary = summarise_plan(plan)
+    assert summary["raw_input_throughput"] == pytest.approx({"ore": 5, "iron_plate": 2})
+
+def test_parse_supply():
+    from planner import parse_supply
+    assert parse_supply(["iron_plate=45", "copper_plate=30.5"]) == {
+        "iron_plate": 45, "copper_plate": 30.5}
+    with pytest.raises(ValueError):
+        parse_supply(["iron_plate"])
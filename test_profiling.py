@@ -0,0 +1,38 @@
+import json
+from recipe import RecipeList, CraftingTree
+from test_recipe import raw_materials
+import profiling
+
+
+def test_profile_records_phases_and_counters():
+    profile = profiling.start_profile()
+    recipes = RecipeList("factorio_recipes.csv")
+    with profiling.phase("plan"):
+        with profiling.phase("tree"):
+            tree = CraftingTree("electronic_circuit", 1, {"assembling_machine": 1},
+                                recipes, raw_materials)
+        G = tree.to_graph()
+    assert profiling.stop_profile() is profile
+
+    assert list(profile.phases) == ["load recipes", "plan/tree", "plan"]
+    assert profile.phases["plan"][0] == 1
+    assert profile.phases["plan"][1] >= profile.phases["plan/tree"][1]
+    # electronic_circuit -> iron_plate, copper_cable -> copper_plate
+    assert profile.counters["tree nodes created"] == 4
+    # Both recipes are looked up by the cycle check and again by the tree
+    assert profile.counters["recipe lookups"] == 4
+    assert profile.counters["graph nodes"] == G.number_of_nodes()
+    assert profile.counters["graph edges"] == G.number_of_edges()
+
+    report = json.loads(profile.format_json())
+    assert report["counters"]["tree nodes created"] == 4
+    assert "  tree" in profile.format_table()
+
+def test_nothing_recorded_without_profile():
+    assert profiling.stop_profile() is None
+    recipes = RecipeList("factorio_recipes.csv")
+    CraftingTree("electronic_circuit", 1, {"assembling_machine": 1}, recipes,
+                 raw_materials)
+    with profiling.phase("plan"):
+        profiling.count("anything")
+    assert profiling.active_profile is None
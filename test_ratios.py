@@ -0,0 +1,69 @@
+from recipe import RecipeList, CraftingTree, CombinedCraftingGraph
+from planner import make_crafting_speeds, make_plan, summarise_plan
+from ratios import (make_ratio, ExactRecipes, get_machine_ratios,
+                    minimal_perfect_throughput, round_up_throughput,
+                    get_ceiled_machines)
+from test_recipe import raw_materials
+from test_compiled import cyclic_speeds, make_cyclic_recipes
+import pytest
+
+
+def test_make_ratio():
+    assert make_ratio(3) == (3, 1)
+    assert make_ratio(3.2) == (16, 5)
+    assert make_ratio(0.75) == (3, 4)
+    assert make_ratio(1 / 60) == (1, 60)
+
+def test_perfect_throughput_of_tree_and_graph():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds = make_crafting_speeds(1)
+    tree = CraftingTree("electronic_circuit", 1, crafting_speeds, recipes,
+                        raw_materials)
+    graph = CombinedCraftingGraph.from_recipes("electronic_circuit", 1,
+                                               crafting_speeds, recipes,
+                                               raw_materials)
+    # 1.5 copper_cable machines per electronic_circuit/second
+    assert get_machine_ratios(graph, recipes) == {
+        "electronic_circuit": (1, 1), "copper_cable": (3, 2)}
+    assert minimal_perfect_throughput(tree, recipes) == (2, 1)
+    assert minimal_perfect_throughput(graph, recipes) == (2, 1)
+
+def test_round_up_throughput():
+    assert round_up_throughput(1.0, (2, 1)) == (2, 1)
+    assert round_up_throughput(2.0, (2, 1)) == (2, 1)
+    assert round_up_throughput(5.0, (2, 1)) == (6, 1)
+    assert round_up_throughput(1 / 60, (1, 3)) == (1, 3)
+
+def test_ceiled_machines():
+    recipes = RecipeList("factorio_recipes.csv")
+    graph = CombinedCraftingGraph.from_recipes("electronic_circuit", 1,
+                                               make_crafting_speeds(1),
+                                               recipes, raw_materials)
+    assert get_ceiled_machines(graph, recipes) == {
+        "electronic_circuit": (1, 1.0), "copper_cable": (2, 0.75)}
+
+def test_perfect_rates_over_catalog():
+    recipes = RecipeList("factorio_recipes.csv")
+    exact_recipes = ExactRecipes(recipes)
+    crafting_speeds = make_crafting_speeds(2)
+    items = recipes.compile().get_raw_material_counts(raw_materials)
+    for item in items:
+        if item in raw_materials:
+            continue
+        for combine in (False, True):
+            plan = make_plan(item, 1, crafting_speeds, recipes, raw_materials,
+                             combine)
+            numerator, denominator = minimal_perfect_throughput(plan, exact_recipes)
+            plan.rescale(numerator / denominator)
+            for num_machines, utilisation in get_ceiled_machines(
+                    plan, exact_recipes).values():
+                assert utilisation == 1.0
+
+def test_cyclic_plan_has_no_exact_counts(tmp_path):
+    recipes = make_cyclic_recipes(tmp_path)
+    plan = make_plan("fuel_cell", 1, cyclic_speeds, recipes, ["ore", "iron_plate"],
+                     combine=True)
+    with pytest.raises(ValueError, match="cycle"):
+        get_machine_ratios(plan, recipes)
+    summary = summarise_plan(plan, recipes)
+    assert all("ceiled_machines" not in machine for machine in summary["machines"])
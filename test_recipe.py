@@ -1,5 +1,6 @@
+import recipe
 from recipe import Recipe
-from recipe import RecipeList, AssemblerTree
+from recipe import RecipeList, CraftingTree, CombinedCraftingGraph
 import pytest
 
 raw_materials = [
@@ -18,134 +19,199 @@ raw_materials = [
     "electric_engine_unit"
 ]
 
+### Tests for the recipes cache
+
+def write_recipes_csv(path, rows):
+    header = "item,resource,quantity,time,num_produced,produced_by"
+    path.write_text("\n".join([header] + rows) + "\n")
+
+def test_recipes_cache_is_used(tmp_path, monkeypatch):
+    recipes_csv = tmp_path / "recipes.csv"
+    write_recipes_csv(recipes_csv, ["iron_gear_wheel,iron_plate,2,0.5,1,assembling_machine"])
+    recipes = RecipeList(recipes_csv)
+    assert (tmp_path / "recipes.csv.cache").exists()
+
+    # The second time, the csv file should not be parsed at all
+    def fail(factorio_recipes_csv):
+        raise AssertionError("recipes csv should not be read")
+    monkeypatch.setattr(recipe, "read_recipes_csv", fail)
+    cached_recipes = RecipeList(recipes_csv)
+    cached_recipe = cached_recipes.get_recipe("iron_gear_wheel")
+    assert cached_recipe.ingredients == {"iron_plate": 2}
+    assert cached_recipe.time == 0.5
+    assert cached_recipe.num_produced == 1
+    assert cached_recipe.produced_by == "assembling_machine"
+    assert cached_recipes.recipes.keys() == recipes.recipes.keys()
+
+def test_recipes_cache_is_rebuilt_when_csv_changes(tmp_path):
+    recipes_csv = tmp_path / "recipes.csv"
+    write_recipes_csv(recipes_csv, ["iron_gear_wheel,iron_plate,2,0.5,1,assembling_machine"])
+    RecipeList(recipes_csv)
+    write_recipes_csv(recipes_csv, ["iron_gear_wheel,iron_plate,3,0.5,1,assembling_machine"])
+    recipes = RecipeList(recipes_csv)
+    assert recipes.get_recipe("iron_gear_wheel").ingredients == {"iron_plate": 3}
+
+def test_recipes_cache_ignores_corrupt_file(tmp_path):
+    recipes_csv = tmp_path / "recipes.csv"
+    write_recipes_csv(recipes_csv, ["iron_gear_wheel,iron_plate,2,0.5,1,assembling_machine"])
+    (tmp_path / "recipes.csv.cache").write_bytes(b"not a pickle")
+    recipes = RecipeList(recipes_csv)
+    assert recipes.get_recipe("iron_gear_wheel").ingredients == {"iron_plate": 2}
+
 ### Test for raw materials
 
 def test_electronic_circuit_raw_material_counts():
-    recipes = RecipeList("factorio_recipes.ods")
+    recipes = RecipeList("factorio_recipes.csv")
     counts = recipes.get_raw_material_counts("electronic_circuit", raw_materials)
     assert counts == {"copper_plate": 1.5, "iron_plate": 1}
 
 def test_advanced_circuit_raw_material_counts():
-    recipes = RecipeList("factorio_recipes.ods")
+    recipes = RecipeList("factorio_recipes.csv")
     counts = recipes.get_raw_material_counts("advanced_circuit", raw_materials)
     assert counts == {"copper_plate": 5, "iron_plate": 2, "plastic_bar": 2}
 
 def test_processing_unit_raw_material_counts():
-    recipes = RecipeList("factorio_recipes.ods")
+    recipes = RecipeList("factorio_recipes.csv")
     counts = recipes.get_raw_material_counts("processing_unit", raw_materials)
     assert counts == {"copper_plate": 40, "iron_plate": 24, "plastic_bar": 4, "sulfuric_acid": 5}
 
 def test_flying_robot_frame_raw_material_counts():
-    recipes = RecipeList("factorio_recipes.ods")
+    recipes = RecipeList("factorio_recipes.csv")
     counts = recipes.get_raw_material_counts("flying_robot_frame", raw_materials)
     assert counts == {"copper_plate": 4.5, "iron_plate": 3, "steel_plate": 1,
                       "battery": 2, "electric_engine_unit": 1,}
 
 def test_production_science_raw_material_counts():
-    recipes = RecipeList("factorio_recipes.ods")
+    recipes = RecipeList("factorio_recipes.csv")
     counts = recipes.get_raw_material_counts("production_science_pack", raw_materials)
     assert counts == pytest.approx({"copper_plate": 57.5/3, "iron_plate": 32.5/3,
                                     "steel_plate": 25.0/3, "plastic_bar": 20.0/3,
                                     "stone": 15.0/3, "stone_brick": 10.0/3})
 
+def test_raw_material_counts_are_memoized():
+    recipes = RecipeList("factorio_recipes.csv")
+    counts = recipes.get_raw_material_counts("processing_unit", raw_materials)
+    # Modifying the result must not affect later queries
+    counts["copper_plate"] = 0
+    assert recipes.get_raw_material_counts("processing_unit", raw_materials) == {
+        "copper_plate": 40, "iron_plate": 24, "plastic_bar": 4, "sulfuric_acid": 5}
+    # Intermediate items are cached on the way
+    cache = recipes.raw_material_cache[frozenset(raw_materials)]
+    assert cache["electronic_circuit"] == {"copper_plate": 1.5, "iron_plate": 1}
+
+def test_raw_material_counts_depend_on_raw_materials():
+    recipes = RecipeList("factorio_recipes.csv")
+    recipes.get_raw_material_counts("advanced_circuit", raw_materials)
+    counts = recipes.get_raw_material_counts(
+        "advanced_circuit", raw_materials + ["electronic_circuit"])
+    assert counts == {"copper_plate": 2, "electronic_circuit": 2, "plastic_bar": 2}
+
+def test_topological_order():
+    recipes = RecipeList("factorio_recipes.csv")
+    order = recipes.get_topological_order("electronic_circuit", raw_materials)
+    assert order[-1] == "electronic_circuit"
+    assert order.index("copper_plate") < order.index("copper_cable")
+    assert sorted(order) == ["copper_cable", "copper_plate", "electronic_circuit",
+                             "iron_plate"]
+
 ### Tests for assemblers required
 
-def test_assemblers_required_for_automation_science_pack():
-    recipes = RecipeList("factorio_recipes.ods")
+def test_machines_required_for_automation_science_pack():
+    recipes = RecipeList("factorio_recipes.csv")
     recipe = recipes.get_recipe("automation_science_pack")
     # Using a human
-    assert recipe.assemblers_required(10, 1) == 50
+    assert recipe.machines_required(10, 1) == 50
     # Using assembly_machine_1
-    assert recipe.assemblers_required(10, 0.5) == 100
+    assert recipe.machines_required(10, 0.5) == 100
     # Using assembly_machine_2
-    assert recipe.assemblers_required(10, 0.75) == 200.0/3
+    assert recipe.machines_required(10, 0.75) == 200.0/3
     # Using assembly_machine_3
-    assert recipe.assemblers_required(10, 1.25) == 40
+    assert recipe.machines_required(10, 1.25) == 40
 
     
-def test_assemblers_required_for_advanced_circuit():
-    recipes = RecipeList("factorio_recipes.ods")
+def test_machines_required_for_advanced_circuit():
+    recipes = RecipeList("factorio_recipes.csv")
     recipe = recipes.get_recipe("advanced_circuit")
-    assert recipe.assemblers_required(0.5, 0.5) == 6
-    assert recipe.assemblers_required(3, 0.5) == 36
-    assert recipe.assemblers_required(1, 0.5) == 12
+    assert recipe.machines_required(0.5, 0.5) == 6
+    assert recipe.machines_required(3, 0.5) == 36
+    assert recipe.machines_required(1, 0.5) == 12
 
-def test_assemblers_required_for_copper_cable():
-    recipes = RecipeList("factorio_recipes.ods")
+def test_machines_required_for_copper_cable():
+    recipes = RecipeList("factorio_recipes.csv")
     recipe = recipes.get_recipe("copper_cable")
-    assert recipe.assemblers_required(4, 1) == 1
-    assert recipe.assemblers_required(63, 0.75) == 21
+    assert recipe.machines_required(4, 1) == 1
+    assert recipe.machines_required(63, 0.75) == 21
 
 ### Tests for number of ingredient assemblers
 def test_ingredient_assemblers_for_productivity_module():
-    recipes = RecipeList("factorio_recipes.ods")
-    num_assemblers = recipes.ingredient_assemblers_per_recipe("productivity_module", 1, raw_materials)
+    recipes = RecipeList("factorio_recipes.csv")
+    num_assemblers = recipes.ingredient_machines_per_recipe("productivity_module", 1, raw_materials)
     assert num_assemblers == pytest.approx({"electronic_circuit": 5.0/30 ,
                                             "advanced_circuit": 2})
 
 def test_ingredient_assemblers_for_logistic_science_pack():
-    recipes = RecipeList("factorio_recipes.ods")
-    num_assemblers = recipes.ingredient_assemblers_per_recipe("logistic_science_pack", 0.5, raw_materials)
+    recipes = RecipeList("factorio_recipes.csv")
+    num_assemblers = recipes.ingredient_machines_per_recipe("logistic_science_pack", 0.5, raw_materials)
     assert num_assemblers == pytest.approx({"inserter": 1.0/12, "transport_belt": 1.0/12})
 
 def test_ingredient_assemblers_for_automation_science_pack():
-    recipes = RecipeList("factorio_recipes.ods")
-    num_assemblers = recipes.ingredient_assemblers_per_recipe("automation_science_pack", 0.5, raw_materials)
+    recipes = RecipeList("factorio_recipes.csv")
+    num_assemblers = recipes.ingredient_machines_per_recipe("automation_science_pack", 0.5, raw_materials)
     assert num_assemblers == pytest.approx({"iron_gear_wheel": 0.1})
 
 ### Test full assembler tree
 
 def test_military_science_pack_assembler_tree():
-    recipes = RecipeList("factorio_recipes.ods")
-    assembler_tree = AssemblerTree("military_science_pack", 150.0/60, 1.25,
-                                   recipes, raw_materials)
+    recipes = RecipeList("factorio_recipes.csv")
+    assembler_tree = CraftingTree("military_science_pack", 150.0/60, {"assembling_machine": 1.25},
+                                  recipes, raw_materials)
     # Taken from the factorio wiki
     expected = {
         'item': 'military_science_pack',
-        'assemblers': 10.0,
+        'machines': 10.0,
         'output_throughput': 2.5,
         'ingredients': [
             {
                 'item': 'grenade',
-                'assemblers': 8.0,
+                'machines': 8.0,
                 'output_throughput': 1.25,
                 'ingredients': [
-                    {'item': 'coal', 'assemblers': 0, 'output_throughput': 12.5,
-                     'ingredients': []},
-                    {'item': 'iron_plate', 'assemblers': 0,
-                     'output_throughput': 6.25, 'ingredients': []}
+                    {'item': 'iron_plate', 'machines': 0,
+                     'output_throughput': 6.25, 'ingredients': []},
+                    {'item': 'coal', 'machines': 0, 'output_throughput': 12.5,
+                     'ingredients': []}
                 ]
             },
+            {'item': 'wall', 'machines': 1.0, 'output_throughput': 2.5,
+             'ingredients': [{'item': 'stone_brick', 'machines': 0,
+                              'output_throughput': 12.5, 'ingredients': []}]},
             {
                 'item': 'piercing_rounds_magazine',
-                'assemblers': 3.0,
+                'machines': 3.0,
                 'output_throughput': 1.25,
                 'ingredients': [
-                    {'item': 'copper_plate', 'assemblers': 0, 'output_throughput': 6.25,
+                    {'item': 'copper_plate', 'machines': 0, 'output_throughput': 6.25,
                      'ingredients': []},
                     {
                         'item': 'firearm_magazine',
-                        'assemblers': 1.0,
+                        'machines': 1.0,
                         'output_throughput': 1.25,
-                        'ingredients': [{'item': 'iron_plate', 'assemblers': 0,
+                        'ingredients': [{'item': 'iron_plate', 'machines': 0,
                                          'output_throughput': 5.0, 'ingredients': []}]
                     },
-                    {'item': 'steel_plate', 'assemblers': 0, 'output_throughput': 1.25,
+                    {'item': 'steel_plate', 'machines': 0, 'output_throughput': 1.25,
                      'ingredients': []}
                 ]
-            },
-            {'item': 'wall', 'assemblers': 1.0, 'output_throughput': 2.5,
-             'ingredients': [{'item': 'stone_brick', 'assemblers': 0,
-                              'output_throughput': 12.5, 'ingredients': []}]}
+            }
         ]
     }
     assert assembler_tree.to_dict() == expected
     
 
 def test_military_science_pack_total_raw_input_throughput():
-    recipes = RecipeList("factorio_recipes.ods")
-    assembler_tree = AssemblerTree("military_science_pack", 150.0/60, 1.25,
-                                   recipes, raw_materials)
+    recipes = RecipeList("factorio_recipes.csv")
+    assembler_tree = CraftingTree("military_science_pack", 150.0/60, {"assembling_machine": 1.25},
+                                  recipes, raw_materials)
     # Taken from the factorio wiki
     expected = {
         'coal': 12.5,
@@ -156,6 +222,190 @@ def test_military_science_pack_total_raw_input_throughput():
     }
 
     assert assembler_tree.total_raw_input_throughput() == expected
-    
 
-    
+
+def test_military_science_pack_to_graph():
+    recipes = RecipeList("factorio_recipes.csv")
+    assembler_tree = CraftingTree("military_science_pack", 150.0/60,
+                                  {"assembling_machine": 1.25}, recipes,
+                                  raw_materials)
+    G = assembler_tree.to_graph()
+    # Nodes are numbered in depth-first order, and icons are not loaded
+    assert [G.nodes[n]["item"] for n in G.nodes] == [
+        "military_science_pack", "grenade", "iron_plate", "coal", "wall",
+        "stone_brick", "piercing_rounds_magazine", "copper_plate",
+        "firearm_magazine", "iron_plate", "steel_plate"]
+    assert G.nodes[1] == {"item": "grenade", "num_machines": 8.0,
+                          "output_throughput": 1.25}
+    assert G.number_of_edges() == 10
+    assert G.has_edge(6, 8) and G.has_edge(8, 9)
+
+def test_deep_crafting_tree(tmp_path):
+    # A chain of recipes much deeper than the recursion limit
+    depth = 2000
+    recipes_csv = tmp_path / "chain.csv"
+    rows = ["item,resource,quantity,time,num_produced,produced_by"]
+    rows += [f"item_{n},item_{n + 1},1,1.0,1,assembling_machine"
+             for n in range(depth)]
+    recipes_csv.write_text("\n".join(rows) + "\n")
+    recipes = RecipeList(recipes_csv)
+    raw = [f"item_{depth}"]
+
+    assembler_tree = CraftingTree("item_0", 1, {"assembling_machine": 1},
+                                  recipes, raw)
+    assert assembler_tree.total_raw_input_throughput() == {raw[0]: 1.0}
+    assert len(assembler_tree.store) == depth + 1
+    assert assembler_tree.to_graph().number_of_edges() == depth
+    assert recipes.get_raw_material_counts("item_0", raw) == {raw[0]: 1.0}
+
+def test_crafting_tree_ingredient_views():
+    recipes = RecipeList("factorio_recipes.csv")
+    assembler_tree = CraftingTree("military_science_pack", 150.0/60,
+                                  {"assembling_machine": 1.25}, recipes,
+                                  raw_materials)
+    grenade, wall, piercing_rounds_magazine = assembler_tree.ingredients
+    assert grenade.item == "grenade"
+    assert grenade.num_machines == 8.0
+    assert wall.to_dict()["ingredients"][0]["item"] == "stone_brick"
+    assert piercing_rounds_magazine.total_raw_input_throughput() == {
+        "copper_plate": 6.25, "iron_plate": 5.0, "steel_plate": 1.25}
+    assert not grenade.is_raw_material()
+    assert grenade.ingredients[0].is_raw_material()
+
+def test_interned_crafting_tree_matches_crafting_tree():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds = {"assembling_machine": 0.75, "chemical_plant": 1}
+    assembler_tree = CraftingTree("stack_inserter", 1, crafting_speeds,
+                                  recipes, raw_materials)
+    interned_tree = CraftingTree("stack_inserter", 1, crafting_speeds,
+                                 recipes, raw_materials, interned=True)
+    # Identical subtrees (e.g. the electronic_circuits) are only stored once
+    assert len(interned_tree.store) < len(assembler_tree.store)
+    assert interned_tree.to_dict() == assembler_tree.to_dict()
+    assert interned_tree.total_raw_input_throughput() == pytest.approx(
+        assembler_tree.total_raw_input_throughput())
+    assert list(interned_tree.to_graph().edges) == list(
+        assembler_tree.to_graph().edges)
+
+def test_interned_crafting_tree_memoizes_raw_inputs():
+    recipes = RecipeList("factorio_recipes.csv")
+    interned_tree = CraftingTree("military_science_pack", 150.0/60,
+                                 {"assembling_machine": 1.25}, recipes,
+                                 raw_materials, interned=True)
+    expected = {"coal": 12.5, "iron_plate": 11.25, "copper_plate": 6.25,
+                "steel_plate": 1.25, "stone_brick": 12.5}
+    totals = interned_tree.total_raw_input_throughput()
+    assert totals == expected
+    totals["coal"] = 0
+    assert interned_tree.total_raw_input_throughput() == expected
+
+### Tests for the combined graph
+
+def test_combined_graph_from_recipes_matches_crafting_tree():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds = {"assembling_machine": 0.75, "chemical_plant": 1}
+    for item in ["production_science_pack", "utility_science_pack"]:
+        assembler_tree = CraftingTree(item, 0.5, crafting_speeds, recipes,
+                                      raw_materials)
+        expected = CombinedCraftingGraph(assembler_tree)
+        graph = CombinedCraftingGraph.from_recipes(item, 0.5, crafting_speeds,
+                                                   recipes, raw_materials)
+        assert graph.edges == expected.edges
+        assert graph.nodes.keys() == expected.nodes.keys()
+        for node_item, node in graph.nodes.items():
+            assert node == pytest.approx(expected.nodes[node_item])
+
+def test_combined_graph_military_science_pack():
+    recipes = RecipeList("factorio_recipes.csv")
+    graph = CombinedCraftingGraph.from_recipes(
+        "military_science_pack", 150.0/60, {"assembling_machine": 1.25},
+        recipes, raw_materials)
+    assert graph.nodes["iron_plate"] == {"num_machines": 0,
+                                         "output_throughput": 11.25}
+    assert graph.nodes["grenade"]["num_machines"] == 8
+
+### Tests for rescaling
+
+def test_crafting_tree_rescale_and_update_speeds():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds = {"assembling_machine": 0.5, "chemical_plant": 1}
+    for interned in [False, True]:
+        assembler_tree = CraftingTree("utility_science_pack", 1, crafting_speeds,
+                                      recipes, raw_materials, interned)
+        assembler_tree.total_raw_input_throughput()
+        assembler_tree.rescale(2.5)
+        assembler_tree.update_speeds({"assembling_machine": 1.25})
+        expected = CraftingTree("utility_science_pack", 2.5,
+                                {"assembling_machine": 1.25, "chemical_plant": 1},
+                                recipes, raw_materials)
+        G = assembler_tree.to_graph()
+        H = expected.to_graph()
+        for n in H.nodes:
+            assert G.nodes[n]["item"] == H.nodes[n]["item"]
+            assert G.nodes[n]["num_machines"] == pytest.approx(H.nodes[n]["num_machines"])
+            assert G.nodes[n]["output_throughput"] == pytest.approx(
+                H.nodes[n]["output_throughput"])
+        assert assembler_tree.total_raw_input_throughput() == pytest.approx(
+            expected.total_raw_input_throughput())
+
+def test_combined_graph_rescale_and_update_speeds():
+    recipes = RecipeList("factorio_recipes.csv")
+    crafting_speeds = {"assembling_machine": 0.5, "chemical_plant": 1}
+    expected = CombinedCraftingGraph.from_recipes(
+        "utility_science_pack", 2.5, {"assembling_machine": 1.25, "chemical_plant": 1},
+        recipes, raw_materials)
+    graphs = [
+        CombinedCraftingGraph.from_recipes("utility_science_pack", 1,
+                                           crafting_speeds, recipes, raw_materials),
+        CombinedCraftingGraph(CraftingTree("utility_science_pack", 1,
+                                           crafting_speeds, recipes, raw_materials)),
+    ]
+    for graph in graphs:
+        graph.rescale(2.5)
+        graph.update_speeds({"assembling_machine": 1.25})
+        for item, node in graph.nodes.items():
+            assert node == pytest.approx(expected.nodes[item])
+
+def test_cyclic_recipes_raise_instead_of_looping(tmp_path):
+    from test_compiled import make_cyclic_recipes, cyclic_speeds
+    recipes = make_cyclic_recipes(tmp_path)
+    with pytest.raises(ValueError, match="cycle"):
+        recipes.get_raw_material_counts("fuel_cell", ["ore", "iron_plate"])
+    with pytest.raises(ValueError, match="cycle"):
+        recipes.get_item_dependencies("fuel_cell", ["ore", "iron_plate"])
+    with pytest.raises(ValueError, match="cycle"):
+        CraftingTree("fuel_cell", 1, cyclic_speeds, recipes, ["ore", "iron_plate"])
+    with pytest.raises(ValueError, match="cycle"):
+        CombinedCraftingGraph.from_recipes("fuel_cell", 1, cyclic_speeds,
+                                           recipes, ["ore", "iron_plate"])
+
+def test_combined_graph_from_steady_state(tmp_path):
+    from test_compiled import make_cyclic_recipes, cyclic_speeds
+    recipes = make_cyclic_recipes(tmp_path)
+    graph = CombinedCraftingGraph.from_steady_state("fuel_cell", 1, cyclic_speeds,
+                                                    recipes, ["ore", "iron_plate"])
+    assert graph.nodes["enriched_fuel"]["num_machines"] == pytest.approx(60)
+    assert ("enriched_fuel", "enriched_fuel") in graph.edges
+    assert graph.produced_by["ore"] is None
+    with pytest.raises(ValueError, match="loop_a"):
+        CombinedCraftingGraph.from_steady_state("looped_product", 1, cyclic_speeds,
+                                                recipes, ["iron_plate"])
+
+def test_get_item_dependencies():
+    recipes = RecipeList("factorio_recipes.csv")
+    assert recipes.get_item_dependencies("electronic_circuit", raw_materials) == {
+        "iron_plate": {},
+        "copper_cable": {"copper_plate": {}},
+    }
+
+def test_max_output_rate():
+    recipes = RecipeList("factorio_recipes.csv")
+    # One electronic_circuit needs 1 iron_plate and 1.5 copper_plate
+    supply = {"iron_plate": 45, "copper_plate": 30}
+    assert recipes.max_output_rate("electronic_circuit", supply,
+                                   raw_materials) == pytest.approx((20, "copper_plate"))
+    supply = {"iron_plate": 15, "copper_plate": 30}
+    assert recipes.max_output_rate("electronic_circuit", supply,
+                                   raw_materials) == pytest.approx((15, "iron_plate"))
+    assert recipes.max_output_rate("electronic_circuit", {"iron_plate": 45},
+                                   raw_materials) == (0, "copper_plate")
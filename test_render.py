@@ -0,0 +1,50 @@
+import numpy as np
+from PIL import Image
+from recipe import RecipeList, CombinedCraftingGraph
+from test_recipe import raw_materials
+import render
+
+
+def fake_get_icon_array(item):
+    return np.asarray(Image.new("RGBA", (64, 64), (255, 0, 0, 255)))
+
+def make_graph():
+    recipes = RecipeList("factorio_recipes.csv")
+    G = CombinedCraftingGraph.from_recipes("electronic_circuit", 1,
+                                           {"assembling_machine": 1}, recipes,
+                                           raw_materials).to_graph()
+    pos = {n: (100.0 * k, 50.0 * k) for k, n in enumerate(G.nodes)}
+    return G, pos
+
+def test_paste_icon_clips_at_edges():
+    canvas = np.zeros((10, 10, 4))
+    icon = np.full((4, 4, 4), 255, dtype=np.uint8)
+    render.paste_icon(canvas, icon, 0, 0)
+    assert (canvas[:2, :2] == 255).all()
+    assert (canvas[2:, :] == 0).all()
+    render.paste_icon(canvas, icon, 100, 100)
+    assert canvas.sum() == 4 * 4 * 255
+
+def test_draw_uses_one_axes(monkeypatch):
+    from matplotlib.figure import Figure
+    monkeypatch.setattr(render, "prefetch_icons", lambda items: {})
+    monkeypatch.setattr(render, "get_icon_array", fake_get_icon_array)
+    G, pos = make_graph()
+    fig = Figure()
+    ax = fig.subplots()
+    render.draw_crafting_graph(G, pos, "test", fig, ax)
+    assert len(fig.axes) == 1
+    assert len(ax.images) == 1
+    # One rate label per node, and a machines label per assembled node
+    assert len(ax.texts) == len(G.nodes) + sum(
+        1 for n in G.nodes if G.nodes[n]["num_machines"] != 0)
+    # The icons are pasted in red
+    assert ax.images[0].get_array()[..., 0].max() == 255
+
+def test_save_crafting_graph(monkeypatch, tmp_path):
+    monkeypatch.setattr(render, "prefetch_icons", lambda items: {})
+    monkeypatch.setattr(render, "get_icon_array", fake_get_icon_array)
+    G, pos = make_graph()
+    for name in ["graph.png", "graph.svg"]:
+        render.save_crafting_graph(G, pos, "test", tmp_path / name)
+        assert (tmp_path / name).stat().st_size > 0
@@ -0,0 +1,31 @@
+from recipe import RecipeList
+from sweep import run_sweep, write_columns_csv
+from test_recipe import raw_materials
+import io
+import pytest
+
+
+def test_sweep_columns():
+    recipes = RecipeList("factorio_recipes.csv")
+    columns = run_sweep(["military_science_pack", "iron_ore"], [150, 300], [3],
+                        {"raw": raw_materials}, recipes, processes=1)
+    assert columns["item"] == ["military_science_pack"] * 2 + ["iron_ore"] * 2
+    assert columns["rate"] == [150, 300, 150, 300]
+    assert columns["error"][:2] == [None, None]
+    assert "iron_ore" in columns["error"][2]
+    # 10 + 8 + 1 + 3 + 1 machines at 150 per minute (see test_recipe.py)
+    assert columns["machines_assembling_machine"][:2] == pytest.approx([23, 46])
+    assert columns["raw_iron_plate"][:2] == pytest.approx([11.25, 22.5])
+    assert columns["raw_iron_plate"][2:] == [0, 0]
+
+def test_sweep_process_pool_matches_serial():
+    recipes = RecipeList("factorio_recipes.csv")
+    args = (["utility_science_pack", "electronic_circuit"], [30, 60], [1, 2],
+            {"raw": raw_materials})
+    assert run_sweep(*args, recipes, processes=2) == run_sweep(
+        *args, recipes, processes=1)
+
+def test_write_columns_csv():
+    csv_file = io.StringIO()
+    write_columns_csv({"item": ["a", "b"], "rate": [1, 2]}, csv_file)
+    assert csv_file.getvalue().splitlines() == ["item,rate", "a,1", "b,2"]